@@ -0,0 +1,183 @@
+"""
+生成渲染基准测试使用的合成场景，在 Blender 中运行:
+
+    blender --background --python benchmark/generate_fixtures.py -- \
+        --out benchmark/fixtures --name medium --objects 200 --cameras 4 --replacements 8 --texture 1024
+
+输出:
+    <name>.blend            场景，包含 objects 个网格对象和 cameras 个相机
+    <name>_textures/        程序生成的贴图，尺寸为 texture x texture
+    <name>_replacement.fbx  替换用的模型
+    <name>.json             场景描述和替换列表，由 run_benchmark.py 读取
+"""
+import os
+import sys
+import json
+import math
+import random
+import argparse
+
+import bpy
+import numpy as np
+
+
+def reset_scene():
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    scene = bpy.context.scene
+    scene.render.engine = 'CYCLES'
+    return scene
+
+
+def create_texture(path, size, seed):
+    """生成带噪声的棋盘格贴图，避免贴图被过度压缩后失去采样和内存上的代表性"""
+    rng = np.random.default_rng(seed)
+    coords = np.arange(size) // max(1, size // 16)
+    checker = ((coords[:, None] + coords[None, :]) % 2).astype(np.float32)
+    pixels = np.empty((size, size, 4), dtype=np.float32)
+    for channel in range(3):
+        pixels[:, :, channel] = 0.3 + 0.5 * checker * rng.random() + 0.2 * rng.random((size, size))
+    pixels[:, :, 3] = 1.0
+
+    image = bpy.data.images.new(os.path.basename(path), size, size)
+    image.pixels.foreach_set(pixels.ravel())
+    image.filepath_raw = path
+    image.file_format = 'PNG'
+    image.save()
+    return image
+
+
+def create_material(name, image):
+    material = bpy.data.materials.new(name)
+    material.use_nodes = True
+    nodes = material.node_tree.nodes
+    texture_node = nodes.new('ShaderNodeTexImage')
+    texture_node.image = image
+    material.node_tree.links.new(texture_node.outputs['Color'], nodes['Principled BSDF'].inputs['Base Color'])
+    return material
+
+
+def create_objects(count, materials, rng):
+    """在网格上均匀摆放对象，几何复杂度在几种基本体之间交替"""
+    grid = max(1, math.ceil(math.sqrt(count)))
+    spacing = 3.0
+    objects = []
+    for index in range(count):
+        x = (index % grid - grid / 2) * spacing
+        y = (index // grid - grid / 2) * spacing
+        kind = index % 3
+        if kind == 0:
+            bpy.ops.mesh.primitive_cube_add(size=1.5, location=(x, y, 0.75))
+        elif kind == 1:
+            bpy.ops.mesh.primitive_uv_sphere_add(radius=0.8, segments=32, ring_count=16, location=(x, y, 0.8))
+        else:
+            bpy.ops.mesh.primitive_cylinder_add(radius=0.6, depth=1.6, vertices=32, location=(x, y, 0.8))
+        obj = bpy.context.active_object
+        obj.name = f"target_{index}"
+        obj.rotation_euler[2] = rng.uniform(0, math.pi)
+        obj.data.materials.append(materials[index % len(materials)])
+        objects.append(obj)
+
+    bpy.ops.mesh.primitive_plane_add(size=grid * spacing * 2, location=(0, 0, 0))
+    bpy.context.active_object.name = "ground"
+    return objects, grid * spacing
+
+
+def create_cameras(count, extent):
+    """相机围绕场景中心均匀分布，全部对准中心"""
+    target = bpy.data.objects.new("camera_target", None)
+    bpy.context.scene.collection.objects.link(target)
+    radius = extent * 0.9
+    for index in range(count):
+        angle = 2 * math.pi * index / count
+        camera_data = bpy.data.cameras.new(f"Camera_{index}")
+        camera = bpy.data.objects.new(f"Camera_{index}", camera_data)
+        camera.location = (radius * math.cos(angle), radius * math.sin(angle), extent * 0.5)
+        constraint = camera.constraints.new('TRACK_TO')
+        constraint.target = target
+        constraint.track_axis = 'TRACK_NEGATIVE_Z'
+        constraint.up_axis = 'UP_Y'
+        bpy.context.scene.collection.objects.link(camera)
+    bpy.context.scene.camera = bpy.data.objects["Camera_0"]
+
+
+def create_lighting():
+    sun_data = bpy.data.lights.new("Sun", 'SUN')
+    sun_data.energy = 3.0
+    sun = bpy.data.objects.new("Sun", sun_data)
+    sun.rotation_euler = (math.radians(45), 0, math.radians(30))
+    bpy.context.scene.collection.objects.link(sun)
+
+    world = bpy.data.worlds.new("World")
+    world.use_nodes = True
+    world.node_tree.nodes['Background'].inputs['Strength'].default_value = 0.5
+    bpy.context.scene.world = world
+
+
+def export_replacement(path, image):
+    """导出替换用的模型，细分后的球体带一个材质，导出后从场景中删除"""
+    bpy.ops.mesh.primitive_ico_sphere_add(subdivisions=4, radius=0.9)
+    obj = bpy.context.active_object
+    obj.name = "replacement"
+    obj.data.materials.append(create_material("replacement_material", image))
+    bpy.ops.object.select_all(action='DESELECT')
+    obj.select_set(True)
+    bpy.ops.export_scene.fbx(filepath=path, use_selection=True, path_mode='COPY', embed_textures=True)
+    bpy.data.objects.remove(obj)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="生成渲染基准测试场景")
+    parser.add_argument("--out", required=True, help="输出目录")
+    parser.add_argument("--name", required=True, help="场景名称")
+    parser.add_argument("--objects", type=int, default=50)
+    parser.add_argument("--cameras", type=int, default=2)
+    parser.add_argument("--replacements", type=int, default=4)
+    parser.add_argument("--texture", type=int, default=512, help="贴图边长（像素）")
+    parser.add_argument("--materials", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=1)
+    options = parser.parse_args(argv)
+
+    if options.replacements > options.objects:
+        parser.error("替换数不能超过对象数")
+
+    out_dir = os.path.abspath(options.out)
+    texture_dir = os.path.join(out_dir, f"{options.name}_textures")
+    os.makedirs(texture_dir, exist_ok=True)
+    rng = random.Random(options.seed)
+
+    reset_scene()
+    images = [
+        create_texture(os.path.join(texture_dir, f"texture_{index}.png"), options.texture, options.seed + index)
+        for index in range(options.materials)
+    ]
+    materials = [create_material(f"material_{index}", image) for index, image in enumerate(images)]
+    objects, extent = create_objects(options.objects, materials, rng)
+    create_cameras(options.cameras, extent)
+    create_lighting()
+
+    fbx_path = os.path.join(out_dir, f"{options.name}_replacement.fbx")
+    export_replacement(fbx_path, images[0])
+
+    blend_path = os.path.join(out_dir, f"{options.name}.blend")
+    bpy.ops.wm.save_as_mainfile(filepath=blend_path)
+
+    targets = rng.sample([obj.name for obj in objects], options.replacements)
+    spec = {
+        "name": options.name,
+        "blendFilePath": blend_path,
+        "objects": options.objects,
+        "cameras": options.cameras,
+        "replacements": options.replacements,
+        "texture": options.texture,
+        "replacementItems": [
+            {"target": target, "fbx": fbx_path, "collection_name": f"replacement_{index}"}
+            for index, target in enumerate(targets)
+        ],
+    }
+    with open(os.path.join(out_dir, f"{options.name}.json"), "w", encoding="utf-8") as f:
+        json.dump(spec, f, ensure_ascii=False, indent=2)
+    print(f"已生成基准场景: {blend_path}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else [])
@@ -0,0 +1,289 @@
+"""
+渲染基准测试: 用 CPU 模式运行 src/templates/blender_render.py，记录各阶段耗时和峰值内存
+
+    python3 benchmark/run_benchmark.py                       # 运行全部场景并与基线对比
+    python3 benchmark/run_benchmark.py --only small,medium --repeat 5
+    python3 benchmark/run_benchmark.py --update-baseline     # 把本次结果保存为基线
+
+场景定义在 benchmark/scenarios.json，缺少或参数变化的场景会先调用 generate_fixtures.py 生成。
+结果写到 benchmark/results/<时间>.json，超过阈值的回退以非零退出码结束。
+只依赖 Python 标准库，不需要 GPU。
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARK_DIR = os.path.join(ROOT_DIR, "benchmark")
+RENDER_SCRIPT_PATH = os.path.join(ROOT_DIR, "src", "templates", "blender_render.py")
+GENERATOR_PATH = os.path.join(BENCHMARK_DIR, "generate_fixtures.py")
+# 与 src/utils/helper.ts 中的 RENDER_EVENT_MARKER 一致
+EVENT_MARKER = "@@RENDER_EVENT@@"
+FIXTURE_KEYS = ("objects", "cameras", "replacements", "texture")
+# 低于该差值的变化视为噪声，不算回退
+NOISE_FLOOR_MS = 50
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="渲染基准测试")
+    parser.add_argument("--scenarios", default=os.path.join(BENCHMARK_DIR, "scenarios.json"))
+    parser.add_argument("--only", help="只运行指定场景，逗号分隔")
+    parser.add_argument("--blender", default=os.environ.get("BLENDER_PATH", "blender"))
+    parser.add_argument("--fixtures", default=os.path.join(BENCHMARK_DIR, "fixtures"))
+    parser.add_argument("--results", default=os.path.join(BENCHMARK_DIR, "results"))
+    parser.add_argument("--baseline", default=os.path.join(BENCHMARK_DIR, "baseline.json"))
+    parser.add_argument("--repeat", type=int, default=3, help="每个场景运行次数，取中位数")
+    parser.add_argument("--threads", type=int, default=0, help="Cycles 线程数，0 为自动")
+    parser.add_argument("--threshold", type=float, default=10.0, help="回退阈值（百分比）")
+    parser.add_argument("--warm-asset-cache", action="store_true", help="多次运行共用 FBX 资源缓存")
+    parser.add_argument("--snapshot-cache", action="store_true", help="启用场景快照，多次运行共用快照")
+    parser.add_argument("--regenerate", action="store_true", help="重新生成所有场景")
+    parser.add_argument("--update-baseline", action="store_true")
+    return parser.parse_args()
+
+
+def ensure_fixture(options, scenario):
+    """场景不存在或参数变化时重新生成，返回场景描述"""
+    spec_path = os.path.join(options.fixtures, f"{scenario['name']}.json")
+    if not options.regenerate and os.path.exists(spec_path):
+        with open(spec_path, encoding="utf-8") as f:
+            spec = json.load(f)
+        if all(spec.get(key) == scenario[key] for key in FIXTURE_KEYS):
+            return spec
+
+    print(f"生成场景: {scenario['name']}")
+    args = [
+        options.blender, "--background", "--factory-startup", "--python", GENERATOR_PATH, "--",
+        "--out", options.fixtures, "--name", scenario["name"],
+    ]
+    for key in FIXTURE_KEYS:
+        args += [f"--{key}", str(scenario[key])]
+    subprocess.run(args, check=True, stdout=subprocess.DEVNULL)
+    with open(spec_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def build_manifest(options, scenario, spec, run_index, work_dir, asset_cache_dir, snapshot_cache_dir):
+    """组装与服务端相同结构的任务清单，关闭回调和预览"""
+    return {
+        "blendFilePath": spec["blendFilePath"],
+        "taskId": f"bench_{scenario['name']}_{run_index}",
+        "outputDir": os.path.join(work_dir, "output"),
+        "replacementItems": spec["replacementItems"],
+        "quality": scenario.get("quality", "1k"),
+        "clientId": "",
+        "clientJwt": "",
+        "fileDataId": "",
+        "assetCacheDir": asset_cache_dir,
+        "assetCacheMaxBytes": 5 * 1024 * 1024 * 1024,
+        "snapshotCacheDir": snapshot_cache_dir,
+        "snapshotCacheMaxBytes": 5 * 1024 * 1024 * 1024,
+        # 合并回调并交给父任务发送，基准测试中不会发出任何回调
+        "coalesceCallback": True,
+        "deferCallback": True,
+        "device": "CPU",
+        "threads": options.threads,
+        "timeBudget": 0,
+        "preview": False,
+        "incremental": False,
+        "lossless": False,
+        "simplify": scenario.get("simplify", False),
+    }
+
+
+def run_once(options, manifest):
+    """运行一次渲染，返回事件列表和总耗时"""
+    started_at = time.time()
+    process = subprocess.run(
+        [options.blender, "--background", "--python", RENDER_SCRIPT_PATH, "--", "--stdin"],
+        input=json.dumps(manifest),
+        capture_output=True,
+        text=True,
+    )
+    wall_ms = round((time.time() - started_at) * 1000)
+    if process.returncode != 0:
+        raise RuntimeError(f"渲染失败，退出码 {process.returncode}:\n{process.stdout[-2000:]}\n{process.stderr[-2000:]}")
+
+    events = []
+    for line in process.stdout.splitlines():
+        if line.startswith(EVENT_MARKER):
+            events.append(json.loads(line[len(EVENT_MARKER):]))
+    return events, wall_ms
+
+
+def summarize_run(events, wall_ms):
+    """按阶段累计耗时，同一阶段出现多次（每个相机、每个FBX）时求和"""
+    phases = {}
+    peak_rss = 0
+    done_ms = None
+    for event in events:
+        if event.get("durationMs") is not None:
+            phases[event["phase"]] = phases.get(event["phase"], 0) + event["durationMs"]
+        peak_rss = max(peak_rss, event.get("peakRssMb") or 0, event.get("rssMb") or 0)
+        if event["phase"] == "done":
+            done_ms = event.get("durationMs")
+    metrics = {"wallMs": wall_ms, "peakRssMb": peak_rss, "phases": phases}
+    if done_ms is not None:
+        # Blender 启动、Python 初始化和退出的耗时
+        metrics["startupMs"] = wall_ms - done_ms
+    return metrics
+
+
+def median_metrics(runs):
+    def median(values):
+        return round(statistics.median(values), 1)
+
+    phase_names = sorted({name for run in runs for name in run["phases"]})
+    metrics = {
+        "wallMs": median([run["wallMs"] for run in runs]),
+        "peakRssMb": median([run["peakRssMb"] for run in runs]),
+        "phases": {name: median([run["phases"].get(name, 0) for run in runs]) for name in phase_names},
+    }
+    if all("startupMs" in run for run in runs):
+        metrics["startupMs"] = median([run["startupMs"] for run in runs])
+    return metrics
+
+
+def run_scenario(options, scenario):
+    spec = ensure_fixture(options, scenario)
+    runs = []
+    shared_cache_dir = tempfile.mkdtemp(prefix="bench_asset_cache_")
+    # 第一次运行保存快照，之后的运行加载快照
+    snapshot_cache_dir = os.path.join(shared_cache_dir, "snapshots") if options.snapshot_cache else ""
+    try:
+        for run_index in range(options.repeat):
+            work_dir = tempfile.mkdtemp(prefix=f"bench_{scenario['name']}_")
+            try:
+                # 默认每次使用空的资源缓存，测量 FBX 冷导入
+                asset_cache_dir = shared_cache_dir if options.warm_asset_cache else os.path.join(work_dir, "asset_cache")
+                manifest = build_manifest(options, scenario, spec, run_index, work_dir, asset_cache_dir, snapshot_cache_dir)
+                events, wall_ms = run_once(options, manifest)
+                run = summarize_run(events, wall_ms)
+                runs.append(run)
+                print(f"  [{scenario['name']} #{run_index + 1}] {wall_ms} ms, 峰值内存 {run['peakRssMb']} MB")
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+    finally:
+        shutil.rmtree(shared_cache_dir, ignore_errors=True)
+    return {"params": scenario, "metrics": median_metrics(runs), "runs": runs}
+
+
+def get_environment(options):
+    try:
+        blender_version = subprocess.run(
+            [options.blender, "--version"], capture_output=True, text=True
+        ).stdout.splitlines()[0]
+    except (OSError, IndexError):
+        blender_version = None
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=ROOT_DIR
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "host": platform.node(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpuCount": os.cpu_count(),
+        "blender": blender_version,
+        "commit": commit,
+        "threads": options.threads,
+        "repeat": options.repeat,
+        "warmAssetCache": options.warm_asset_cache,
+        "snapshotCache": options.snapshot_cache,
+    }
+
+
+def flatten_metrics(metrics):
+    values = {key: metrics[key] for key in ("wallMs", "startupMs", "peakRssMb") if key in metrics}
+    for name, value in metrics["phases"].items():
+        values[f"phase.{name}"] = value
+    return values
+
+
+def compare(results, baseline, threshold):
+    """与基线对比，打印差异并返回回退列表"""
+    regressions = []
+    for name, scenario in results["scenarios"].items():
+        base_scenario = baseline.get("scenarios", {}).get(name)
+        if not base_scenario:
+            print(f"\n{name}: 基线中没有该场景")
+            continue
+        if base_scenario["params"] != scenario["params"]:
+            print(f"\n{name}: 场景参数与基线不同，跳过对比")
+            continue
+
+        print(f"\n{name}")
+        print(f"  {'指标':<28}{'基线':>12}{'本次':>12}{'变化':>10}")
+        current = flatten_metrics(scenario["metrics"])
+        previous = flatten_metrics(base_scenario["metrics"])
+        for key in sorted(set(current) | set(previous)):
+            if key not in current or key not in previous:
+                print(f"  {key:<28}{previous.get(key, '-'):>12}{current.get(key, '-'):>12}")
+                continue
+            before, after = previous[key], current[key]
+            change = (after - before) / before * 100 if before else 0.0
+            regressed = change > threshold and (key == "peakRssMb" or after - before > NOISE_FLOOR_MS)
+            mark = "  <-- 回退" if regressed else ""
+            print(f"  {key:<28}{before:>12}{after:>12}{change:>+9.1f}%{mark}")
+            if regressed:
+                regressions.append(f"{name} {key}: {before} -> {after} ({change:+.1f}%)")
+
+    if baseline.get("environment", {}).get("host") != results["environment"]["host"]:
+        print("\n注意: 基线来自另一台机器，耗时对比仅供参考")
+    return regressions
+
+
+def main():
+    options = parse_args()
+    with open(options.scenarios, encoding="utf-8") as f:
+        scenarios = json.load(f)["scenarios"]
+    if options.only:
+        names = set(options.only.split(","))
+        scenarios = [scenario for scenario in scenarios if scenario["name"] in names]
+    os.makedirs(options.fixtures, exist_ok=True)
+    os.makedirs(options.results, exist_ok=True)
+
+    results = {
+        "createdAt": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": get_environment(options),
+        "scenarios": {},
+    }
+    for scenario in scenarios:
+        print(f"运行场景: {scenario['name']}")
+        results["scenarios"][scenario["name"]] = run_scenario(options, scenario)
+
+    result_path = os.path.join(options.results, f"{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(result_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存到: {result_path}")
+
+    if options.update_baseline:
+        shutil.copyfile(result_path, options.baseline)
+        print(f"基线已更新: {options.baseline}")
+        return 0
+
+    if not os.path.exists(options.baseline):
+        print("没有基线，使用 --update-baseline 保存本次结果作为基线")
+        return 0
+    with open(options.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, options.threshold)
+    if regressions:
+        print(f"\n超过 {options.threshold}% 的回退:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,5 @@
 import { MidwayConfig } from '@midwayjs/core';
-import { tmpdir } from 'os';
+import { tmpdir, cpus } from 'os';
 import { join } from 'path';
 import 'dotenv/config';
 
@@ -47,6 +47,43 @@ export default {
       },
       // 可以添加更多任务类型
     },
+    // 调度：按预计耗时和资源占用从队列中选择任务，新任务和任务结束时立即调度
+    dispatch: {
+      // 每个节点同时执行任务的资源预算，1 个单位为一个 1k 画面，4k 画面占 4 个单位
+      resourceBudget: Number(process.env.TASK_RESOURCE_BUDGET || 8),
+      // 每次调度考察的队列头部任务数
+      scanSize: 50,
+      // 每等待 1 毫秒，预计耗时折算减少的毫秒数，大任务等待越久越靠前
+      agingFactor: 2,
+      // 等待超过该时间的任务资源不足时，不再让后面的小任务插队
+      starvationMs: 30 * 60 * 1000,
+      // 兜底轮询间隔，处理其它节点创建或恢复的任务
+      pollInterval: 5000,
+      // 每个节点运行中 Blender 进程的内存预算(MB)，0 为物理内存的 80%
+      memoryBudgetMb: Number(process.env.TASK_MEMORY_BUDGET_MB || 0),
+    },
+    // 租约：领取任务的节点定期续约，节点停止后任务在租约过期时放回队列由其它节点执行
+    lease: {
+      ttl: 60 * 1000,
+      renewInterval: 10 * 1000,
+      checkInterval: 15 * 1000,
+    },
+    // 成本模型：预计耗时 = baseMs + 替换数 x replacementMs + 百万采样数 x 每百万采样耗时
+    cost: {
+      baseMs: 15000,
+      replacementMs: 5000,
+      defaultMsPerMegaSample: 500,
+      historySize: 500,
+      minHistorySamples: 3,
+      historyRefreshInterval: 10 * 60 * 1000,
+      // 没有峰值内存记录时: baseMemoryMb + 替换数 x replacementMemoryMb + 多边形、贴图和渲染缓冲区
+      baseMemoryMb: 1024,
+      replacementMemoryMb: 200,
+      bytesPerPolygon: 300,
+      bytesPerTexturePixel: 4,
+      bytesPerFramePixel: 160,
+      memoryMargin: 1.2,
+    },
   },
   alias: {
     '@': join(__dirname, '../'),
@@ -55,12 +92,116 @@ export default {
     outputDir:
       process.env.RENDER_OUTPUT_DIR || join(process.cwd(), 'render_output'),
     blenderRunPath: process.env.BLENDER_PATH || 'blender',
+    // 渲染设备，CPU 模式下按并发任务数把核心划分成互不重叠的组，每个任务绑定一组核心
+    device: process.env.RENDER_DEVICE === 'CPU' ? 'CPU' : 'GPU',
+    cpuCores: Number(process.env.RENDER_CPU_CORES) || cpus().length,
+    // 采样 Blender 进程常驻内存的间隔(毫秒)，用于调度的内存预算和记录各模型的峰值内存
+    memorySampleInterval: 1000,
+    // 多相机任务拆分为每个相机一个子任务，分散到多个执行槽和节点并行渲染
+    fanOutCameras: process.env.RENDER_FAN_OUT_CAMERAS === 'true',
+    // 各质量档位的采样参数，默认所有档位使用相同的基准采样（32 采样、自适应阈值 0.2、最少 16 采样）
+    // 需要更高画质的档位通过 RENDER_SAMPLING_PROFILES 覆盖，例如：
+    // {"4k":{"samples":128,"adaptiveThreshold":0.05,"adaptiveMinSamples":32}}
+    samplingProfiles: JSON.parse(process.env.RENDER_SAMPLING_PROFILES || '{}'),
+    // 1k/2k 任务和预览图简化场景：限制贴图尺寸、细分级别和子粒子数，替换模型减面后缓存，4k 不受影响
+    // 会改变渲染结果，默认关闭，设置 RENDER_SIMPLIFY=true 开启
+    simplify: process.env.RENDER_SIMPLIFY === 'true',
+    // 单帧分块渲染，每个相机的画面拆成 rows x cols 个分块子任务，完成后拼接
+    // 默认不分块，由请求的 renderParams.splitFrame 开启，
+    // 或者通过 RENDER_SPLIT_FRAME_QUALITIES 为指定质量（如 4k）默认开启
+    splitFrame: {
+      qualities: (process.env.RENDER_SPLIT_FRAME_QUALITIES || '')
+        .split(',')
+        .filter(Boolean),
+      rows: Number(process.env.RENDER_SPLIT_FRAME_ROWS) || 2,
+      cols: Number(process.env.RENDER_SPLIT_FRAME_COLS) || 2,
+      // 相邻分块重叠的画面比例，拼接时在重叠区线性过渡以消除接缝
+      overlap: 0.03,
+    },
+    // 渲染结果缓存，相同模型、替换列表和渲染设置的请求直接复用已渲染的图片
+    // 默认关闭，设置 RENDER_RESULT_CACHE=true 开启
+    resultCache: {
+      enabled: process.env.RENDER_RESULT_CACHE === 'true',
+      dir:
+        process.env.RENDER_RESULT_CACHE_DIR ||
+        join(process.cwd(), 'render_cache'),
+      maxBytes:
+        Number(process.env.RENDER_RESULT_CACHE_MAX_BYTES) ||
+        10 * 1024 * 1024 * 1024,
+    },
+    // 渲染后的编码阶段，Blender 输出无损 PNG，由 Python 进程池生成各尺寸的图片
+    // full 必须输出 <taskId>.jpg，结果缓存和增量渲染读取该文件
+    encode: {
+      enabled: process.env.RENDER_ENCODE === 'true',
+      pythonPath: process.env.ENCODE_PYTHON_PATH || 'python3',
+      poolSize: Number(process.env.ENCODE_POOL_SIZE) || 2,
+      renditions: [
+        { name: 'full', suffix: '', format: 'JPEG', quality: 92, maxWidth: 0 },
+        {
+          name: 'web',
+          suffix: '_web',
+          format: 'WEBP',
+          quality: 80,
+          maxWidth: 1920,
+        },
+        {
+          name: 'thumb',
+          suffix: '_thumb',
+          format: 'JPEG',
+          quality: 80,
+          maxWidth: 480,
+        },
+      ],
+    },
+    // 延后降噪：渲染进程不降噪，输出含噪结果和反照率、法线通道的多层 EXR，采样结束后立即让出执行槽
+    // 由 Blender 降噪进程池生成最终图片，适合 CPU 节点（OpenImageDenoise 每张需要 30-40 秒）
+    // 分块和增量渲染仍在渲染进程内降噪
+    denoise: {
+      deferred: process.env.RENDER_DEFER_DENOISE === 'true',
+      poolSize: Number(process.env.DENOISE_POOL_SIZE) || 2,
+    },
+    // 常驻 Blender worker 池，避免每个任务重复启动 Blender 和加载 Cycles 内核
+    workerPool: {
+      enabled: process.env.BLENDER_WORKER_POOL === 'true',
+      size: Number(process.env.BLENDER_WORKER_POOL_SIZE) || 4,
+      // 每个 worker 执行多少个任务后回收，防止内存泄漏累积
+      maxJobsPerWorker: 50,
+      healthCheckInterval: 30 * 1000,
+      healthCheckTimeout: 10 * 1000,
+      // worker 就绪前退出时按指数退避重启，连续失败 maxStartFailures 次后
+      // 放弃该位置，所有位置都失败时改为每个任务单独启动 Blender
+      respawnBackoff: 1000,
+      respawnBackoffMax: 60 * 1000,
+      maxStartFailures: 5,
+    },
   },
   logger: {
     // 优先使用环境变量，否则使用默认值
     logDir: process.env.LOGGER_DIR || join(process.cwd(), 'run_log'),
+    // 任务日志先写入内存缓冲区，按时间或行数批量写入 Redis Stream
+    buffer: {
+      flushInterval: 250, // 定时写入间隔(毫秒)
+      batchLines: 200, // 单个任务缓冲达到该行数时立即写入
+      maxPendingLines: 5000, // 单个任务缓冲的最大行数，超出时丢弃非关键行
+      maxLen: 1000, // 每个任务的日志 Stream 保留的条数(近似)
+    },
   },
   model: {
     modelDir: process.env.MODEL_DIR || join(process.cwd(), 'model'),
+    // FBX导入结果的 .blend 缓存，按路径和修改时间区分版本，按LRU淘汰
+    assetCacheDir:
+      process.env.ASSET_CACHE_DIR || join(process.cwd(), 'asset_cache'),
+    assetCacheMaxBytes:
+      Number(process.env.ASSET_CACHE_MAX_BYTES) || 5 * 1024 * 1024 * 1024,
+    // 完成替换后的场景快照，相同模型和替换列表的任务（不同质量档位、重试）直接加载快照，跳过替换，按LRU淘汰
+    snapshotCache: {
+      enabled: process.env.SCENE_SNAPSHOT_CACHE === 'true',
+      dir:
+        process.env.SCENE_SNAPSHOT_CACHE_DIR ||
+        join(process.cwd(), 'scene_snapshots'),
+      maxBytes:
+        Number(process.env.SCENE_SNAPSHOT_CACHE_MAX_BYTES) ||
+        20 * 1024 * 1024 * 1024,
+    },
   },
 } as MidwayConfig;
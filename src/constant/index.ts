@@ -1,3 +1,5 @@
+import { RenderCostEstimate, RenderTile } from '@/types';
+
 export const MAX_RECEIVE_FILE_LEN = 20;
 
 export const minuteExpire = 5;
@@ -30,6 +32,12 @@ export interface IRenderTaskTypeFromTask {
   payload: string;
   clientId: string;
   clientJwt: string;
+  // 多相机任务拆分出的子任务，只渲染父任务的一个相机
+  parentTaskId?: string;
+  cameraIndex?: number;
+  // 单帧分块子任务只渲染该相机画面的一个区域
+  tile?: RenderTile;
+  costEstimate?: RenderCostEstimate;
 }
 
 export interface IRenderTaskType {
@@ -37,6 +45,8 @@ export interface IRenderTaskType {
   payload: IRenderDataType;
   clientId: string;
   clientJwt: string;
+  // 按场景索引估算的渲染成本
+  costEstimate?: RenderCostEstimate;
 }
 
 export interface IRenderDataType {
@@ -56,4 +66,14 @@ export interface MaterialProperties {}
 
 export interface RenderParams {
   quality: string;
+  // 所有相机渲染完成后合并发送一次回调
+  coalesceCallback?: boolean;
+  // 渲染时间预算（秒），按相机平均分配，超出时降低采样数
+  timeBudget?: number;
+  // 先渲染低分辨率预览图并回调，再渲染正式结果
+  preview?: boolean;
+  // 只重新渲染替换有变化的画面区域，合成到同一场景之前缓存的结果上
+  incremental?: boolean;
+  // 把单帧拆成多个分块在不同执行槽和节点上渲染，再拼接为完整画面
+  splitFrame?: boolean;
 }
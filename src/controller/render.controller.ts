@@ -17,6 +17,8 @@ import { TaskStatus } from '../constant/taskStatus';
 import { IRenderTaskType } from '@/constant';
 import { CallbackParams } from '@/types';
 import { ClientCallbackService } from '@/service/clientCallback.service';
+import { ILogger } from '@midwayjs/logger';
+import { Context } from '@midwayjs/koa';
 
 @Provide()
 @Controller('/api/render')
@@ -36,6 +38,12 @@ export class RenderController {
   @Inject()
   clientCallbackService: ClientCallbackService;
 
+  @Inject()
+  logger: ILogger;
+
+  @Inject()
+  ctx: Context;
+
   /**
    * 创建渲染任务
    */
@@ -67,6 +75,8 @@ export class RenderController {
           data: {
             taskId: task.id,
             createdAt: task.createdAt,
+            // 模型已建立场景索引时返回的渲染成本估算
+            costEstimate: task.data?.costEstimate,
           },
         };
       } else {
@@ -239,16 +249,31 @@ export class RenderController {
     }
   }
 
+  /**
+   * 上传渲染结果并回调前端，完成后返回实际结果
+   * 失败时返回 502，由渲染模板的 CallbackSender 重试
+   * CallbackSender 在后台线程发送，等待不会阻塞渲染
+   */
   @Post('/client-callback')
   async callbackTaskToClient(
-    @Body() body: { taskId: string; callbackParams: CallbackParams }
+    @Body()
+    body: { taskId: string; callbackParams: CallbackParams; preview?: boolean }
   ) {
     try {
-      return await this.clientCallbackService.callbackTaskToClient(
+      const delivered = await this.clientCallbackService.callbackTaskToClient(
         body.taskId,
-        body.callbackParams
+        body.callbackParams,
+        !!body.preview
       );
+      if (!delivered) {
+        throw new Error('client rejected callback');
+      }
+      return { success: true };
     } catch (error) {
+      this.logger.error(
+        `callback task to client failed: ${body.taskId}, ${error.message}`
+      );
+      this.ctx.status = 502;
       return {
         success: false,
         error: error.message || 'callback task to client failed',
@@ -256,6 +281,38 @@ export class RenderController {
     }
   }
 
+  /**
+   * 合并回调，一个任务的所有相机渲染完成后一次性通知
+   */
+  @Post('/client-callback-batch')
+  async callbackTasksToClient(
+    @Body()
+    body: {
+      taskIds: string[];
+      callbackParams: CallbackParams;
+      preview?: boolean;
+    }
+  ) {
+    try {
+      const delivered = await this.clientCallbackService.callbackTasksToClient(
+        body.taskIds || [],
+        body.callbackParams,
+        !!body.preview
+      );
+      if (!delivered) {
+        throw new Error('client rejected callback');
+      }
+      return { success: true };
+    } catch (error) {
+      this.logger.error(`batch callback to client failed: ${error.message}`);
+      this.ctx.status = 502;
+      return {
+        success: false,
+        error: error.message || 'batch callback to client failed',
+      };
+    }
+  }
+
   /**
    * 终止渲染任务
    */
@@ -22,3 +22,14 @@ export interface TaskResult {
   data?: any;
   error?: string;
 }
+
+/**
+ * 渲染模板输出的结构化事件
+ */
+export interface RenderEvent {
+  phase: string; // load_blend / replacement / replacements / decimate / purge / device_setup / preview / camera / callback / done / stitch / index / denoise / snapshot
+  durationMs?: number;
+  rssMb?: number;
+  peakRssMb?: number;
+  [key: string]: any;
+}
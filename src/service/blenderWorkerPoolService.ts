@@ -0,0 +1,437 @@
+import {
+  Provide,
+  Inject,
+  Config,
+  Scope,
+  ScopeEnum,
+  Destroy,
+} from '@midwayjs/core';
+import { ILogger } from '@midwayjs/logger';
+import { spawn, ChildProcess } from 'child_process';
+import { EventEmitter } from 'events';
+import * as path from 'path';
+import * as readline from 'readline';
+import {
+  getBlenderEnv,
+  partitionCores,
+  withCpuAffinity,
+} from '@/utils/helper';
+import { RenderParams } from '@/types';
+
+// 与 src/templates/blender_worker.py 约定的协议标记
+const READY_MARKER = '__RENDER_WORKER_READY__';
+const PONG_MARKER = '__RENDER_WORKER_PONG__';
+const JOB_DONE_MARKER = '__RENDER_JOB_DONE__';
+
+/**
+ * 渲染进程句柄，独立 Blender 进程和常驻 worker 中的任务都实现该接口
+ */
+export interface RenderProcessHandle extends EventEmitter {
+  stdout: EventEmitter;
+  stderr: EventEmitter;
+  // 执行任务的 Blender 进程，用于采样内存
+  readonly pid?: number;
+  kill(): boolean;
+}
+
+interface BlenderWorker {
+  id: number;
+  // worker 在池中的位置，CPU 渲染时决定绑定的核心组，重启后保持不变
+  slot: number;
+  cores?: number[];
+  process: ChildProcess;
+  ready: boolean;
+  retired: boolean;
+  jobsDone: number;
+  // 上一个任务加载的 .blend，同一模型的任务优先派发到该 worker 以复用已加载的场景
+  lastBlendPath?: string;
+  job?: WorkerJob;
+  pingSentAt?: number;
+}
+
+/**
+ * 在常驻 worker 中执行的渲染任务
+ * 对外暴露与 ChildProcess 相同的 stdout/stderr/close/error/kill 接口
+ */
+export class WorkerJob extends EventEmitter implements RenderProcessHandle {
+  readonly stdout = new EventEmitter();
+  readonly stderr = new EventEmitter();
+  worker?: BlenderWorker;
+
+  constructor(
+    readonly taskId: string,
+    readonly manifest: RenderParams,
+    private readonly pool: BlenderWorkerPoolService
+  ) {
+    super();
+  }
+
+  get pid(): number | undefined {
+    return this.worker?.process.pid;
+  }
+
+  kill(): boolean {
+    return this.pool.killJob(this);
+  }
+}
+
+@Provide()
+@Scope(ScopeEnum.Singleton)
+export class BlenderWorkerPoolService {
+  @Inject()
+  logger: ILogger;
+
+  @Config('render')
+  renderConfig: {
+    blenderRunPath: string;
+    device: 'GPU' | 'CPU';
+    cpuCores: number;
+    workerPool: {
+      enabled: boolean;
+      size: number;
+      maxJobsPerWorker: number;
+      healthCheckInterval: number;
+      healthCheckTimeout: number;
+      respawnBackoff: number;
+      respawnBackoffMax: number;
+      maxStartFailures: number;
+    };
+  };
+
+  private workers: BlenderWorker[] = [];
+  private pendingJobs: WorkerJob[] = [];
+  private nextWorkerId = 1;
+  private started = false;
+  private shuttingDown = false;
+  private healthCheckTimer: NodeJS.Timeout;
+  private coreSlots: number[][];
+  // 各位置连续在就绪前退出的次数，worker 就绪后清零
+  private startFailures: Map<number, number> = new Map();
+  // 连续启动失败次数达到上限、不再重启的位置
+  private failedSlots: Set<number> = new Set();
+  private respawnTimers: Set<NodeJS.Timeout> = new Set();
+
+  /**
+   * 所有位置都启动失败后不再使用 worker 池，由执行器为每个任务单独启动 Blender
+   */
+  get enabled(): boolean {
+    return (
+      !!this.renderConfig.workerPool?.enabled &&
+      this.failedSlots.size < this.renderConfig.workerPool.size
+    );
+  }
+
+  /**
+   * 将渲染任务清单提交到常驻 worker 执行
+   */
+  runJob(taskId: string, manifest: RenderParams): WorkerJob {
+    this.ensureStarted();
+    const job = new WorkerJob(taskId, manifest, this);
+    this.pendingJobs.push(job);
+    this.dispatch();
+    return job;
+  }
+
+  /**
+   * 终止任务，正在执行的任务会连同所在 worker 一起回收
+   */
+  killJob(job: WorkerJob): boolean {
+    if (job.worker) {
+      return job.worker.process.kill();
+    }
+    const index = this.pendingJobs.indexOf(job);
+    if (index === -1) {
+      return false;
+    }
+    this.pendingJobs.splice(index, 1);
+    job.emit('close', null);
+    return true;
+  }
+
+  private ensureStarted() {
+    if (this.started) {
+      return;
+    }
+    this.started = true;
+    const { size, healthCheckInterval } = this.renderConfig.workerPool;
+    for (let i = 0; i < size; i++) {
+      this.spawnWorker(i);
+    }
+    this.healthCheckTimer = setInterval(
+      () => this.healthCheck(),
+      healthCheckInterval
+    );
+  }
+
+  private spawnWorker(slot: number) {
+    const workerScript = path.join(
+      process.cwd(),
+      'src',
+      'templates',
+      'blender_worker.py'
+    );
+    // CPU 渲染时每个 worker 绑定一组独占核心，核心按池大小划分
+    let cores: number[] | undefined;
+    if (this.renderConfig.device === 'CPU') {
+      const coreSlots = this.getCoreSlots();
+      cores = coreSlots[slot % coreSlots.length];
+    }
+    const [command, args] = withCpuAffinity(
+      this.renderConfig.blenderRunPath || 'blender',
+      ['--background', '--python', workerScript],
+      cores
+    );
+    const child = spawn(command, args, { env: getBlenderEnv() });
+
+    const worker: BlenderWorker = {
+      id: this.nextWorkerId++,
+      slot,
+      cores,
+      process: child,
+      ready: false,
+      retired: false,
+      jobsDone: 0,
+    };
+    this.workers.push(worker);
+    this.logger.info(`启动Blender worker[${worker.id}], pid: ${child.pid}`);
+
+    readline
+      .createInterface({ input: child.stdout, crlfDelay: Infinity })
+      .on('line', line => this.handleLine(worker, line));
+
+    child.stderr.on('data', data => {
+      worker.job?.stderr.emit('data', data);
+    });
+
+    child.on('exit', code => this.handleExit(worker, code));
+
+    child.on('error', err => {
+      this.logger.error(`Blender worker[${worker.id}]启动失败: ${err.message}`);
+      worker.retired = true;
+      this.removeWorker(worker);
+      const job = worker.job;
+      worker.job = undefined;
+      job?.emit('error', err);
+      if (this.shuttingDown) {
+        return;
+      }
+      if (worker.ready) {
+        this.spawnWorker(worker.slot);
+        return;
+      }
+      // 无法启动进程（如 Blender 路径错误）时重试也不会成功，直接放弃该位置，
+      // 所有位置都失败后由执行器为每个任务单独启动 Blender
+      this.failSlot(
+        worker.slot,
+        (this.startFailures.get(worker.slot) || 0) + 1
+      );
+    });
+  }
+
+  private handleLine(worker: BlenderWorker, line: string) {
+    if (line === READY_MARKER) {
+      worker.ready = true;
+      this.startFailures.delete(worker.slot);
+      this.dispatch();
+      return;
+    }
+    if (line === PONG_MARKER) {
+      worker.pingSentAt = undefined;
+      return;
+    }
+    if (line.startsWith(JOB_DONE_MARKER)) {
+      let exitCode = 1;
+      try {
+        exitCode = JSON.parse(line.slice(JOB_DONE_MARKER.length)).exitCode;
+      } catch (error) {
+        this.logger.error(`解析worker[${worker.id}]任务结果失败: ${line}`);
+      }
+      this.finishJob(worker, exitCode);
+      return;
+    }
+    worker.job?.stdout.emit('data', `${line}\n`);
+  }
+
+  private finishJob(worker: BlenderWorker, exitCode: number) {
+    const job = worker.job;
+    worker.job = undefined;
+    worker.jobsDone++;
+    // 失败任务之后 worker 会重置场景，不再有可复用的模型
+    worker.lastBlendPath =
+      exitCode === 0 ? job?.manifest.blendFilePath : undefined;
+    if (job) {
+      job.worker = undefined;
+      job.emit('close', exitCode);
+    }
+
+    if (worker.jobsDone >= this.renderConfig.workerPool.maxJobsPerWorker) {
+      this.recycleWorker(worker, `已执行 ${worker.jobsDone} 个任务`);
+    }
+    this.dispatch();
+  }
+
+  private handleExit(worker: BlenderWorker, code: number | null) {
+    this.removeWorker(worker);
+    this.logger.info(`Blender worker[${worker.id}]已退出, 退出码: ${code}`);
+
+    const job = worker.job;
+    worker.job = undefined;
+    if (job) {
+      job.worker = undefined;
+      job.emit('close', code);
+    }
+
+    if (worker.retired || this.shuttingDown) {
+      return;
+    }
+    if (worker.ready) {
+      this.spawnWorker(worker.slot);
+      return;
+    }
+
+    // 就绪前退出通常是启动环境有问题，立即重启只会不断失败
+    const failures = (this.startFailures.get(worker.slot) || 0) + 1;
+    this.startFailures.set(worker.slot, failures);
+    const { respawnBackoff, respawnBackoffMax, maxStartFailures } =
+      this.renderConfig.workerPool;
+    if (failures >= maxStartFailures) {
+      this.failSlot(worker.slot, failures);
+      return;
+    }
+    const delay = Math.min(
+      respawnBackoff * Math.pow(2, failures - 1),
+      respawnBackoffMax
+    );
+    this.logger.warn(
+      `Blender worker[${worker.id}]就绪前退出, 连续 ${failures} 次, ${delay}ms 后重启`
+    );
+    const timer = setTimeout(() => {
+      this.respawnTimers.delete(timer);
+      if (!this.shuttingDown) {
+        this.spawnWorker(worker.slot);
+      }
+    }, delay);
+    this.respawnTimers.add(timer);
+  }
+
+  /**
+   * 位置连续启动失败，不再重启；所有位置都失败时让等待中的任务失败，
+   * 之后的任务由执行器单独启动 Blender
+   */
+  private failSlot(slot: number, failures: number) {
+    this.failedSlots.add(slot);
+    this.logger.error(
+      `Blender worker位置[${slot}]连续 ${failures} 次启动失败, 不再重启`
+    );
+    if (this.failedSlots.size < this.renderConfig.workerPool.size) {
+      return;
+    }
+    this.logger.error(
+      '所有Blender worker都无法启动, 改为每个任务单独启动Blender'
+    );
+    clearInterval(this.healthCheckTimer);
+    const error = new Error('Blender worker 无法启动');
+    this.pendingJobs.splice(0).forEach(pending => {
+      pending.emit('error', error);
+    });
+  }
+
+  /**
+   * 回收 worker 并立即补充一个新的 worker
+   */
+  private recycleWorker(worker: BlenderWorker, reason: string) {
+    if (worker.retired) {
+      return;
+    }
+    this.logger.info(`回收Blender worker[${worker.id}]: ${reason}`);
+    worker.retired = true;
+    this.removeWorker(worker);
+    if (worker.job) {
+      worker.process.kill();
+    } else {
+      worker.process.stdin.end(`${JSON.stringify({ type: 'shutdown' })}\n`);
+    }
+    if (!this.shuttingDown) {
+      this.spawnWorker(worker.slot);
+    }
+  }
+
+  private getCoreSlots(): number[][] {
+    if (!this.coreSlots) {
+      this.coreSlots = partitionCores(
+        this.renderConfig.cpuCores,
+        this.renderConfig.workerPool.size
+      );
+    }
+    return this.coreSlots;
+  }
+
+  private removeWorker(worker: BlenderWorker) {
+    const index = this.workers.indexOf(worker);
+    if (index !== -1) {
+      this.workers.splice(index, 1);
+    }
+  }
+
+  private dispatch() {
+    const idleWorkers = this.workers.filter(
+      worker => worker.ready && !worker.job && !worker.retired
+    );
+    while (idleWorkers.length > 0 && this.pendingJobs.length > 0) {
+      const job = this.pendingJobs.shift();
+      // 优先选择上一个任务加载了同一模型的 worker，避免重复加载 .blend
+      const affinityIndex = idleWorkers.findIndex(
+        worker => worker.lastBlendPath === job.manifest.blendFilePath
+      );
+      const [worker] = idleWorkers.splice(Math.max(affinityIndex, 0), 1);
+      worker.job = job;
+      job.worker = worker;
+      worker.process.stdin.write(
+        `${JSON.stringify({
+          type: 'render',
+          taskId: job.taskId,
+          // 线程数与 worker 绑定的核心数保持一致
+          manifest: worker.cores
+            ? { ...job.manifest, threads: worker.cores.length }
+            : job.manifest,
+        })}\n`
+      );
+    }
+  }
+
+  /**
+   * 对空闲 worker 发送心跳，超时未响应的 worker 会被回收
+   */
+  private healthCheck() {
+    const now = Date.now();
+    const { healthCheckTimeout } = this.renderConfig.workerPool;
+    for (const worker of [...this.workers]) {
+      if (!worker.ready || worker.job) {
+        continue;
+      }
+      if (worker.pingSentAt) {
+        if (now - worker.pingSentAt > healthCheckTimeout) {
+          this.recycleWorker(worker, '心跳超时');
+          worker.process.kill();
+        }
+        continue;
+      }
+      worker.pingSentAt = now;
+      worker.process.stdin.write(`${JSON.stringify({ type: 'ping' })}\n`);
+    }
+  }
+
+  @Destroy()
+  async destroy() {
+    this.shuttingDown = true;
+    clearInterval(this.healthCheckTimer);
+    for (const timer of this.respawnTimers) {
+      clearTimeout(timer);
+    }
+    this.respawnTimers.clear();
+    for (const worker of this.workers.splice(0)) {
+      worker.retired = true;
+      worker.process.kill();
+    }
+  }
+}
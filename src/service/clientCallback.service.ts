@@ -15,7 +15,14 @@ export class ClientCallbackService {
   @Inject()
   fileService: FileService;
 
-  async callbackTaskToClient(taskId: string, callbackParams: CallbackParams) {
+  /**
+   * 上传结果并回调前端，返回前端是否成功接收，上传失败时抛出异常
+   */
+  async callbackTaskToClient(
+    taskId: string,
+    callbackParams: CallbackParams,
+    preview = false
+  ): Promise<boolean> {
     // 给前端一个回调
     const { clientId, clientJwt, fileDataId } = callbackParams;
     const uploadResult = await this.fileService.uploadFile(taskId);
@@ -33,6 +40,10 @@ export class ClientCallbackService {
             picName: uploadResult.url,
             fileDataId: fileDataId,
             clientId,
+            // 预览图之后还会收到同一相机的正式渲染结果
+            preview,
+            // 启用编码阶段时包含 web、thumb 等尺寸的地址
+            renditions: uploadResult.renditions,
           }),
           headers: {
             'Content-Type': 'application/json',
@@ -46,11 +57,12 @@ export class ClientCallbackService {
         this.logger.info(
           `回调前端成功: ${res.status} -- ${taskId} -- ${clientId} -- ${clientJwt} -- ${fileDataId} -- ${uploadResult.url}`
         );
-      } else {
-        this.logger.error(
-          `回调前端失败: ${res.status} -- ${taskId} -- ${clientId} -- ${clientJwt} -- ${fileDataId} -- ${uploadResult.url}`
-        );
+        return true;
       }
+      this.logger.error(
+        `回调前端失败: ${res.status} -- ${taskId} -- ${clientId} -- ${clientJwt} -- ${fileDataId} -- ${uploadResult.url}`
+      );
+      return false;
     } catch (error) {
       this.logger.error(`回调前端失败: ${error.message}`);
       this.logService.addLog(
@@ -60,9 +72,26 @@ export class ClientCallbackService {
         true,
         callbackParams
       );
+      return false;
     }
   }
 
+  /**
+   * 并发上传并回调同一任务的多个相机结果，返回是否全部成功
+   */
+  async callbackTasksToClient(
+    taskIds: string[],
+    callbackParams: CallbackParams,
+    preview = false
+  ): Promise<boolean> {
+    const results = await Promise.all(
+      taskIds.map(taskId =>
+        this.callbackTaskToClient(taskId, callbackParams, preview)
+      )
+    );
+    return results.every(Boolean);
+  }
+
   async callbackErrorToClient(callbackParams: CallbackParams, message: string) {
     const { clientId, fileDataId } = callbackParams;
     try {
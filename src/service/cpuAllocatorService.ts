@@ -0,0 +1,75 @@
+import { Provide, Config, Scope, ScopeEnum } from '@midwayjs/core';
+import { partitionCores } from '@/utils/helper';
+
+export interface CpuAssignment {
+  slot: number;
+  cores: number[];
+  threads: number;
+}
+
+/**
+ * CPU 渲染时为每个运行中的任务分配一组互不重叠的核心
+ * 核心按 maxConcurrentTasks 划分，任务数不超过并发上限时各任务的核心不会重叠
+ */
+@Provide()
+@Scope(ScopeEnum.Singleton)
+export class CpuAllocatorService {
+  @Config('render')
+  renderConfig: {
+    device: 'GPU' | 'CPU';
+    cpuCores: number;
+  };
+
+  @Config('task')
+  taskConfig: {
+    maxConcurrentTasks: number;
+  };
+
+  private slots: number[][];
+  private assignments: Map<string, CpuAssignment> = new Map();
+
+  get enabled(): boolean {
+    return this.renderConfig.device === 'CPU';
+  }
+
+  /**
+   * 为任务分配核心，GPU 模式下返回 undefined
+   */
+  acquire(taskId: string): CpuAssignment | undefined {
+    if (!this.enabled) {
+      return undefined;
+    }
+    const existing = this.assignments.get(taskId);
+    if (existing) {
+      return existing;
+    }
+    if (!this.slots) {
+      this.slots = partitionCores(
+        this.renderConfig.cpuCores,
+        this.taskConfig.maxConcurrentTasks
+      );
+    }
+
+    // 选择当前占用最少的核心组，正常情况下总能找到空闲的组
+    const usage = this.slots.map(() => 0);
+    for (const assignment of this.assignments.values()) {
+      usage[assignment.slot]++;
+    }
+    const slot = usage.indexOf(Math.min(...usage));
+    const assignment: CpuAssignment = {
+      slot,
+      cores: this.slots[slot],
+      threads: this.slots[slot].length,
+    };
+    this.assignments.set(taskId, assignment);
+    return assignment;
+  }
+
+  get(taskId: string): CpuAssignment | undefined {
+    return this.assignments.get(taskId);
+  }
+
+  release(taskId: string) {
+    this.assignments.delete(taskId);
+  }
+}
@@ -11,9 +11,11 @@ import {
   LOG_STAGE,
 } from '@/constant';
 import { LogService } from './log.service';
-import { renderTemplate } from '@/utils/helper';
+import { RenderParams, SamplingProfile } from '@/types';
+import { CpuAllocatorService } from './cpuAllocatorService';
+import { RenderCacheKey, RenderCacheService } from './renderCacheService';
+import { SceneIndexService } from './sceneIndexService';
 
-const writeFileAsync = promisify(fs.writeFile);
 const mkdirAsync = promisify(fs.mkdir);
 
 @Provide()
@@ -30,19 +32,50 @@ export class GeneratePythonScriptService {
   @Inject()
   logService: LogService;
 
+  @Inject()
+  cpuAllocator: CpuAllocatorService;
+
+  @Inject()
+  renderCache: RenderCacheService;
+
+  @Inject()
+  sceneIndex: SceneIndexService;
+
   @Config('render')
   renderConfig: {
     outputDir: string;
-    blenderRunPath: string;
+    device: 'GPU' | 'CPU';
+    fanOutCameras: boolean;
+    simplify: boolean;
+    samplingProfiles: Record<string, SamplingProfile>;
+    denoise: {
+      deferred: boolean;
+    };
+    encode: {
+      enabled: boolean;
+    };
+    splitFrame: {
+      qualities: string[];
+      rows: number;
+      cols: number;
+      overlap: number;
+    };
   };
 
   @Config('model')
   modelConfig: {
     modelDir: string;
+    assetCacheDir: string;
+    assetCacheMaxBytes: number;
+    snapshotCache: {
+      enabled: boolean;
+      dir: string;
+      maxBytes: number;
+    };
   };
 
   /**
-   * 创建Python渲染脚本并执行
+   * 生成渲染任务清单并执行
    * @param taskId 任务ID
    * @param params 渲染参数
    * @returns 执行结果
@@ -52,17 +85,52 @@ export class GeneratePythonScriptService {
     params: IRenderTaskTypeFromTask
   ): Promise<any> {
     try {
-      // 生成脚本
-      const scriptPath = await this.createBlenderScript(taskId, params);
-      // 执行脚本
-      const result = await this.scriptExecutor.executeScript(
+      // 生成任务清单
+      const manifest = await this.createRenderManifest(taskId, params);
+      // 子任务只渲染父任务的一个相机，由父任务统一写入缓存
+      if (!this.renderCache.enabled || params.parentTaskId) {
+        // 执行渲染，清单中含有客户端凭证，不放进返回结果
+        const result = await this.executeRender(taskId, manifest, params);
+        return {
+          outputDir: manifest.outputDir,
+          ...result,
+        };
+      }
+
+      const cacheKey = await this.renderCache.computeKey(manifest);
+      // 相同配置正在本节点渲染时等待它完成，之后从缓存读取结果
+      const inflight = this.renderCache.getInflight(cacheKey.key);
+      if (inflight) {
+        return this.completeDuplicate(
+          taskId,
+          manifest,
+          params,
+          cacheKey,
+          inflight
+        );
+      }
+
+      // getInflight 与 trackInflight 之间没有 await，同一配置不会同时启动两次渲染
+      // 拆分后的任务在返回时才刚开始渲染，直到父任务汇总结束并写入缓存前都视为正在渲染
+      const execution = this.executeWithCache(
         taskId,
-        scriptPath,
-        params
+        manifest,
+        params,
+        cacheKey
+      );
+      this.renderCache.trackInflight(
+        cacheKey.key,
+        execution.then(result =>
+          result.fannedOut
+            ? this.taskScheduler.waitForTaskFinished(taskId)
+            : undefined
+        )
       );
+      const result = await execution;
 
       return {
-        scriptPath,
+        outputDir: manifest.outputDir,
+        cacheKey: cacheKey.key,
         ...result,
       };
     } catch (error) {
@@ -72,16 +140,165 @@ export class GeneratePythonScriptService {
   }
 
   /**
-   * 创建Python渲染脚本
+   * 等待相同配置的渲染完成，从缓存读取结果完成重复的任务
+   * 等待期间让出执行槽和资源预算，避免重复任务占满执行槽，使原任务拆分出的子任务无法执行；
+   * 原任务失败、缓存中没有结果时重复的任务同样失败
+   */
+  private async completeDuplicate(
+    taskId: string,
+    manifest: RenderParams,
+    params: IRenderTaskTypeFromTask,
+    cacheKey: RenderCacheKey,
+    inflight: Promise<unknown>
+  ) {
+    this.taskScheduler.releaseRenderSlot(taskId);
+    this.logService.addLog(
+      taskId,
+      LOG_STAGE.start,
+      `相同配置的任务正在渲染，等待其结果: ${cacheKey.key}`
+    );
+    await inflight.catch(() => undefined);
+
+    const cachedTaskIds = await this.renderCache.restore(
+      cacheKey.key,
+      taskId,
+      manifest.outputDir
+    );
+    if (!cachedTaskIds) {
+      throw new Error(`相同配置的任务没有生成渲染结果: ${cacheKey.key}`);
+    }
+    const result = await this.scriptExecutor.completeFromCache(
+      taskId,
+      cachedTaskIds,
+      params
+    );
+    return {
+      outputDir: manifest.outputDir,
+      cacheKey: cacheKey.key,
+      ...result,
+    };
+  }
+
+  /**
+   * 优先从渲染缓存读取结果，未命中时执行渲染并写入缓存
+   */
+  private async executeWithCache(
+    taskId: string,
+    manifest: RenderParams,
+    params: IRenderTaskTypeFromTask,
+    cacheKey: RenderCacheKey
+  ): Promise<{ success: boolean; fannedOut?: boolean; [key: string]: any }> {
+    const cachedTaskIds = await this.renderCache.restore(
+      cacheKey.key,
+      taskId,
+      manifest.outputDir
+    );
+    if (cachedTaskIds) {
+      return this.scriptExecutor.completeFromCache(
+        taskId,
+        cachedTaskIds,
+        params
+      );
+    }
+
+    // 增量渲染: 在同一场景最近的结果上只重新渲染替换有变化的区域
+    if (manifest.incremental) {
+      manifest.incrementalBase = await this.renderCache.findIncrementalBase(
+        cacheKey
+      );
+      if (manifest.incrementalBase) {
+        const { changedTargets } = manifest.incrementalBase;
+        this.logService.addLog(
+          taskId,
+          LOG_STAGE.start,
+          `增量渲染, 变化的替换目标: ${changedTargets.join(',')}`
+        );
+      }
+    }
+
+    const result = await this.executeRender(
+      taskId,
+      manifest,
+      params,
+      cacheKey
+    );
+    // 拆分后的任务在所有子任务完成后由调度器写入缓存
+    if (result.success && !result.fannedOut) {
+      await this.renderCache.store(cacheKey, taskId, manifest.outputDir);
+    }
+    return result;
+  }
+
+  /**
+   * 执行渲染，启用相机拆分时把多相机任务拆成每个相机一个子任务
+   */
+  private async executeRender(
+    taskId: string,
+    manifest: RenderParams,
+    params: IRenderTaskTypeFromTask,
+    cacheKey?: RenderCacheKey
+  ): Promise<{ success: boolean; fannedOut?: boolean; [key: string]: any }> {
+    const splitFrame = !params.parentTaskId && this.shouldSplitFrame(params);
+    if (
+      (this.renderConfig.fanOutCameras && !params.parentTaskId) ||
+      splitFrame
+    ) {
+      const cameraCount = await this.sceneIndex
+        .getIndex(manifest.blendFilePath)
+        // 没有相机的场景由渲染模板创建默认相机
+        .then(index => Math.max(1, index.cameras.length))
+        .catch(error => {
+          this.logger.error(`读取场景索引失败: ${error.message}`);
+          return 1;
+        });
+      if (cameraCount > 1 || splitFrame) {
+        const { rows, cols, overlap } = this.renderConfig.splitFrame;
+        const subtaskIds = await this.taskScheduler.fanOutTask(
+          taskId,
+          cameraCount,
+          cacheKey,
+          splitFrame ? { rows, cols, overlap } : undefined
+        );
+        this.logService.addLog(
+          taskId,
+          LOG_STAGE.start,
+          splitFrame
+            ? `任务已拆分为 ${cameraCount} 个相机 x ${rows * cols} 个分块子任务`
+            : `任务已拆分为 ${cameraCount} 个相机子任务`
+        );
+        return { success: true, fannedOut: true, subtaskIds };
+      }
+    }
+    return this.scriptExecutor.executeScript(taskId, manifest, params);
+  }
+
+  /**
+   * 是否把每个相机的画面拆成分块渲染，默认不分块
+   * 请求未指定时只有配置了默认分块的质量才分块
+   */
+  private shouldSplitFrame(params: IRenderTaskTypeFromTask): boolean {
+    const payload = JSON.parse(params.payload || '{}') as IRenderDataType;
+    const renderParams = payload?.renderParams;
+    const { rows, cols, qualities } = this.renderConfig.splitFrame;
+    if (rows * cols <= 1) {
+      return false;
+    }
+    return (
+      renderParams?.splitFrame ??
+      qualities.includes(renderParams?.quality || '1k')
+    );
+  }
+
+  /**
+   * 创建渲染任务清单，由静态渲染模块 src/templates/blender_render.py 读取
    * @param taskId 任务ID
-   * @param _params 渲染参数
-   * @returns 脚本路径
+   * @param data 渲染参数
+   * @returns 任务清单
    */
-  async createBlenderScript(
+  async createRenderManifest(
     taskId: string,
-    // eslint-disable-next-line @typescript-eslint/no-unused-vars
     data: IRenderTaskTypeFromTask
-  ): Promise<string> {
+  ): Promise<RenderParams> {
     try {
       const renderParamsResult = JSON.parse(
         data.payload || '{}'
@@ -100,69 +317,75 @@ export class GeneratePythonScriptService {
       const renderParams = renderParamsResult?.renderParams;
       const quality = renderParams?.quality || '1k';
 
-      const templatePath = path.join(
-        process.cwd(), // 使用项目根目录
-        'src',
-        'templates',
-        'blender_render.py'
-      );
-      const pythonTemplate = await fs.promises.readFile(templatePath, 'utf-8');
-      // 1. 替换模板中的变量
-      const renderOutputDir = `${this.renderConfig.outputDir}/${taskId}/`;
-      const renderedTemplate = renderTemplate(pythonTemplate, {
+      // 1. 创建任务输出目录，子任务的结果写到父任务的目录
+      const outputTaskId = data.parentTaskId || taskId;
+      const outputDir = path.join(this.renderConfig.outputDir, outputTaskId);
+      await mkdirAsync(outputDir, { recursive: true });
+
+      // 2. 组装任务清单
+      const manifest: RenderParams = {
         blendFilePath: `${this.modelConfig.modelDir}/${renderParamsResult?.modelName}.blend`,
         taskId,
-        outputDir: renderOutputDir,
+        outputDir,
         replacementItems: replacementItemsArr,
         quality,
-        blenderRunPath: this.renderConfig.blenderRunPath,
         clientId: data?.clientId || '',
         clientJwt: data?.clientJwt || '',
         fileDataId: data?.projectId || '',
-      });
-      // 2. 确保脚本目录存在
-      const scriptDir = this.renderConfig.outputDir;
-      await mkdirAsync(scriptDir, { recursive: true });
-
-      // 3. 创建任务输出目录
-      const outputDir = path.join(scriptDir, taskId);
-      await mkdirAsync(outputDir, { recursive: true });
-
-      // 4. 创建脚本名称和路径
-      const scriptName = `render_task_${taskId}.py`;
-      const scriptPath = path.join(scriptDir, scriptName);
-
-      // 5. 创建输出文件名和路径
-      const outputFileName = `render_${taskId}.jpg`;
-      const outputFilePath = path.join(outputDir, outputFileName);
-
-      // 6. 创建文件并写入内容
-      await writeFileAsync(scriptPath, renderedTemplate);
+        assetCacheDir: this.modelConfig.assetCacheDir,
+        assetCacheMaxBytes: this.modelConfig.assetCacheMaxBytes,
+        // 为空时不使用场景快照
+        snapshotCacheDir: this.modelConfig.snapshotCache?.enabled
+          ? this.modelConfig.snapshotCache.dir
+          : '',
+        snapshotCacheMaxBytes: this.modelConfig.snapshotCache?.maxBytes || 0,
+        coalesceCallback: !!renderParams?.coalesceCallback,
+        device: this.renderConfig.device,
+        // 0 表示由 Blender 自动决定线程数
+        threads: this.cpuAllocator.get(taskId)?.threads || 0,
+        timeBudget: Number(renderParams?.timeBudget) || 0,
+        // 没有配置的档位使用模板的基准采样
+        sampling: this.renderConfig.samplingProfiles?.[quality],
+        preview: !!renderParams?.preview,
+        incremental: !!renderParams?.incremental,
+        lossless: !!this.renderConfig.encode?.enabled,
+        simplify: !!this.renderConfig.simplify,
+        // 分块和增量渲染由模板忽略该选项，仍在渲染时降噪
+        deferDenoise: !!this.renderConfig.denoise?.deferred,
+      };
+      if (data.parentTaskId) {
+        manifest.cameraIndices = [data.cameraIndex];
+        manifest.outputTaskId = data.parentTaskId;
+        manifest.deferCallback = manifest.coalesceCallback;
+        if (data.tile) {
+          manifest.tile = data.tile;
+        }
+      }
 
       this.logService.addLog(
         taskId,
         LOG_STAGE.start,
-        `Python脚本已生成: ${scriptPath}`
+        `渲染任务清单已生成, 模型: ${manifest.blendFilePath}`
       );
 
       this.logService.addLog(
         taskId,
         LOG_STAGE.start,
-        `输出将保存到: ${outputFilePath}`
+        `输出将保存到: ${outputDir}`
       );
 
-      this.logger.info(`Python脚本已生成: ${scriptPath}`);
-      this.logger.info(`输出将保存到: ${outputFilePath}`);
+      this.logger.info(`渲染任务清单已生成: ${taskId}`);
+      this.logger.info(`输出将保存到: ${outputDir}`);
 
-      return scriptPath;
+      return manifest;
     } catch (error) {
       this.logService.addLog(
         taskId,
         LOG_STAGE.start,
-        `创建Python脚本失败: ${error}`
+        `创建渲染任务清单失败: ${error}`
       );
-      this.logger.error('创建Python脚本失败', error);
-      throw new Error(`创建Python脚本失败: ${error.message}`);
+      this.logger.error('创建渲染任务清单失败', error);
+      throw new Error(`创建渲染任务清单失败: ${error.message}`);
     }
   }
 }
@@ -0,0 +1,190 @@
+import {
+  Provide,
+  Inject,
+  Config,
+  Scope,
+  ScopeEnum,
+  Destroy,
+} from '@midwayjs/core';
+import { ILogger } from '@midwayjs/logger';
+import { spawn, ChildProcess } from 'child_process';
+import * as fs from 'fs';
+import * as path from 'path';
+import * as readline from 'readline';
+import {
+  getBlenderEnv,
+  parseRenderEvent,
+  RENDER_SCRIPT_PATH,
+} from '@/utils/helper';
+
+interface DenoiseJob {
+  id: number;
+  source: string;
+  output: string;
+  resolve: () => void;
+  reject: (error: Error) => void;
+}
+
+interface DenoiseWorker {
+  process: ChildProcess;
+  job?: DenoiseJob;
+}
+
+/**
+ * 延后降噪
+ * 渲染进程只输出含噪结果和降噪数据通道（多层 EXR），采样结束后立即让出执行槽，
+ * 由独立的 Blender 降噪进程池生成最终图片，降噪并发数单独配置
+ */
+@Provide()
+@Scope(ScopeEnum.Singleton)
+export class DenoiseService {
+  @Inject()
+  logger: ILogger;
+
+  @Config('render')
+  renderConfig: {
+    blenderRunPath: string;
+    denoise: {
+      deferred: boolean;
+      poolSize: number;
+    };
+    encode: {
+      enabled: boolean;
+    };
+  };
+
+  private workers: DenoiseWorker[] = [];
+  private pendingJobs: DenoiseJob[] = [];
+  private nextJobId = 1;
+  private inflight: Map<string, Promise<void>> = new Map();
+
+  get enabled(): boolean {
+    return !!this.renderConfig.denoise?.deferred;
+  }
+
+  /**
+   * 把相机的含噪结果 <taskId>.exr 降噪为 <taskId>.jpg，启用编码阶段时输出无损的 <taskId>.png
+   * 没有含噪结果时（已经降噪或渲染时已降噪）直接返回，同一结果的并发请求共享一次降噪
+   */
+  denoise(outputDir: string, taskId: string): Promise<void> {
+    const key = path.join(outputDir, taskId);
+    const existing = this.inflight.get(key);
+    if (existing) {
+      return existing;
+    }
+    const execution = this.denoiseResult(outputDir, taskId);
+    this.inflight.set(key, execution);
+    const clear = () => this.inflight.delete(key);
+    execution.then(clear, clear);
+    return execution;
+  }
+
+  private async denoiseResult(outputDir: string, taskId: string) {
+    const source = path.join(outputDir, `${taskId}.exr`);
+    const exists = await fs.promises.access(source).then(
+      () => true,
+      () => false
+    );
+    if (!exists) {
+      return;
+    }
+    const extension = this.renderConfig.encode?.enabled ? 'png' : 'jpg';
+    const output = path.join(outputDir, `${taskId}.${extension}`);
+    const startTime = Date.now();
+    await new Promise<void>((resolve, reject) => {
+      this.pendingJobs.push({
+        id: this.nextJobId++,
+        source,
+        output,
+        resolve,
+        reject,
+      });
+      this.dispatch();
+    });
+    this.logger.info(`降噪完成: ${output}, 耗时 ${Date.now() - startTime}ms`);
+  }
+
+  private dispatch() {
+    while (this.pendingJobs.length > 0) {
+      let worker = this.workers.find(item => !item.job);
+      if (!worker) {
+        // 按需启动 worker，进程异常退出后由下一个任务重新启动
+        if (this.workers.length >= this.renderConfig.denoise.poolSize) {
+          return;
+        }
+        worker = this.spawnWorker();
+      }
+      const job = this.pendingJobs.shift();
+      worker.job = job;
+      worker.process.stdin.write(
+        `${JSON.stringify({
+          id: job.id,
+          source: job.source,
+          output: job.output,
+        })}\n`
+      );
+    }
+  }
+
+  private spawnWorker(): DenoiseWorker {
+    const child = spawn(
+      this.renderConfig.blenderRunPath || 'blender',
+      ['--background', '--python', RENDER_SCRIPT_PATH, '--', '--denoise'],
+      { env: getBlenderEnv() }
+    );
+    const worker: DenoiseWorker = { process: child };
+    this.workers.push(worker);
+    this.logger.info(`启动降噪 worker, pid: ${child.pid}`);
+
+    let stderr = '';
+    readline
+      .createInterface({ input: child.stdout, crlfDelay: Infinity })
+      .on('line', line => this.handleLine(worker, line));
+    child.stderr.on('data', data => {
+      // 只保留最后一段错误输出用于定位问题
+      stderr = `${stderr}${data}`.slice(-2000);
+    });
+    child.on('error', err => this.handleExit(worker, err.message));
+    child.on('exit', code =>
+      this.handleExit(worker, `退出码: ${code}, ${stderr.trim()}`)
+    );
+    return worker;
+  }
+
+  private handleLine(worker: DenoiseWorker, line: string) {
+    // Blender 的其它输出直接忽略，只处理降噪事件
+    const event = parseRenderEvent(line);
+    const job = worker.job;
+    if (event?.phase !== 'denoise' || !job || event.id !== job.id) {
+      return;
+    }
+    worker.job = undefined;
+    if (event.ok) {
+      job.resolve();
+    } else {
+      job.reject(new Error(`降噪失败: ${event.error}`));
+    }
+    this.dispatch();
+  }
+
+  private handleExit(worker: DenoiseWorker, reason: string) {
+    // error 和 exit 事件可能先后触发
+    const index = this.workers.indexOf(worker);
+    if (index === -1) {
+      return;
+    }
+    this.workers.splice(index, 1);
+    this.logger.error(`降噪 worker 已退出: ${reason}`);
+    const job = worker.job;
+    worker.job = undefined;
+    job?.reject(new Error(`降噪 worker 已退出: ${reason}`));
+    this.dispatch();
+  }
+
+  @Destroy()
+  async destroy() {
+    for (const worker of this.workers.splice(0)) {
+      worker.process.stdin.end();
+    }
+  }
+}
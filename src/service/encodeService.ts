@@ -0,0 +1,256 @@
+import {
+  Provide,
+  Inject,
+  Config,
+  Scope,
+  ScopeEnum,
+  Destroy,
+} from '@midwayjs/core';
+import { ILogger } from '@midwayjs/logger';
+import { spawn, ChildProcess } from 'child_process';
+import * as fs from 'fs';
+import * as path from 'path';
+import * as readline from 'readline';
+
+const ENCODE_SCRIPT_PATH = path.join(
+  process.cwd(),
+  'src',
+  'templates',
+  'encode_worker.py'
+);
+
+const IMAGE_FORMATS: Record<
+  string,
+  { extension: string; contentType: string }
+> = {
+  JPEG: { extension: 'jpg', contentType: 'image/jpeg' },
+  WEBP: { extension: 'webp', contentType: 'image/webp' },
+  PNG: { extension: 'png', contentType: 'image/png' },
+};
+
+export interface RenditionConfig {
+  name: string;
+  // 追加在任务ID后的文件名后缀，完整尺寸为空，输出 <taskId>.jpg
+  suffix: string;
+  format: 'JPEG' | 'WEBP' | 'PNG';
+  quality: number;
+  // 0 表示保持原始宽度
+  maxWidth: number;
+}
+
+export interface Rendition {
+  name: string;
+  file: string;
+  contentType: string;
+}
+
+interface EncodeJob {
+  id: number;
+  payload: Record<string, unknown>;
+  resolve: () => void;
+  reject: (error: Error) => void;
+}
+
+interface EncodeWorker {
+  process: ChildProcess;
+  job?: EncodeJob;
+}
+
+/**
+ * 渲染后的编码阶段
+ * Blender 只输出无损 PNG，由独立的 Python 进程池生成各尺寸的 JPEG/WebP，编码不占用渲染执行槽
+ */
+@Provide()
+@Scope(ScopeEnum.Singleton)
+export class EncodeService {
+  @Inject()
+  logger: ILogger;
+
+  @Config('render')
+  renderConfig: {
+    encode: {
+      enabled: boolean;
+      pythonPath: string;
+      poolSize: number;
+      renditions: RenditionConfig[];
+    };
+  };
+
+  private workers: EncodeWorker[] = [];
+  private pendingJobs: EncodeJob[] = [];
+  private nextJobId = 1;
+  private inflight: Map<string, Promise<Rendition[]>> = new Map();
+
+  get enabled(): boolean {
+    return !!this.renderConfig.encode?.enabled;
+  }
+
+  /**
+   * 生成任务结果的各个尺寸，返回所有尺寸的文件
+   * 存在无损 PNG 时从 PNG 编码并删除 PNG，否则只从完整尺寸的 JPEG 补齐缺少的尺寸
+   * 同一结果的并发请求共享一次编码
+   */
+  encode(outputDir: string, taskId: string): Promise<Rendition[]> {
+    const key = path.join(outputDir, taskId);
+    const existing = this.inflight.get(key);
+    if (existing) {
+      return existing;
+    }
+    const execution = this.encodeRenditions(outputDir, taskId);
+    this.inflight.set(key, execution);
+    const clear = () => this.inflight.delete(key);
+    execution.then(clear, clear);
+    return execution;
+  }
+
+  private async encodeRenditions(
+    outputDir: string,
+    taskId: string
+  ): Promise<Rendition[]> {
+    const targets = this.renderConfig.encode.renditions.map(rendition => ({
+      ...rendition,
+      file: path.join(
+        outputDir,
+        `${taskId}${rendition.suffix}.${
+          IMAGE_FORMATS[rendition.format].extension
+        }`
+      ),
+    }));
+    const lossless = path.join(outputDir, `${taskId}.png`);
+    const hasLossless = await this.exists(lossless);
+    const source = hasLossless
+      ? lossless
+      : path.join(outputDir, `${taskId}.jpg`);
+
+    const missing: typeof targets = [];
+    for (const target of targets) {
+      if (hasLossless || !(await this.exists(target.file))) {
+        missing.push(target);
+      }
+    }
+    if (missing.length > 0) {
+      if (!hasLossless && !(await this.exists(source))) {
+        throw new Error(`找不到渲染结果: ${source}`);
+      }
+      const startTime = Date.now();
+      await this.runJob({
+        source,
+        removeSource: hasLossless,
+        renditions: missing.map(target => ({
+          name: target.name,
+          format: target.format,
+          quality: target.quality,
+          maxWidth: target.maxWidth,
+          output: target.file,
+        })),
+      });
+      this.logger.info(
+        `图片编码完成: ${taskId}, ${missing.length}个尺寸, 耗时 ${
+          Date.now() - startTime
+        }ms`
+      );
+    }
+
+    return targets.map(target => ({
+      name: target.name,
+      file: target.file,
+      contentType: IMAGE_FORMATS[target.format].contentType,
+    }));
+  }
+
+  private runJob(payload: Record<string, unknown>): Promise<void> {
+    return new Promise((resolve, reject) => {
+      this.pendingJobs.push({ id: this.nextJobId++, payload, resolve, reject });
+      this.dispatch();
+    });
+  }
+
+  private dispatch() {
+    while (this.pendingJobs.length > 0) {
+      let worker = this.workers.find(item => !item.job);
+      if (!worker) {
+        // 按需启动 worker，进程异常退出后由下一个任务重新启动
+        if (this.workers.length >= this.renderConfig.encode.poolSize) {
+          return;
+        }
+        worker = this.spawnWorker();
+      }
+      const job = this.pendingJobs.shift();
+      worker.job = job;
+      worker.process.stdin.write(
+        `${JSON.stringify({ id: job.id, ...job.payload })}\n`
+      );
+    }
+  }
+
+  private spawnWorker(): EncodeWorker {
+    const child = spawn(this.renderConfig.encode.pythonPath || 'python3', [
+      ENCODE_SCRIPT_PATH,
+    ]);
+    const worker: EncodeWorker = { process: child };
+    this.workers.push(worker);
+    this.logger.info(`启动编码 worker, pid: ${child.pid}`);
+
+    let stderr = '';
+    readline
+      .createInterface({ input: child.stdout, crlfDelay: Infinity })
+      .on('line', line => this.handleLine(worker, line));
+    child.stderr.on('data', data => {
+      stderr = `${stderr}${data}`.slice(-2000);
+    });
+    child.on('error', err => this.handleExit(worker, err.message));
+    child.on('exit', code =>
+      this.handleExit(worker, `退出码: ${code}, ${stderr.trim()}`)
+    );
+    return worker;
+  }
+
+  private handleLine(worker: EncodeWorker, line: string) {
+    let reply: { id: number; ok: boolean; error?: string };
+    try {
+      reply = JSON.parse(line);
+    } catch (error) {
+      this.logger.warn(`编码 worker 输出无法解析: ${line}`);
+      return;
+    }
+    const job = worker.job;
+    if (!job || reply.id !== job.id) {
+      return;
+    }
+    worker.job = undefined;
+    if (reply.ok) {
+      job.resolve();
+    } else {
+      job.reject(new Error(`图片编码失败: ${reply.error}`));
+    }
+    this.dispatch();
+  }
+
+  private handleExit(worker: EncodeWorker, reason: string) {
+    // error 和 exit 事件可能先后触发
+    const index = this.workers.indexOf(worker);
+    if (index === -1) {
+      return;
+    }
+    this.workers.splice(index, 1);
+    this.logger.error(`编码 worker 已退出: ${reason}`);
+    const job = worker.job;
+    worker.job = undefined;
+    job?.reject(new Error(`编码 worker 已退出: ${reason}`));
+    this.dispatch();
+  }
+
+  private async exists(filePath: string): Promise<boolean> {
+    return fs.promises.access(filePath).then(
+      () => true,
+      () => false
+    );
+  }
+
+  @Destroy()
+  async destroy() {
+    for (const worker of this.workers.splice(0)) {
+      worker.process.stdin.end();
+    }
+  }
+}
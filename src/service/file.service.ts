@@ -2,6 +2,8 @@ import { Provide, Inject, ILogger, Config } from '@midwayjs/core';
 import path = require('path');
 import fs = require('fs');
 import { CALLBACK_CLIENT_URL, FILE_DATA_PATH } from '@/constant';
+import { EncodeService } from './encodeService';
+import { DenoiseService } from './denoiseService';
 
 @Provide()
 export class FileService {
@@ -12,9 +14,37 @@ export class FileService {
   renderConfig: {
     outputDir: string;
   };
-  async uploadFile(taskId: string) {
+
+  @Inject()
+  encodeService: EncodeService;
+
+  @Inject()
+  denoiseService: DenoiseService;
+
+  async uploadFile(taskId: string): Promise<{
+    success: boolean;
+    message: string;
+    url: string;
+    // 启用编码阶段时各尺寸的地址
+    renditions?: Record<string, string>;
+  }> {
     try {
-      const fileDataId = taskId.replace(/_cam.+/, '');
+      // 相机和预览后缀: <id>_cam1、<id>_preview、<id>_cam1_preview
+      const fileDataId = taskId.replace(/_(cam|preview).*$/, '');
+      // 降噪延后时相机结果可能还是含噪的 EXR，先等待降噪进程池生成最终图片
+      if (this.denoiseService.enabled && !taskId.endsWith('_preview')) {
+        await this.denoiseService.denoise(
+          path.join(
+            this.renderConfig.outputDir || `${process.cwd()}/render_output`,
+            fileDataId
+          ),
+          taskId
+        );
+      }
+      // 启用编码阶段时上传各个尺寸，预览图直接上传
+      if (this.encodeService.enabled && !taskId.endsWith('_preview')) {
+        return await this.uploadRenditions(fileDataId, taskId);
+      }
       // 构建文件路径
       const filePath = path.join(
         this.renderConfig.outputDir || `${process.cwd()}/render_output`,
@@ -72,4 +102,49 @@ export class FileService {
       };
     }
   }
+
+  /**
+   * 编码并上传结果的各个尺寸，url 为完整尺寸的地址
+   */
+  private async uploadRenditions(fileDataId: string, taskId: string) {
+    const renditions = await this.encodeService.encode(
+      path.join(
+        this.renderConfig.outputDir || `${process.cwd()}/render_output`,
+        fileDataId
+      ),
+      taskId
+    );
+
+    const urls: Record<string, string> = {};
+    for (const rendition of renditions) {
+      const fileName = path.basename(rendition.file);
+      const response = await fetch(
+        `${FILE_DATA_PATH}/render_output/${fileName}`,
+        {
+          method: 'PUT',
+          body: await fs.promises.readFile(rendition.file),
+          headers: {
+            'Content-Type': rendition.contentType,
+          },
+        }
+      );
+      if (!response.ok) {
+        throw new Error(
+          `Upload ${rendition.name} failed with status: ${response.status}`
+        );
+      }
+      urls[rendition.name] = `${CALLBACK_CLIENT_URL}/render_output/${fileName}`;
+    }
+
+    this.logger.info(
+      `File uploaded successfully for task: ${taskId}`,
+      JSON.stringify(urls)
+    );
+    return {
+      success: true,
+      message: `Uploaded ${renditions.length} renditions`,
+      url: urls.full || Object.values(urls)[0] || '',
+      renditions: urls,
+    };
+  }
 }
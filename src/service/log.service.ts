@@ -11,6 +11,7 @@ import { RedisService } from '@midwayjs/redis';
 import { ILogger } from '@midwayjs/logger';
 import { LOG_STAGE } from '@/constant';
 import { ClientCallbackService } from './clientCallback.service';
+import { LogBufferService } from './logBufferService';
 import { CallbackParams } from '@/types';
 
 @Provide()
@@ -30,6 +31,9 @@ export class LogService {
   @Inject()
   clientCallbackService: ClientCallbackService;
 
+  @Inject()
+  logBuffer: LogBufferService;
+
   async addLog(
     taskId: string,
     stage: LOG_STAGE,
@@ -38,17 +42,13 @@ export class LogService {
     callbackParams?: CallbackParams
   ) {
     try {
-      await this.redisService.xadd(
-        `task:logs:${taskId}`,
-        '*',
-        'stage',
+      // 执行过程中的日志批量写入，开始、结束和需要上报的错误立即写入
+      await this.logBuffer.append(
+        taskId,
         stage,
-        'message',
         message,
-        'timestamp',
-        Date.now()
+        errorUpload || stage !== LOG_STAGE.processing
       );
-      await this.redisService.xtrim(`task:logs:${taskId}`, 'MAXLEN', '~', 1000);
       // 如果是一种特殊错误需要上传到第三方，这里做处理
       if (errorUpload) {
         console.error(`errorUpload is true, Error: ${message}`);
@@ -0,0 +1,198 @@
+import {
+  Provide,
+  Inject,
+  Config,
+  Init,
+  Scope,
+  ScopeEnum,
+  Destroy,
+} from '@midwayjs/core';
+import { RedisService } from '@midwayjs/redis';
+import { ILogger } from '@midwayjs/logger';
+import { LOG_STAGE } from '@/constant';
+
+// Cycles 渲染进度行，每个批次只保留最新的一行
+const PROGRESS_PATTERN =
+  /Sample \d+\/\d+|Rendered \d+\/\d+ Tiles|Remaining:|Path Tracing/;
+// 错误相关的行立即写入
+const CRITICAL_PATTERN = /错误|失败|Error|Exception|Traceback/;
+
+interface LogLine {
+  stage: LOG_STAGE;
+  text: string;
+  timestamp: number;
+  progress: boolean;
+}
+
+interface TaskLogBuffer {
+  lines: LogLine[];
+  // 合并掉的进度行和因缓冲区已满丢弃的行
+  sampled: number;
+  dropped: number;
+}
+
+/**
+ * 任务日志缓冲
+ * Blender 每行输出不再单独写 Redis，而是按任务缓冲，所有任务的记录在一个 pipeline 中写入，
+ * 每行仍是一条 Stream 记录，每条记录通过 XADD MAXLEN ~ 裁剪，不再单独 XTRIM。
+ * 写入跟不上时缓冲区达到上限后丢弃非关键行，完整输出仍保存在任务的本地日志文件中。
+ */
+@Provide()
+@Scope(ScopeEnum.Singleton)
+export class LogBufferService {
+  @Inject()
+  redisService: RedisService;
+
+  @Inject()
+  logger: ILogger;
+
+  @Config('logger')
+  loggerConfig: {
+    buffer: {
+      flushInterval: number;
+      batchLines: number;
+      maxPendingLines: number;
+      maxLen: number;
+    };
+  };
+
+  private buffers: Map<string, TaskLogBuffer> = new Map();
+  private flushTimer: NodeJS.Timeout;
+  // 写入串行执行，写入进行中到达的行由下一次写入带走
+  private flushChain: Promise<void> = Promise.resolve();
+  private queuedFlush: Promise<void> | null = null;
+
+  @Init()
+  async init() {
+    this.flushTimer = setInterval(() => {
+      if (this.buffers.size > 0) {
+        this.flush();
+      }
+    }, this.loggerConfig.buffer.flushInterval);
+  }
+
+  /**
+   * 追加一条日志，关键日志等待写入完成后返回，其余日志立即返回
+   */
+  append(
+    taskId: string,
+    stage: LOG_STAGE,
+    message: string,
+    critical = false
+  ): Promise<void> {
+    const { batchLines, maxPendingLines } = this.loggerConfig.buffer;
+    let buffer = this.buffers.get(taskId);
+    if (!buffer) {
+      buffer = { lines: [], sampled: 0, dropped: 0 };
+      this.buffers.set(taskId, buffer);
+    }
+
+    const timestamp = Date.now();
+    let flushNow = critical;
+    for (const text of message.split('\n')) {
+      if (!text.trim()) {
+        continue;
+      }
+      const isCritical = critical || CRITICAL_PATTERN.test(text);
+      flushNow = flushNow || isCritical;
+      const progress = !isCritical && PROGRESS_PATTERN.test(text);
+      if (progress) {
+        // 同一批次中只保留最新的进度行
+        const index = buffer.lines.findIndex(
+          line => line.progress && line.stage === stage
+        );
+        if (index !== -1) {
+          buffer.lines.splice(index, 1);
+          buffer.sampled++;
+        }
+      } else if (!isCritical && buffer.lines.length >= maxPendingLines) {
+        buffer.dropped++;
+        continue;
+      }
+      buffer.lines.push({ stage, text, timestamp, progress });
+    }
+
+    if (flushNow) {
+      return this.flush();
+    }
+    if (buffer.lines.length >= batchLines) {
+      this.flush();
+    }
+    return Promise.resolve();
+  }
+
+  /**
+   * 写入所有任务缓冲的日志
+   */
+  flush(): Promise<void> {
+    if (!this.queuedFlush) {
+      const flush = this.flushChain.then(() => {
+        this.queuedFlush = null;
+        return this.writePending();
+      });
+      this.queuedFlush = flush;
+      this.flushChain = flush.catch(() => undefined);
+    }
+    return this.queuedFlush;
+  }
+
+  private async writePending(): Promise<void> {
+    const { maxLen } = this.loggerConfig.buffer;
+    const pipeline = this.redisService.pipeline();
+    let records = 0;
+
+    for (const [taskId, buffer] of this.buffers) {
+      const lines = buffer.lines.splice(0);
+      if (buffer.sampled > 0 || buffer.dropped > 0) {
+        lines.push({
+          stage: lines[lines.length - 1]?.stage || LOG_STAGE.processing,
+          text: `[日志] 合并 ${buffer.sampled} 行渲染进度, 丢弃 ${buffer.dropped} 行`,
+          timestamp: Date.now(),
+          progress: false,
+        });
+        buffer.sampled = 0;
+        buffer.dropped = 0;
+      }
+      this.buffers.delete(taskId);
+
+      // 每行一条记录，与读取日志的格式一致
+      for (const line of lines) {
+        pipeline.xadd(
+          `task:logs:${taskId}`,
+          'MAXLEN',
+          '~',
+          maxLen,
+          '*',
+          'stage',
+          line.stage,
+          'message',
+          line.text,
+          'timestamp',
+          line.timestamp
+        );
+        records++;
+      }
+    }
+
+    if (records === 0) {
+      return;
+    }
+    try {
+      const results = await pipeline.exec();
+      const failed = results.filter(([error]) => error);
+      if (failed.length > 0) {
+        this.logger.error(
+          `写入任务日志失败 ${failed.length}/${records}: ${failed[0][0]}`
+        );
+      }
+    } catch (error) {
+      this.logger.error(`写入任务日志失败: ${error.message}`);
+    }
+  }
+
+  @Destroy()
+  async destroy() {
+    clearInterval(this.flushTimer);
+    await this.flush();
+  }
+}
@@ -0,0 +1,297 @@
+import { Provide, Inject, Config, Scope, ScopeEnum } from '@midwayjs/core';
+import { ILogger } from '@midwayjs/logger';
+import * as crypto from 'crypto';
+import * as fs from 'fs';
+import * as path from 'path';
+import { IncrementalBase, RenderParams } from '@/types';
+
+// 缓存条目中的相机结果文件名，cam0 对应任务本身的输出
+const CACHE_IMAGE_REGEX = /^cam(\d+)\.jpg$/;
+// 按场景记录最近一次缓存的结果，增量渲染从这里找基础图
+const SCENE_INDEX_DIR = 'scenes';
+
+export interface RenderCacheKey {
+  key: string;
+  // 除替换列表之外的渲染输入，相同时可以在彼此的结果上做增量渲染
+  sceneKey: string;
+  // 每个替换目标对应的FBX版本
+  replacements: Record<string, string>;
+}
+
+/**
+ * 渲染结果缓存
+ * 按模型文件内容、替换列表、质量和渲染设置计算内容哈希，相同配置的请求直接复用已渲染的图片
+ * 同一配置正在渲染时，后到的请求等待它完成后从缓存读取
+ */
+@Provide()
+@Scope(ScopeEnum.Singleton)
+export class RenderCacheService {
+  @Inject()
+  logger: ILogger;
+
+  @Config('render')
+  renderConfig: {
+    resultCache: {
+      enabled: boolean;
+      dir: string;
+      maxBytes: number;
+    };
+  };
+
+  // 模型文件内容哈希，按路径、修改时间和大小缓存，避免重复读取大文件
+  private fileHashes: Map<string, { version: string; hash: string }> =
+    new Map();
+  private inflight: Map<string, Promise<unknown>> = new Map();
+
+  get enabled(): boolean {
+    return !!this.renderConfig.resultCache?.enabled;
+  }
+
+  /**
+   * 计算任务清单的缓存键，只包含影响渲染结果的字段
+   */
+  async computeKey(manifest: RenderParams): Promise<RenderCacheKey> {
+    const blendStat = await fs.promises.stat(manifest.blendFilePath);
+    const blendHash = await this.hashFile(manifest.blendFilePath, blendStat);
+    const sceneKey = this.hash(
+      JSON.stringify({
+        blend: {
+          path: manifest.blendFilePath,
+          mtime: blendStat.mtimeMs,
+          size: blendStat.size,
+          hash: blendHash,
+        },
+        quality: manifest.quality,
+        device: manifest.device,
+        timeBudget: manifest.timeBudget,
+        simplify: manifest.simplify,
+        sampling: manifest.sampling,
+      })
+    );
+
+    const replacements: Record<string, string> = {};
+    for (const item of manifest.replacementItems || []) {
+      const stat = await fs.promises.stat(item.fbx).catch(() => null);
+      replacements[item.target] = JSON.stringify([
+        item.fbx,
+        item.collection_name,
+        stat?.mtimeMs ?? null,
+        stat?.size ?? null,
+      ]);
+    }
+
+    const sortedReplacements = Object.keys(replacements)
+      .sort()
+      .map(target => [target, replacements[target]]);
+    return {
+      key: this.hash(JSON.stringify([sceneKey, sortedReplacements])),
+      sceneKey,
+      replacements,
+    };
+  }
+
+  /**
+   * 查找同一场景最近缓存的结果作为增量渲染的基础图，返回替换有变化的目标
+   */
+  async findIncrementalBase(
+    cacheKey: RenderCacheKey
+  ): Promise<IncrementalBase | null> {
+    const { dir } = this.renderConfig.resultCache;
+    try {
+      const index = JSON.parse(
+        await fs.promises.readFile(
+          path.join(dir, SCENE_INDEX_DIR, `${cacheKey.sceneKey}.json`),
+          'utf-8'
+        )
+      ) as { key: string; replacements: Record<string, string> };
+      const baseDir = path.join(dir, index.key);
+      const footprints = JSON.parse(
+        await fs.promises.readFile(
+          path.join(baseDir, 'footprints.json'),
+          'utf-8'
+        )
+      ).cameras;
+
+      const targets = new Set([
+        ...Object.keys(index.replacements),
+        ...Object.keys(cacheKey.replacements),
+      ]);
+      const changedTargets = [...targets].filter(
+        target => index.replacements[target] !== cacheKey.replacements[target]
+      );
+      if (changedTargets.length === 0) {
+        return null;
+      }
+      return { baseDir, changedTargets, footprints };
+    } catch (error) {
+      return null;
+    }
+  }
+
+  /**
+   * 同一缓存键正在执行的渲染
+   */
+  getInflight(key: string): Promise<unknown> | undefined {
+    return this.inflight.get(key);
+  }
+
+  /**
+   * 登记正在执行的渲染，完成后自动移除
+   */
+  trackInflight<T>(key: string, execution: Promise<T>): Promise<T> {
+    this.inflight.set(key, execution);
+    const clear = () => {
+      if (this.inflight.get(key) === execution) {
+        this.inflight.delete(key);
+      }
+    };
+    execution.then(clear, clear);
+    return execution;
+  }
+
+  /**
+   * 命中缓存时把图片复制到任务输出目录，返回各相机结果的任务ID，未命中返回 null
+   */
+  async restore(
+    key: string,
+    taskId: string,
+    outputDir: string
+  ): Promise<string[] | null> {
+    const entryDir = path.join(this.renderConfig.resultCache.dir, key);
+    let files: string[];
+    try {
+      files = await fs.promises.readdir(entryDir);
+    } catch (error) {
+      return null;
+    }
+
+    const images = files
+      .map(file => ({ file, match: file.match(CACHE_IMAGE_REGEX) }))
+      .filter(({ match }) => match)
+      .map(({ file, match }) => ({ file, index: Number(match[1]) }))
+      .sort((a, b) => a.index - b.index);
+    if (images.length === 0) {
+      return null;
+    }
+
+    await fs.promises.mkdir(outputDir, { recursive: true });
+    const taskIds: string[] = [];
+    for (const { file, index } of images) {
+      const currentTaskId = index > 0 ? `${taskId}_cam${index}` : taskId;
+      await fs.promises.copyFile(
+        path.join(entryDir, file),
+        path.join(outputDir, `${currentTaskId}.jpg`)
+      );
+      taskIds.push(currentTaskId);
+    }
+
+    // 更新修改时间，作为LRU的最近使用时间
+    const now = new Date();
+    await fs.promises.utimes(entryDir, now, now).catch(() => undefined);
+    this.logger.info(`命中渲染缓存[${key}]: ${taskId}, ${taskIds.length}张`);
+    return taskIds;
+  }
+
+  /**
+   * 把任务的渲染结果写入缓存，先写临时目录再原子重命名
+   */
+  async store(cacheKey: RenderCacheKey, taskId: string, outputDir: string) {
+    const { key } = cacheKey;
+    const { dir } = this.renderConfig.resultCache;
+    const entryDir = path.join(dir, key);
+    const resultRegex = new RegExp(`^${taskId}(?:_cam(\\d+))?\\.jpg$`);
+    try {
+      const files = (await fs.promises.readdir(outputDir))
+        .map(file => ({ file, match: file.match(resultRegex) }))
+        .filter(({ match }) => match);
+      if (files.length === 0) {
+        return;
+      }
+
+      const tmpDir = `${entryDir}.${process.pid}.${Date.now()}.tmp`;
+      await fs.promises.mkdir(tmpDir, { recursive: true });
+      for (const { file, match } of files) {
+        await fs.promises.copyFile(
+          path.join(outputDir, file),
+          path.join(tmpDir, `cam${Number(match[1] || 0)}.jpg`)
+        );
+      }
+      // 各相机中替换目标的画面区域，增量渲染时用来确定需要重新渲染的区域
+      await fs.promises
+        .copyFile(
+          path.join(outputDir, `${taskId}_footprints.json`),
+          path.join(tmpDir, 'footprints.json')
+        )
+        .catch(() => undefined);
+      await fs.promises.rm(entryDir, { recursive: true, force: true });
+      await fs.promises.rename(tmpDir, entryDir);
+
+      const indexDir = path.join(dir, SCENE_INDEX_DIR);
+      await fs.promises.mkdir(indexDir, { recursive: true });
+      await fs.promises.writeFile(
+        path.join(indexDir, `${cacheKey.sceneKey}.json`),
+        JSON.stringify({ key, replacements: cacheKey.replacements })
+      );
+      this.logger.info(`写入渲染缓存[${key}]: ${taskId}, ${files.length}张`);
+
+      await this.evict();
+    } catch (error) {
+      this.logger.error(`写入渲染缓存失败[${key}]: ${error.message}`);
+    }
+  }
+
+  /**
+   * 按最近使用时间淘汰缓存条目，直到总大小低于上限
+   */
+  private async evict() {
+    const { dir, maxBytes } = this.renderConfig.resultCache;
+    const entries: { path: string; mtime: number; size: number }[] = [];
+    for (const name of await fs.promises.readdir(dir)) {
+      if (name.endsWith('.tmp') || name === SCENE_INDEX_DIR) {
+        continue;
+      }
+      const entryDir = path.join(dir, name);
+      try {
+        const stat = await fs.promises.stat(entryDir);
+        let size = 0;
+        for (const file of await fs.promises.readdir(entryDir)) {
+          size += (await fs.promises.stat(path.join(entryDir, file))).size;
+        }
+        entries.push({ path: entryDir, mtime: stat.mtimeMs, size });
+      } catch (error) {
+        continue;
+      }
+    }
+
+    let totalSize = entries.reduce((sum, entry) => sum + entry.size, 0);
+    for (const entry of entries.sort((a, b) => a.mtime - b.mtime)) {
+      if (totalSize <= maxBytes) {
+        break;
+      }
+      await fs.promises.rm(entry.path, { recursive: true, force: true });
+      totalSize -= entry.size;
+      this.logger.info(`淘汰渲染缓存: ${entry.path}`);
+    }
+  }
+
+  private hash(source: string): string {
+    return crypto.createHash('sha256').update(source).digest('hex');
+  }
+
+  private async hashFile(filePath: string, stat: fs.Stats): Promise<string> {
+    const version = `${stat.mtimeMs}:${stat.size}`;
+    const cached = this.fileHashes.get(filePath);
+    if (cached?.version === version) {
+      return cached.hash;
+    }
+    const hash = await new Promise<string>((resolve, reject) => {
+      const digest = crypto.createHash('sha1');
+      fs.createReadStream(filePath)
+        .on('data', chunk => digest.update(chunk))
+        .on('end', () => resolve(digest.digest('hex')))
+        .on('error', reject);
+    });
+    this.fileHashes.set(filePath, { version, hash });
+    return hash;
+  }
+}
@@ -1,9 +1,10 @@
-import { Provide, Inject, Scope, ScopeEnum } from '@midwayjs/core';
+import { Provide, Inject, Config, Scope, ScopeEnum } from '@midwayjs/core';
 import { TaskMessage, TaskResult } from '../interface/task';
 import { ILogger } from '@midwayjs/logger';
 import { TaskSchedulerService } from './taskSchedulerService';
 import { GeneratePythonScriptService } from './createPythonScript';
 import { IRenderTaskType } from '@/constant';
+import { SceneIndexService } from './sceneIndexService';
 
 @Provide()
 @Scope(ScopeEnum.Request, { allowDowngrade: true })
@@ -17,6 +18,14 @@ export class RenderTaskService {
   @Inject()
   GeneratePythonScriptService: GeneratePythonScriptService;
 
+  @Inject()
+  sceneIndex: SceneIndexService;
+
+  @Config('model')
+  modelConfig: {
+    modelDir: string;
+  };
+
   /**
    * 处理渲染任务
    * @param task 任务信息
@@ -48,8 +57,30 @@ export class RenderTaskService {
 
   /**
    * 创建新的渲染任务
+   * 模型已有场景索引时先校验替换目标并估算渲染成本，没有索引时在后台生成，不阻塞请求
    */
   async createRenderTask(data: IRenderTaskType): Promise<TaskMessage> {
-    return this.taskScheduler.createTask('render', data);
+    const { modelName, materialList, renderParams } = data.payload || {};
+    const blendFilePath = `${this.modelConfig.modelDir}/${modelName}.blend`;
+    const index = await this.sceneIndex.peekIndex(blendFilePath);
+    if (!index) {
+      this.sceneIndex.prefetch(blendFilePath);
+      return this.taskScheduler.createTask('render', data);
+    }
+
+    const missingTargets = this.sceneIndex.findMissingTargets(
+      index,
+      (materialList || []).map(material => material.originalMaterialName)
+    );
+    if (missingTargets.length > 0) {
+      throw new Error(`模型中不存在替换目标: ${missingTargets.join(', ')}`);
+    }
+    return this.taskScheduler.createTask('render', {
+      ...data,
+      costEstimate: this.sceneIndex.estimateCost(
+        index,
+        renderParams?.quality || '1k'
+      ),
+    });
   }
 }
@@ -0,0 +1,198 @@
+import { Provide, Inject, Config, Scope, ScopeEnum } from '@midwayjs/core';
+import { ILogger } from '@midwayjs/logger';
+import { spawn } from 'child_process';
+import * as fs from 'fs';
+import * as readline from 'readline';
+import {
+  getBlenderEnv,
+  parseRenderEvent,
+  RENDER_SCRIPT_PATH,
+} from '@/utils/helper';
+import { RenderCostEstimate, SamplingProfile, SceneIndex } from '@/types';
+
+// 与 src/templates/blender_render.py 中的 SCENE_INDEX_VERSION 一致
+const SCENE_INDEX_VERSION = 1;
+
+// 各质量档位的分辨率和基准采样数，与渲染模板的 resolution_map、BASE_RENDER_PROFILE 一致
+// 配置 render.samplingProfiles 的档位按配置的采样数估算
+export const QUALITY_PROFILES: Record<
+  string,
+  { width: number; height: number; samples: number }
+> = {
+  '1k': { width: 1920, height: 1080, samples: 32 },
+  '2k': { width: 2560, height: 1440, samples: 32 },
+  '4k': { width: 3840, height: 2160, samples: 32 },
+};
+
+/**
+ * 模型场景索引
+ * 每个 .blend 只在 Blender 中索引一次，索引以 <blend>.index.json 保存在模型旁边，按修改时间和大小失效
+ * 接口据此校验替换目标和估算渲染成本，调度时不用再启动 Blender 探测相机
+ */
+@Provide()
+@Scope(ScopeEnum.Singleton)
+export class SceneIndexService {
+  @Inject()
+  logger: ILogger;
+
+  @Config('render')
+  renderConfig: {
+    blenderRunPath: string;
+    samplingProfiles: Record<string, SamplingProfile>;
+  };
+
+  private indexes: Map<string, SceneIndex> = new Map();
+  private indexing: Map<string, Promise<SceneIndex>> = new Map();
+
+  /**
+   * 读取场景索引，没有有效索引时启动 Blender 生成
+   */
+  async getIndex(blendFilePath: string): Promise<SceneIndex> {
+    const index = await this.peekIndex(blendFilePath);
+    if (index) {
+      return index;
+    }
+    let indexing = this.indexing.get(blendFilePath);
+    if (!indexing) {
+      indexing = this.buildIndex(blendFilePath);
+      this.indexing.set(blendFilePath, indexing);
+      const clear = () => this.indexing.delete(blendFilePath);
+      indexing.then(clear, clear);
+    }
+    return indexing;
+  }
+
+  /**
+   * 只读取已有的有效索引，不启动 Blender，没有时返回 null
+   */
+  async peekIndex(blendFilePath: string): Promise<SceneIndex | null> {
+    let stat: fs.Stats;
+    try {
+      stat = await fs.promises.stat(blendFilePath);
+    } catch (error) {
+      return null;
+    }
+    // 毫秒时间戳是浮点数，两端换算可能有微小误差
+    const isValid = (index: SceneIndex) =>
+      index.version === SCENE_INDEX_VERSION &&
+      Math.abs(index.blendMtimeMs - stat.mtimeMs) < 0.01 &&
+      index.blendSize === stat.size;
+
+    const cached = this.indexes.get(blendFilePath);
+    if (cached && isValid(cached)) {
+      return cached;
+    }
+    try {
+      const index = JSON.parse(
+        await fs.promises.readFile(this.getIndexPath(blendFilePath), 'utf-8')
+      ) as SceneIndex;
+      if (!isValid(index)) {
+        return null;
+      }
+      this.indexes.set(blendFilePath, index);
+      return index;
+    } catch (error) {
+      return null;
+    }
+  }
+
+  /**
+   * 在后台为模型生成索引，不等待结果
+   */
+  prefetch(blendFilePath: string) {
+    this.getIndex(blendFilePath).catch(error => {
+      this.logger.error(`生成场景索引失败[${blendFilePath}]: ${error.message}`);
+    });
+  }
+
+  /**
+   * 返回场景中不存在的替换目标
+   */
+  findMissingTargets(index: SceneIndex, targets: string[]): string[] {
+    return targets.filter(target => !index.objects[target]);
+  }
+
+  /**
+   * 按相机数、分辨率、采样数和场景规模估算渲染成本
+   */
+  estimateCost(
+    index: SceneIndex,
+    quality: string,
+    cameraCount = index.cameras.length
+  ): RenderCostEstimate {
+    const profile = this.getQualityProfile(quality);
+    // 没有相机时渲染模板会创建一个默认相机
+    const cameras = Math.max(1, cameraCount);
+    return {
+      cameras,
+      polygons: index.stats.polygons,
+      texturePixels: index.stats.texturePixels,
+      megaSamples:
+        (cameras * profile.width * profile.height * profile.samples) / 1e6,
+    };
+  }
+
+  /**
+   * 质量档位的分辨率和采样数，采样数优先使用配置的档位采样参数
+   */
+  getQualityProfile(quality: string): {
+    width: number;
+    height: number;
+    samples: number;
+  } {
+    const profile = QUALITY_PROFILES[quality] || QUALITY_PROFILES['1k'];
+    const sampling = this.renderConfig.samplingProfiles?.[quality];
+    return sampling?.samples
+      ? { ...profile, samples: sampling.samples }
+      : profile;
+  }
+
+  private getIndexPath(blendFilePath: string): string {
+    return `${blendFilePath}.index.json`;
+  }
+
+  private async buildIndex(blendFilePath: string): Promise<SceneIndex> {
+    const startTime = Date.now();
+    await new Promise<void>((resolve, reject) => {
+      const child = spawn(
+        this.renderConfig.blenderRunPath || 'blender',
+        [
+          '--background',
+          '--python',
+          RENDER_SCRIPT_PATH,
+          '--',
+          '--index',
+          blendFilePath,
+        ],
+        { env: getBlenderEnv() }
+      );
+      let indexed = false;
+      readline
+        .createInterface({ input: child.stdout, crlfDelay: Infinity })
+        .on('line', line => {
+          if (parseRenderEvent(line)?.phase === 'index') {
+            indexed = true;
+          }
+        });
+      child.on('error', reject);
+      child.on('close', code => {
+        if (indexed) {
+          resolve();
+        } else {
+          reject(new Error(`生成场景索引失败，退出码: ${code}`));
+        }
+      });
+    });
+
+    const index = await this.peekIndex(blendFilePath);
+    if (!index) {
+      throw new Error(`场景索引不可用: ${this.getIndexPath(blendFilePath)}`);
+    }
+    this.logger.info(
+      `已生成场景索引: ${blendFilePath}, ${index.cameras.length}个相机, ${
+        index.stats.objects
+      }个对象, 耗时 ${Date.now() - startTime}ms`
+    );
+    return index;
+  }
+}
@@ -13,6 +13,25 @@ import { LogService } from './log.service';
 import { IRenderTaskTypeFromTask, LOG_STAGE } from '@/constant';
 import { ArchiveService } from './archive.service';
 import { FileService } from './file.service';
+import {
+  BlenderWorkerPoolService,
+  RenderProcessHandle,
+} from './blenderWorkerPoolService';
+import {
+  getBlenderEnv,
+  parseRenderEvent,
+  readCompletedCameras,
+  readProcessRssMb,
+  RENDER_SCRIPT_PATH,
+  withCpuAffinity,
+} from '@/utils/helper';
+import { RenderEvent } from '@/interface/task';
+import { RenderParams } from '@/types';
+import { CpuAllocatorService } from './cpuAllocatorService';
+import { ClientCallbackService } from './clientCallback.service';
+import { EncodeService } from './encodeService';
+import { DenoiseService } from './denoiseService';
+import { TaskCostService } from './taskCostService';
 
 const mkdirAsync = promisify(fs.mkdir);
 // Replace deprecated fs.exists with fs.access
@@ -38,9 +57,28 @@ export class ScriptExecutorService {
   @Inject()
   fileService: FileService;
 
+  @Inject()
+  workerPool: BlenderWorkerPoolService;
+
+  @Inject()
+  cpuAllocator: CpuAllocatorService;
+
+  @Inject()
+  clientCallbackService: ClientCallbackService;
+
+  @Inject()
+  encodeService: EncodeService;
+
+  @Inject()
+  denoiseService: DenoiseService;
+
+  @Inject()
+  taskCost: TaskCostService;
+
   @Config('render')
   renderConfig: {
     outputDir: string;
+    memorySampleInterval: number;
   };
 
   @Config('task')
@@ -53,15 +91,15 @@ export class ScriptExecutorService {
   private pythonProcesses: Map<string, any> = new Map();
 
   /**
-   * 执行Python脚本
+   * 执行渲染任务
    * @param taskId 任务ID
-   * @param scriptPath 脚本路径
-   * @param args 脚本参数
+   * @param manifest 渲染任务清单
+   * @param params 任务参数
    * @returns 执行结果
    */
   async executeScript(
     taskId: string,
-    scriptPath: string,
+    manifest: RenderParams,
     params: IRenderTaskTypeFromTask
   ): Promise<{
     success: boolean;
@@ -91,21 +129,21 @@ export class ScriptExecutorService {
       }
 
       // 记录开始执行日志
-      this.logger.info(`开始执行脚本: ${scriptPath}, 任务ID: ${taskId}`);
+      this.logger.info(`开始执行渲染任务: ${taskId}`);
 
       this.logService.addLog(
         taskId,
         LOG_STAGE.processing,
         `[${moment().format(
           'YYYY-MM-DD HH:mm:ss'
-        )}] 开始执行脚本: ${scriptPath}, 任务ID: ${taskId}`
+        )}] 开始执行渲染任务, 任务ID: ${taskId}`
       );
 
       this.writeLog(
         logStream,
         `[${moment().format(
           'YYYY-MM-DD HH:mm:ss'
-        )}] 开始执行脚本: ${scriptPath}`
+        )}] 开始执行渲染任务, 模型: ${manifest.blendFilePath}`
       );
       this.writeLog(
         logStream,
@@ -130,20 +168,10 @@ export class ScriptExecutorService {
 
       return new Promise((resolve, reject) => {
         // 执行Python脚本
-        const pythonProcess = spawn(
-          process.env.BLENDER_PATH || 'blender',
-          ['--background', '--python', scriptPath],
-          {
-            env: {
-              ...process.env,
-              CUDA_VISIBLE_DEVICES: '0',
-              CYCLES_DEVICE: 'CUDA',
-              CYCLES_CUDA_USE_OPTIX: '0',
-              BLENDER_USER_SCRIPTS: process.env.BLENDER_USER_SCRIPTS || '',
-              BLENDER_SYSTEM_SCRIPTS: process.env.BLENDER_SYSTEM_SCRIPTS || '',
-            },
-          }
-        );
+        // 启用常驻 worker 池时复用已启动的 Blender 进程，否则每个任务单独启动
+        const pythonProcess: RenderProcessHandle = this.workerPool.enabled
+          ? this.workerPool.runJob(taskId, manifest)
+          : this.spawnRenderProcess(taskId, manifest);
 
         // 存储进程引用
         this.pythonProcesses.set(taskId, pythonProcess);
@@ -151,9 +179,22 @@ export class ScriptExecutorService {
         let lastProgress = 0;
         let totalOutput = '';
         let errorOutput = '';
+        let stdoutBuffer = '';
+        // 模板输出的阶段耗时事件，任务结束时写入任务数据
+        const timingProfile: RenderEvent[] = [];
+        // 各相机的降噪和编码结果，相机写出结果后立即开始，与后续相机的渲染并行
+        const postprocesses: Promise<Error | null>[] = [];
+
+        // 定期采样 Blender 进程的常驻内存，调度器按实际占用控制内存预算
+        let sampledPeakMb = 0;
+        const memorySampler = setInterval(async () => {
+          const rssMb = await readProcessRssMb(pythonProcess.pid);
+          if (rssMb !== null) {
+            sampledPeakMb = Math.max(sampledPeakMb, rssMb);
+            this.taskScheduler.reportMemory(taskId, rssMb);
+          }
+        }, this.renderConfig.memorySampleInterval);
 
-        // 创建进度匹配的正则表达式
-        const progressRegex = /正在处理: (\d+)\/(\d+)/;
         const errorRegex = /错误类型: (\w+)/;
 
         // 处理标准输出
@@ -177,36 +218,64 @@ export class ScriptExecutorService {
             )}] python script stdout: ${output.trim()}`
           );
 
-          // 尝试从输出中提取进度信息
-          const progressMatch = output.match(progressRegex);
-          if (progressMatch && progressMatch.length >= 3) {
-            const current = parseInt(progressMatch[1], 10);
-            const total = parseInt(progressMatch[2], 10);
-            if (!isNaN(current) && !isNaN(total) && total > 0) {
-              const progress = Math.floor((current / total) * 100);
-              if (progress > lastProgress) {
-                lastProgress = progress;
-                // 更新任务进度
-                this.taskScheduler
-                  .updateTaskProgress(taskId, progress)
-                  .catch(err => {
-                    this.logger.error(`更新任务进度失败: ${err.message}`);
-                    this.writeLog(
-                      logStream,
-                      `[${moment().format(
-                        'YYYY-MM-DD HH:mm:ss'
-                      )}] [错误] 更新任务进度失败: ${err.message}`
-                    );
-
-                    this.logService.addLog(
-                      taskId,
-                      LOG_STAGE.processing,
-                      `[${moment().format(
-                        'YYYY-MM-DD HH:mm:ss'
-                      )}] 更新任务进度失败: ${err.message}`
-                    );
-                  });
-              }
+          // 按行解析结构化事件，用相机完成事件驱动任务进度
+          stdoutBuffer += output;
+          const lines = stdoutBuffer.split('\n');
+          stdoutBuffer = lines.pop();
+          for (const line of lines) {
+            const event = parseRenderEvent(line);
+            if (!event) {
+              continue;
+            }
+            timingProfile.push(event);
+
+            if (event.phase !== 'camera' || !(event.total > 0)) {
+              continue;
+            }
+            // 分块结果由父任务拼接后再编码
+            const output: string = event.output || '';
+            if (
+              !manifest.tile &&
+              (output.endsWith('.exr') ||
+                (this.encodeService.enabled && output.endsWith('.png')))
+            ) {
+              postprocesses.push(
+                this.postprocess(
+                  manifest.outputDir,
+                  path.basename(output, path.extname(output))
+                ).then(
+                  () => null,
+                  error => error
+                )
+              );
+            }
+            // 100% 留给任务真正结束时设置
+            const progress = Math.min(
+              99,
+              Math.floor(((event.index + 1) / event.total) * 100)
+            );
+            if (progress > lastProgress) {
+              lastProgress = progress;
+              // 更新任务进度
+              this.taskScheduler
+                .updateTaskProgress(taskId, progress)
+                .catch(err => {
+                  this.logger.error(`更新任务进度失败: ${err.message}`);
+                  this.writeLog(
+                    logStream,
+                    `[${moment().format(
+                      'YYYY-MM-DD HH:mm:ss'
+                    )}] [错误] 更新任务进度失败: ${err.message}`
+                  );
+
+                  this.logService.addLog(
+                    taskId,
+                    LOG_STAGE.processing,
+                    `[${moment().format(
+                      'YYYY-MM-DD HH:mm:ss'
+                    )}] 更新任务进度失败: ${err.message}`
+                  );
+                });
             }
           }
         });
@@ -257,8 +326,14 @@ export class ScriptExecutorService {
         pythonProcess.on('close', async code => {
           // 移除进程引用
           this.pythonProcesses.delete(taskId);
+          clearInterval(memorySampler);
 
           const executionTime = Date.now() - startTime;
+          // 模板统计的峰值比采样准确，两者取较大值
+          const peakRssMb = Math.max(
+            sampledPeakMb,
+            ...timingProfile.map(event => event.peakRssMb || 0)
+          );
           this.writeLog(
             logStream,
             `[${moment().format(
@@ -275,11 +350,22 @@ export class ScriptExecutorService {
             logStream,
             `[${moment().format('YYYY-MM-DD HH:mm:ss')}] 执行时间: ${(
               executionTime / 1000
-            ).toFixed(2)}秒`
+            ).toFixed(2)}秒, 峰值内存: ${peakRssMb}MB`
           );
 
           try {
-            if (code === 0) {
+            // 渲染进程已结束，降噪和编码在独立的进程池中进行，提前让出执行槽
+            if (code === 0 && postprocesses.length > 0) {
+              this.taskScheduler.releaseRenderSlot(taskId);
+            }
+            // 结果缓存和增量渲染读取编码后的完整尺寸图片，降噪或编码失败按任务失败处理
+            const postprocessError =
+              code === 0
+                ? (await Promise.all(postprocesses)).find(Boolean)
+                : null;
+            if (code === 0 && !postprocessError) {
+              // 记录模型的峰值内存，之后同一模型的任务按此预留内存
+              await this.taskCost.recordPeakMemory(task, peakRssMb);
               // 成功执行
               this.writeLog(
                 logStream,
@@ -304,7 +390,9 @@ export class ScriptExecutorService {
                     ...task.data,
                     logFile: logFilePath,
                     executionTime,
+                    peakRssMb,
                     output: totalOutput,
+                    timingProfile,
                   },
                 }
               );
@@ -336,7 +424,21 @@ export class ScriptExecutorService {
               this.completeTaskAction(taskId);
               // 提取错误信息
               const errorMessage =
-                errorOutput || `脚本执行失败，退出码: ${code}`;
+                postprocessError?.message ||
+                errorOutput ||
+                `脚本执行失败，退出码: ${code}`;
+              // 已完成相机的结果保留在输出目录，同一任务再次执行时跳过
+              const completedCameras = await readCompletedCameras(
+                manifest.outputDir,
+                taskId
+              );
+              if (completedCameras.length > 0) {
+                this.logService.addLog(
+                  taskId,
+                  LOG_STAGE.completed,
+                  `已完成的相机: ${completedCameras.join(',')}，重新执行时跳过`
+                );
+              }
 
               // 更新任务状态为失败
               await this.taskScheduler.updateTaskStatus(
@@ -349,6 +451,9 @@ export class ScriptExecutorService {
                     logFile: logFilePath,
                     executionTime,
                     exitCode: code,
+                    peakRssMb,
+                    timingProfile,
+                    completedCameras,
                   },
                 }
               );
@@ -385,6 +490,7 @@ export class ScriptExecutorService {
 
         // 处理进程错误
         pythonProcess.on('error', async err => {
+          clearInterval(memorySampler);
           this.writeLog(
             logStream,
             `[${moment().format(
@@ -518,6 +624,64 @@ export class ScriptExecutorService {
     }
   }
 
+  /**
+   * 渲染结果命中缓存时直接完成任务，不启动 Blender
+   * @param taskId 任务ID
+   * @param resultTaskIds 已复制到输出目录的各相机结果
+   * @param params 任务参数
+   */
+  async completeFromCache(
+    taskId: string,
+    resultTaskIds: string[],
+    params: IRenderTaskTypeFromTask
+  ): Promise<{
+    success: boolean;
+    exitCode?: number;
+  }> {
+    const task = await this.taskScheduler.getTaskStatus(taskId);
+    await this.logService.addLog(
+      taskId,
+      LOG_STAGE.completed,
+      `[${moment().format('YYYY-MM-DD HH:mm:ss')}] 命中渲染缓存, ${
+        resultTaskIds.length
+      }张图片`
+    );
+
+    // 与渲染脚本相同，逐张上传并回调前端
+    await this.clientCallbackService.callbackTasksToClient(resultTaskIds, {
+      clientId: params?.clientId || '',
+      clientJwt: params?.clientJwt || '',
+      fileDataId: params?.projectId || '',
+    });
+
+    await this.taskScheduler.updateTaskStatus(taskId, TaskStatus.COMPLETED, {
+      progress: 100,
+      data: {
+        ...task?.data,
+        cacheHit: true,
+        executionTime: 0,
+      },
+    });
+    this.completeTaskAction(taskId);
+
+    return {
+      success: true,
+      exitCode: 0,
+    };
+  }
+
+  /**
+   * 相机结果的后处理：降噪延后时先降噪，启用编码阶段时再生成各个尺寸
+   */
+  private async postprocess(outputDir: string, cameraTaskId: string) {
+    if (this.denoiseService.enabled) {
+      await this.denoiseService.denoise(outputDir, cameraTaskId);
+    }
+    if (this.encodeService.enabled) {
+      await this.encodeService.encode(outputDir, cameraTaskId);
+    }
+  }
+
   async completeTaskAction(taskId: string) {
     await this.logService.addLog(
       taskId,
@@ -687,6 +851,26 @@ export class ScriptExecutorService {
     }
   }
 
+  /**
+   * 单独启动 Blender 执行一个任务清单，清单通过 stdin 传入
+   * CPU 渲染时把进程绑定到调度器分配给该任务的核心
+   */
+  private spawnRenderProcess(
+    taskId: string,
+    manifest: RenderParams
+  ): RenderProcessHandle {
+    const [command, args] = withCpuAffinity(
+      process.env.BLENDER_PATH || 'blender',
+      ['--background', '--python', RENDER_SCRIPT_PATH, '--', '--stdin'],
+      this.cpuAllocator.get(taskId)?.cores
+    );
+    const child = spawn(command, args, { env: getBlenderEnv() });
+    // 进程启动失败时 stdin 会报 EPIPE，错误由 error 事件统一处理
+    child.stdin.on('error', () => undefined);
+    child.stdin.end(JSON.stringify(manifest));
+    return child;
+  }
+
   /**
    * 写入日志
    */
@@ -0,0 +1,267 @@
+import {
+  Provide,
+  Inject,
+  Config,
+  Init,
+  Scope,
+  ScopeEnum,
+} from '@midwayjs/core';
+import { ILogger } from '@midwayjs/logger';
+import { RedisService } from '@midwayjs/redis';
+import { PrismaService } from '@/providers/prisma';
+import { TaskMessage } from '../interface/task';
+import { TaskStatus } from '../constant/taskStatus';
+import { QUALITY_PROFILES, SceneIndexService } from './sceneIndexService';
+
+export interface TaskCost {
+  // 预计执行耗时（毫秒）
+  expectedMs: number;
+  // 执行时占用的资源，1 个单位为一个 1k 画面，4k 画面占 4 个单位
+  weight: number;
+  // 预计 Blender 进程的峰值内存（MB）
+  memoryMb: number;
+}
+
+interface TaskWorkload {
+  modelName: string;
+  // 同一模型、质量和分块数的任务峰值内存相近，按该键记录
+  memoryKey: string;
+  megaSamples: number;
+  replacements: number;
+  weight: number;
+  framePixels: number;
+  polygons: number;
+  texturePixels: number;
+}
+
+/**
+ * 任务成本模型
+ * 按分辨率、相机数、替换数估算任务的执行耗时和资源占用，
+ * 每百万采样的耗时按模型从数据库中已完成任务的 startedAt/completedAt 校准，
+ * 峰值内存按模型记录在 Redis 中，没有记录时按场景规模估算
+ */
+@Provide()
+@Scope(ScopeEnum.Singleton)
+export class TaskCostService {
+  @Inject()
+  logger: ILogger;
+
+  @Inject()
+  redisService: RedisService;
+
+  @Inject()
+  sceneIndex: SceneIndexService;
+
+  @Config('task')
+  taskConfig: {
+    cost: {
+      baseMs: number; // 每个任务的固定开销（启动 Blender、加载场景）
+      replacementMs: number; // 每个替换项的开销
+      defaultMsPerMegaSample: number; // 没有历史数据时每百万采样的耗时
+      historySize: number; // 用于校准的最近完成任务数
+      minHistorySamples: number; // 模型至少有这么多历史任务才使用该模型自己的耗时
+      historyRefreshInterval: number; // 重新校准的间隔(毫秒)
+      baseMemoryMb: number; // 加载 Blender 和场景的基础内存
+      bytesPerPolygon: number;
+      bytesPerTexturePixel: number;
+      bytesPerFramePixel: number; // 渲染缓冲区和降噪占用
+      replacementMemoryMb: number; // 每个替换项导入的资源
+      memoryMargin: number; // 按记录的峰值内存估算时预留的余量
+    };
+  };
+
+  private readonly MODEL_MEMORY_KEY = 'render_task:model_memory'; // 各模型的峰值内存
+
+  private modelRates: Map<string, number> = new Map();
+  private globalRate: number | null = null;
+  private modelMemory: Map<string, number> = new Map();
+
+  @Init()
+  async init() {
+    // 不等待校准完成，数据库不可用时使用默认耗时
+    this.refreshHistory();
+    setInterval(
+      () => this.refreshHistory(),
+      this.taskConfig.cost.historyRefreshInterval
+    );
+  }
+
+  /**
+   * 估算任务的执行耗时和资源占用
+   */
+  estimate(task: TaskMessage): TaskCost {
+    const workload = this.getWorkload(task.data);
+    const { baseMs, replacementMs, defaultMsPerMegaSample } =
+      this.taskConfig.cost;
+    const rate =
+      this.modelRates.get(workload.modelName) ??
+      this.globalRate ??
+      defaultMsPerMegaSample;
+    return {
+      expectedMs: Math.round(
+        baseMs +
+          workload.replacements * replacementMs +
+          workload.megaSamples * rate
+      ),
+      weight: workload.weight,
+      memoryMb: this.estimateMemory(workload),
+    };
+  }
+
+  /**
+   * 记录任务实际的峰值内存，新记录不低于本次峰值，并逐渐吸收历史记录
+   */
+  async recordPeakMemory(task: TaskMessage, peakMb: number): Promise<void> {
+    const { memoryKey } = this.getWorkload(task.data);
+    if (!memoryKey || !(peakMb > 0)) {
+      return;
+    }
+    const previous = this.modelMemory.get(memoryKey);
+    const memoryMb = Math.round(
+      previous ? Math.max(peakMb, previous * 0.7 + peakMb * 0.3) : peakMb
+    );
+    this.modelMemory.set(memoryKey, memoryMb);
+    try {
+      await this.redisService.hset(
+        this.MODEL_MEMORY_KEY,
+        memoryKey,
+        String(memoryMb)
+      );
+    } catch (error) {
+      this.logger.error(`记录峰值内存失败: ${error.message}`);
+    }
+  }
+
+  /**
+   * 从最近完成的渲染任务重新计算各模型每百万采样的耗时，取中位数避免个别任务的影响，
+   * 同时读取各节点记录的峰值内存
+   */
+  async refreshHistory(): Promise<void> {
+    const { baseMs, replacementMs, historySize, minHistorySamples } =
+      this.taskConfig.cost;
+    try {
+      // 其它节点记录的峰值内存
+      const memory = await this.redisService.hgetall(this.MODEL_MEMORY_KEY);
+      for (const [memoryKey, memoryMb] of Object.entries(memory || {})) {
+        this.modelMemory.set(memoryKey, Number(memoryMb));
+      }
+    } catch (error) {
+      this.logger.error(`读取峰值内存记录失败: ${error.message}`);
+    }
+    try {
+      const tasks = await PrismaService.task.findMany({
+        where: {
+          type: 'render',
+          status: TaskStatus.COMPLETED,
+          startedAt: { not: null },
+          completedAt: { not: null },
+        },
+        orderBy: { completedAt: 'desc' },
+        take: historySize,
+        select: { data: true, startedAt: true, completedAt: true },
+      });
+
+      const samples: Map<string, number[]> = new Map();
+      for (const task of tasks) {
+        const data = task.data as TaskMessage['data'];
+        // 数据库中只有创建时的数据，拆分出子任务的多相机父任务的耗时包含子任务排队，不参与校准
+        if (!data?.parentTaskId && data?.costEstimate?.cameras !== 1) {
+          continue;
+        }
+        const workload = this.getWorkload(data);
+        const durationMs =
+          task.completedAt.getTime() - task.startedAt.getTime();
+        if (!workload.modelName || durationMs <= 0) {
+          continue;
+        }
+        const renderMs = Math.max(
+          durationMs - baseMs - workload.replacements * replacementMs,
+          durationMs / 2
+        );
+        const rates = samples.get(workload.modelName) || [];
+        rates.push(renderMs / workload.megaSamples);
+        samples.set(workload.modelName, rates);
+      }
+
+      const modelRates: Map<string, number> = new Map();
+      for (const [modelName, rates] of samples) {
+        if (rates.length >= minHistorySamples) {
+          modelRates.set(modelName, this.median(rates));
+        }
+      }
+      const allRates = ([] as number[]).concat(...samples.values());
+      this.modelRates = modelRates;
+      this.globalRate =
+        allRates.length >= minHistorySamples ? this.median(allRates) : null;
+      this.logger.info(
+        `任务耗时已校准: ${allRates.length}个历史任务, ${modelRates.size}个模型`
+      );
+    } catch (error) {
+      this.logger.error(`任务耗时校准失败: ${error.message}`);
+    }
+  }
+
+  private getWorkload(data: TaskMessage['data']): TaskWorkload {
+    let payload: any = {};
+    try {
+      payload =
+        typeof data?.payload === 'string'
+          ? JSON.parse(data.payload)
+          : data?.payload || {};
+    } catch (error) {
+      payload = {};
+    }
+    const profile = this.sceneIndex.getQualityProfile(
+      payload.renderParams?.quality
+    );
+    const baseProfile = QUALITY_PROFILES['1k'];
+    const tileCount = data?.tile ? data.tile.rows * data.tile.cols : 1;
+    // 子任务只渲染一个相机，没有场景索引时按单相机估算
+    const cameras = data?.parentTaskId ? 1 : data?.costEstimate?.cameras || 1;
+    const pixels = (profile.width * profile.height) / tileCount;
+    const modelName = payload.modelName || '';
+    const quality = payload.renderParams?.quality || '1k';
+    return {
+      modelName,
+      memoryKey: modelName ? `${modelName}:${quality}:${tileCount}` : '',
+      megaSamples: (cameras * pixels * profile.samples) / 1e6,
+      replacements: payload.materialList?.length || 0,
+      weight: pixels / (baseProfile.width * baseProfile.height),
+      framePixels: pixels,
+      polygons: data?.costEstimate?.polygons || 0,
+      texturePixels: data?.costEstimate?.texturePixels || 0,
+    };
+  }
+
+  private estimateMemory(workload: TaskWorkload): number {
+    const {
+      baseMemoryMb,
+      bytesPerPolygon,
+      bytesPerTexturePixel,
+      bytesPerFramePixel,
+      replacementMemoryMb,
+      memoryMargin,
+    } = this.taskConfig.cost;
+    const recorded = this.modelMemory.get(workload.memoryKey);
+    if (recorded) {
+      return Math.round(recorded * memoryMargin);
+    }
+    const bytes =
+      workload.polygons * bytesPerPolygon +
+      workload.texturePixels * bytesPerTexturePixel +
+      workload.framePixels * bytesPerFramePixel;
+    return Math.round(
+      baseMemoryMb +
+        workload.replacements * replacementMemoryMb +
+        bytes / 1024 / 1024
+    );
+  }
+
+  private median(values: number[]): number {
+    const sorted = [...values].sort((a, b) => a - b);
+    const middle = Math.floor(sorted.length / 2);
+    return sorted.length % 2
+      ? sorted[middle]
+      : (sorted[middle - 1] + sorted[middle]) / 2;
+  }
+}
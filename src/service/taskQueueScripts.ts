@@ -0,0 +1,31 @@
+// 多个节点共用任务队列时使用的 Lua 脚本，由 Redis 原子地执行
+
+// 原子领取任务: 从队列移除成功的任务加入处理中集合并写入租约，返回领取到的任务ID
+// KEYS: 队列、处理中集合、租约  ARGV: 租约到期时间、任务ID...
+export const CLAIM_TASKS_SCRIPT = `
+local claimed = {}
+for i = 2, #ARGV do
+  if redis.call('ZREM', KEYS[1], ARGV[i]) == 1 then
+    redis.call('SADD', KEYS[2], ARGV[i])
+    redis.call('ZADD', KEYS[3], ARGV[1], ARGV[i])
+    claimed[#claimed + 1] = ARGV[i]
+  end
+end
+return claimed
+`;
+
+// 把租约过期（或没有租约）的处理中任务放回队列最前面，返回放回的任务ID
+// KEYS: 队列、处理中集合、租约  ARGV: 当前时间
+export const RECOVER_TASKS_SCRIPT = `
+local recovered = {}
+for _, taskId in ipairs(redis.call('SMEMBERS', KEYS[2])) do
+  local expiresAt = redis.call('ZSCORE', KEYS[3], taskId)
+  if not expiresAt or tonumber(expiresAt) <= tonumber(ARGV[1]) then
+    redis.call('SREM', KEYS[2], taskId)
+    redis.call('ZADD', KEYS[1], 0, taskId)
+    recovered[#recovered + 1] = taskId
+  end
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', ARGV[1])
+return recovered
+`;
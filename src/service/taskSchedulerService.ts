@@ -20,6 +20,18 @@ import { v4 as uuidv4 } from 'uuid';
 import { RenderTaskService } from './renderTaskService';
 import { IRenderTaskType, LOG_STAGE } from '@/constant';
 import { LogService } from './log.service';
+import { CpuAllocatorService } from './cpuAllocatorService';
+import { ClientCallbackService } from './clientCallback.service';
+import { RenderCacheKey, RenderCacheService } from './renderCacheService';
+import { TileStitchService } from './tileStitchService';
+import { EncodeService } from './encodeService';
+import { TaskCost, TaskCostService } from './taskCostService';
+import { TileGrid } from '@/types';
+import { readCompletedCameras } from '@/utils/helper';
+import { CLAIM_TASKS_SCRIPT, RECOVER_TASKS_SCRIPT } from './taskQueueScripts';
+import * as fs from 'fs';
+import * as os from 'os';
+import * as path from 'path';
 
 @Provide('taskSchedulerService')
 @Scope(ScopeEnum.Singleton)
@@ -48,6 +60,29 @@ export class TaskSchedulerService {
   @Inject()
   logService: LogService;
 
+  @Inject()
+  cpuAllocator: CpuAllocatorService;
+
+  @Inject()
+  clientCallbackService: ClientCallbackService;
+
+  @Inject()
+  renderCache: RenderCacheService;
+
+  @Inject()
+  tileStitchService: TileStitchService;
+
+  @Inject()
+  encodeService: EncodeService;
+
+  @Inject()
+  taskCost: TaskCostService;
+
+  @Config('render')
+  renderConfig: {
+    outputDir: string;
+  };
+
   @Config('task')
   taskConfig: {
     maxConcurrentTasks: number; // 最大并发任务数
@@ -60,14 +95,37 @@ export class TaskSchedulerService {
         timeout?: number; // 特定任务类型的超时时间
       }
     >;
+    dispatch: {
+      resourceBudget: number; // 同时执行任务的资源预算
+      scanSize: number; // 每次调度考察的队列头部任务数
+      agingFactor: number; // 等待时间折算为预计耗时的系数
+      starvationMs: number; // 超过该等待时间后为任务保留资源
+      pollInterval: number; // 兜底轮询间隔(毫秒)
+      memoryBudgetMb: number; // 运行中 Blender 进程的内存预算
+    };
+    lease: {
+      ttl: number; // 租约有效期(毫秒)，节点停止续约后任务在过期时被其它节点接手
+      renewInterval: number; // 续约间隔(毫秒)
+      checkInterval: number; // 检查过期租约的间隔(毫秒)
+    };
   };
 
   private isProcessing = false;
+  private dispatchRequested = false;
   private currentRunningTasks = 0;
+  // 本节点运行中任务占用的资源
+  private runningWeights: Map<string, number> = new Map();
+  // 本节点持有租约的任务，定期续约
+  private leasedTaskIds: Set<string> = new Set();
+  // 本节点运行中任务预留的内存和采样到的常驻内存(MB)
+  private runningMemory: Map<string, { reservedMb: number; rssMb: number }> =
+    new Map();
 
   private readonly TASK_QUEUE_KEY = 'render_task:queue'; // 待处理任务队列
   private readonly TASK_PROCESSING_KEY = 'render_task:processing'; // 处理中任务集合
+  private readonly TASK_LEASE_KEY = 'render_task:leases'; // 处理中任务的租约到期时间
   private readonly TASK_INFO_PREFIX = 'render_task:queue:'; // 任务详情前缀
+  private readonly TASK_SUBTASKS_PREFIX = 'render_task:subtasks:'; // 父任务的子任务完成情况
   private readonly RABBITMQ_QUEUE = 'tasks'; // RabbitMQ队列名
 
   @Init()
@@ -136,6 +194,7 @@ export class TaskSchedulerService {
       this.logger.info(
         `创建任务[${task.type}], ID: ${task.id}, 优先级: ${priority}`
       );
+      this.processNextTasks();
 
       this.logService.addLog(
         task.id,
@@ -277,16 +336,47 @@ export class TaskSchedulerService {
       return false;
     }
 
+    // 已完成相机的结果保留在输出目录，记录在任务数据中
+    const outputTaskId = task.data?.parentTaskId || taskId;
+    const completedCameras = await readCompletedCameras(
+      path.join(this.renderConfig.outputDir, outputTaskId),
+      taskId
+    );
+
     // 更新任务状态为失败
     await this.updateTaskStatus(taskId, TaskStatus.FAILED, {
       error: '任务已被终止',
+      data: { ...task.data, completedCameras },
     });
 
     // 从处理中集合移除
-    await this.redisService.srem(this.TASK_PROCESSING_KEY, taskId);
+    await this.releaseProcessing(taskId);
 
-    // 更新当前运行任务数
-    this.currentRunningTasks = Math.max(0, this.currentRunningTasks - 1);
+    // 合并回调模式下进程被终止时还没有发送回调，发送已完成的相机
+    const payload = JSON.parse(task.data?.payload || '{}');
+    if (
+      payload?.renderParams?.coalesceCallback &&
+      !task.data?.parentTaskId &&
+      completedCameras.length > 0
+    ) {
+      this.clientCallbackService
+        .callbackTasksToClient(
+          completedCameras.map(index =>
+            index > 0 ? `${taskId}_cam${index}` : taskId
+          ),
+          {
+            clientId: task.data?.clientId || '',
+            clientJwt: task.data?.clientJwt || '',
+            fileDataId: task.data?.projectId || '',
+          }
+        )
+        .catch(error => {
+          this.logger.error(`终止任务的部分结果回调失败: ${error.message}`);
+        });
+    }
+
+    // 任务在本节点执行时立即让出执行槽，在其它节点执行时由该节点释放
+    this.releaseLocalSlot(taskId);
 
     // 通过RabbitMQ发送终止通知
     await this.rabbitmqService.sendMessage(this.RABBITMQ_QUEUE, {
@@ -298,92 +388,531 @@ export class TaskSchedulerService {
   }
 
   /**
-   * 从队列中获取下一个任务并处理
+   * 把多相机任务拆分为每个相机一个子任务，放回同一个队列由任意节点执行
+   * 指定分块网格时每个相机再拆成 rows x cols 个分块子任务
+   * 父任务不再占用执行槽，所有子任务完成后在状态消息处理中汇总
    */
-  private async processNextTasks(): Promise<void> {
-    // 如果已经在处理中，或达到最大并发限制，则退出
+  async fanOutTask(
+    parentTaskId: string,
+    cameraCount: number,
+    renderCacheKey?: RenderCacheKey,
+    tileGrid?: TileGrid
+  ): Promise<string[]> {
+    const parent = await this.getTaskStatus(parentTaskId);
+    if (!parent) {
+      throw new Error(`无法找到任务: ${parentTaskId}`);
+    }
+    // 子任务优先于新任务执行，尽快完成已经开始的任务
+    const priority = Math.max(0, (parent.priority ?? 10) - 1);
+    const tileCount = tileGrid ? tileGrid.rows * tileGrid.cols : 1;
+
+    await this.redisService.hset(
+      `${this.TASK_SUBTASKS_PREFIX}${parentTaskId}`,
+      'total',
+      String(cameraCount * tileCount)
+    );
+    await this.updateTaskStatus(parentTaskId, TaskStatus.PROCESSING, {
+      data: {
+        ...parent.data,
+        fannedOut: true,
+        cameraCount,
+        renderCacheKey,
+        tileGrid,
+      },
+    });
+
+    const subtaskIds: string[] = [];
+    for (let cameraIndex = 0; cameraIndex < cameraCount; cameraIndex++) {
+      for (let tileIndex = 0; tileIndex < tileCount; tileIndex++) {
+        const subtask: TaskMessage = {
+          id: uuidv4(),
+          type: parent.type,
+          data: {
+            ...parent.data,
+            parentTaskId,
+            cameraIndex,
+            tile: tileGrid ? { ...tileGrid, index: tileIndex } : undefined,
+          },
+          projectId: parent.projectId,
+          status: TaskStatus.PENDING,
+          createdAt: Date.now(),
+          updatedAt: Date.now(),
+          priority,
+          clientId: parent.clientId,
+          clientJwt: parent.clientJwt,
+        };
+        await this.redisService.set(
+          `${this.TASK_INFO_PREFIX}${subtask.id}`,
+          JSON.stringify(subtask)
+        );
+        await this.redisService.zadd(this.TASK_QUEUE_KEY, priority, subtask.id);
+        await this.taskPersistence.saveTask(subtask);
+        await this.rabbitmqService.sendMessage(this.RABBITMQ_QUEUE, {
+          taskId: subtask.id,
+          action: 'create',
+        });
+        subtaskIds.push(subtask.id);
+      }
+    }
+
+    // 父任务让出执行槽，之后的状态消息不再重复释放
+    await this.releaseProcessing(parentTaskId);
+    this.releaseLocalSlot(parentTaskId);
+    this.processNextTasks();
+
+    const subtaskCount = subtaskIds.length;
+    this.logger.info(
+      `任务[${parentTaskId}]拆分为 ${subtaskCount} 个子任务: ${subtaskIds.join(
+        ','
+      )}`
+    );
+    return subtaskIds;
+  }
+
+  /**
+   * 汇总子任务结果，更新父任务进度，全部完成后拼接分块、发送合并回调并结束父任务
+   */
+  private async aggregateSubtask(subtask: TaskMessage): Promise<void> {
+    const { parentTaskId, cameraIndex, tile } = subtask.data;
+    const subtasksKey = `${this.TASK_SUBTASKS_PREFIX}${parentTaskId}`;
+    // 按相机和分块记录结果，同一子任务的重复消息不会重复计数
+    await this.redisService.hset(
+      subtasksKey,
+      tile ? `cam:${cameraIndex}:tile:${tile.index}` : `cam:${cameraIndex}`,
+      subtask.status
+    );
+    if (subtask.status === TaskStatus.COMPLETED) {
+      // 记录写出该相机替换目标画面区域的子任务，分块子任务任取一个
+      await this.redisService.hset(
+        subtasksKey,
+        `footprints:${cameraIndex}`,
+        subtask.id
+      );
+    }
+    const state = await this.redisService.hgetall(subtasksKey);
+    const total = Number(state.total);
+    if (!total) {
+      return;
+    }
+    const finishedCount = Object.keys(state).filter(field =>
+      field.startsWith('cam:')
+    ).length;
+
+    if (finishedCount < total) {
+      await this.updateTaskProgress(
+        parentTaskId,
+        Math.min(99, Math.floor((finishedCount / total) * 100))
+      );
+      return;
+    }
+    // 多个节点可能同时看到全部完成，只由一个节点收尾
+    if (!(await this.redisService.hsetnx(subtasksKey, 'finalized', '1'))) {
+      return;
+    }
+
+    const parent = await this.getTaskStatus(parentTaskId);
+    const { cameraCount, tileGrid } = parent.data;
+    const outputDir = path.join(this.renderConfig.outputDir, parentTaskId);
+    const payload = JSON.parse(parent.data?.payload || '{}');
+
+    // 相机的所有分块都成功时才算该相机成功
+    const cameraSucceeded = Array.from({ length: cameraCount }, () => true);
+    for (const [field, status] of Object.entries(state)) {
+      if (field.startsWith('cam:') && status !== TaskStatus.COMPLETED) {
+        cameraSucceeded[Number(field.split(':')[1])] = false;
+      }
+    }
+    const cameraTaskIds = cameraSucceeded.map((_, index) =>
+      index > 0 ? `${parentTaskId}_cam${index}` : parentTaskId
+    );
+    // 拼接分块，再生成各尺寸的图片，缓存读取编码后的完整尺寸图片
+    const quality = payload?.renderParams?.quality || '1k';
+    await Promise.all(
+      cameraTaskIds.map(async (cameraTaskId, index) => {
+        if (!cameraSucceeded[index]) {
+          return;
+        }
+        try {
+          if (tileGrid) {
+            await this.tileStitchService.stitch(
+              outputDir,
+              cameraTaskId,
+              quality,
+              tileGrid
+            );
+          }
+          if (this.encodeService.enabled) {
+            await this.encodeService.encode(outputDir, cameraTaskId);
+          }
+        } catch (error) {
+          this.logger.error(`相机[${cameraTaskId}]${error.message}`);
+          cameraSucceeded[index] = false;
+        }
+      })
+    );
+    const outputTaskIds = cameraTaskIds.filter(
+      (_, index) => cameraSucceeded[index]
+    );
+    const failedCount = cameraCount - outputTaskIds.length;
+
+    // 合并回调模式和分块渲染下子任务不发送回调，由父任务发送
     if (
-      this.isProcessing ||
-      this.currentRunningTasks >= this.taskConfig.maxConcurrentTasks
+      (payload?.renderParams?.coalesceCallback || tileGrid) &&
+      outputTaskIds.length > 0
     ) {
-      return;
+      this.clientCallbackService
+        .callbackTasksToClient(outputTaskIds, {
+          clientId: parent.data?.clientId || '',
+          clientJwt: parent.data?.clientJwt || '',
+          fileDataId: parent.data?.projectId || '',
+        })
+        .catch(error => {
+          this.logger.error(`父任务合并回调失败: ${error.message}`);
+        });
     }
 
-    this.isProcessing = true;
+    if (failedCount === 0) {
+      if (parent.data?.renderCacheKey && this.renderCache.enabled) {
+        await this.mergeSubtaskFootprints(
+          outputDir,
+          parentTaskId,
+          cameraCount,
+          state
+        );
+        await this.renderCache.store(
+          parent.data.renderCacheKey,
+          parentTaskId,
+          outputDir
+        );
+      }
+      await this.updateTaskStatus(parentTaskId, TaskStatus.COMPLETED, {
+        progress: 100,
+        data: {
+          ...parent.data,
+          outputTaskIds,
+        },
+      });
+    } else {
+      await this.updateTaskStatus(parentTaskId, TaskStatus.FAILED, {
+        error: `${failedCount}/${cameraCount} 个相机渲染失败`,
+      });
+    }
+    await this.redisService.del(subtasksKey);
+  }
 
+  /**
+   * 把各相机子任务的 <subtaskId>_footprints.json 合并为父任务的 <taskId>_footprints.json，
+   * 与不拆分时渲染模板写出的格式一致，有相机缺少结果时不写，增量渲染回退为整帧渲染
+   */
+  private async mergeSubtaskFootprints(
+    outputDir: string,
+    parentTaskId: string,
+    cameraCount: number,
+    state: Record<string, string>
+  ): Promise<void> {
     try {
-      // 检查是否有可用的执行槽
-      const availableSlots =
-        this.taskConfig.maxConcurrentTasks - this.currentRunningTasks;
+      const cameras = await Promise.all(
+        Array.from({ length: cameraCount }, async (_, index) => {
+          const subtaskId = state[`footprints:${index}`];
+          if (!subtaskId) {
+            throw new Error(`相机 ${index} 没有子任务结果`);
+          }
+          const content = await fs.promises.readFile(
+            path.join(outputDir, `${subtaskId}_footprints.json`),
+            'utf-8'
+          );
+          return JSON.parse(content).cameras?.[0] || {};
+        })
+      );
+      await fs.promises.writeFile(
+        path.join(outputDir, `${parentTaskId}_footprints.json`),
+        JSON.stringify({ cameras })
+      );
+    } catch (error) {
+      this.logger.warn(
+        `合并子任务画面区域失败[${parentTaskId}]: ${error.message}`
+      );
+    }
+  }
 
-      if (availableSlots <= 0) {
+  /**
+   * 等待任务结束（完成、失败或已不存在），超过任务超时时间后不再等待
+   * 任务可能由任意节点结束，按间隔读取共享的任务状态
+   */
+  async waitForTaskFinished(taskId: string, interval = 1000): Promise<void> {
+    const deadline = Date.now() + this.taskConfig.taskTimeout;
+    while (Date.now() < deadline) {
+      const task = await this.getTaskStatus(taskId);
+      if (
+        !task ||
+        task.status === TaskStatus.COMPLETED ||
+        task.status === TaskStatus.FAILED
+      ) {
         return;
       }
+      await new Promise(resolve => setTimeout(resolve, interval));
+    }
+  }
 
-      // 从队列中获取下一批待处理任务ID（按照优先级）
-      const nextTaskIds = await this.redisService.zrange(
+  /**
+   * 从队列中选择任务执行
+   * 同一优先级内预计耗时短的任务先执行，等待时间按 agingFactor 折算抵扣预计耗时，
+   * 运行中任务占用的资源不超过 resourceBudget，内存不超过 memoryBudgetMb，
+   * 资源不足时后面放得下的任务可以先执行，等待超过 starvationMs 的任务不再被插队
+   */
+  private async processNextTasks(): Promise<void> {
+    // 正在调度时记下请求，本轮结束后再调度一次
+    if (this.isProcessing) {
+      this.dispatchRequested = true;
+      return;
+    }
+    if (this.currentRunningTasks >= this.taskConfig.maxConcurrentTasks) {
+      return;
+    }
+
+    this.isProcessing = true;
+    this.dispatchRequested = false;
+
+    try {
+      const { resourceBudget, scanSize, agingFactor, starvationMs } =
+        this.taskConfig.dispatch;
+      const memoryBudgetMb = this.getMemoryBudgetMb();
+      // 队列分数即优先级
+      const entries = await this.redisService.zrange(
         this.TASK_QUEUE_KEY,
         0,
-        availableSlots - 1
+        scanSize - 1,
+        'WITHSCORES'
       );
 
-      if (!nextTaskIds || nextTaskIds.length === 0) {
+      if (!entries || entries.length === 0) {
         return;
       }
 
-      // 批量处理这些任务
-      for (const taskId of nextTaskIds) {
-        // 从队列中移除任务
-        await this.redisService.zrem(this.TASK_QUEUE_KEY, taskId);
+      const taskIds: string[] = [];
+      const priorities: number[] = [];
+      for (let i = 0; i < entries.length; i += 2) {
+        taskIds.push(entries[i]);
+        priorities.push(Number(entries[i + 1]));
+      }
+      // 一次读取所有候选任务的详情
+      const taskJsons = await this.redisService.mget(
+        taskIds.map(taskId => `${this.TASK_INFO_PREFIX}${taskId}`)
+      );
+
+      const now = Date.now();
+      const candidates: {
+        task: TaskMessage;
+        priority: number;
+        cost: TaskCost;
+        waitMs: number;
+        score: number;
+      }[] = [];
+      const staleTaskIds: string[] = [];
+      for (let i = 0; i < taskIds.length; i++) {
+        if (!taskJsons[i]) {
+          staleTaskIds.push(taskIds[i]);
+          continue;
+        }
+        const task: TaskMessage = JSON.parse(taskJsons[i]);
+        const cost = this.taskCost.estimate(task);
+        const waitMs = now - task.createdAt;
+        candidates.push({
+          task,
+          priority: priorities[i],
+          cost,
+          waitMs,
+          score: cost.expectedMs - agingFactor * waitMs,
+        });
+      }
+      if (staleTaskIds.length > 0) {
+        // 任务不存在，从队列中移除
+        await this.redisService.zrem(this.TASK_QUEUE_KEY, ...staleTaskIds);
+      }
+      candidates.sort((a, b) => a.priority - b.priority || a.score - b.score);
+
+      // 先按资源预算选出要执行的任务并预占资源，再一次性领取
+      const selected: {
+        candidate: typeof candidates[number];
+        weight: number;
+        memoryMb: number;
+      }[] = [];
+      for (const candidate of candidates) {
+        if (this.currentRunningTasks >= this.taskConfig.maxConcurrentTasks) {
+          break; // 已达到最大并发，停止处理
+        }
+        // 超过预算的大任务在空闲时单独执行
+        const weight = Math.min(candidate.cost.weight, resourceBudget);
+        const memoryMb = Math.min(candidate.cost.memoryMb, memoryBudgetMb);
+        if (
+          this.getRunningWeight() + weight > resourceBudget ||
+          this.getRunningMemoryMb() + memoryMb > memoryBudgetMb
+        ) {
+          if (candidate.waitMs >= starvationMs) {
+            break; // 为等待过久的任务保留资源
+          }
+          continue;
+        }
+        this.currentRunningTasks++;
+        this.runningWeights.set(candidate.task.id, weight);
+        this.runningMemory.set(candidate.task.id, {
+          reservedMb: memoryMb,
+          rssMb: 0,
+        });
+        selected.push({ candidate, weight, memoryMb });
+      }
+      if (selected.length === 0) {
+        return;
+      }
 
-        // 获取任务详情
-        const taskJson = await this.redisService.get(
-          `${this.TASK_INFO_PREFIX}${taskId}`
-        );
+      // 多个节点可能同时选中同一个任务，由脚本原子地领取，只有领取成功的节点执行
+      const claimed = new Set(
+        await this.claimTasks(
+          selected.map(({ candidate }) => candidate.task.id)
+        )
+      );
 
-        if (!taskJson) {
-          continue; // 任务不存在，跳过
+      for (const { candidate, weight, memoryMb } of selected) {
+        const taskId = candidate.task.id;
+        if (!claimed.has(taskId)) {
+          // 已被其它节点领取，释放预占的资源，本轮结束后重新调度
+          this.releaseLocalSlot(taskId);
+          this.dispatchRequested = true;
+          continue;
         }
 
-        const task: TaskMessage = JSON.parse(taskJson);
+        const { expectedMs } = candidate.cost;
+        this.logger.info(
+          `调度任务[${taskId}], 预计耗时 ${expectedMs}ms, 资源 ${weight}, 内存 ${memoryMb}MB, 已等待 ${candidate.waitMs}ms`
+        );
 
         // 将任务标记为处理中
         await this.updateTaskStatus(taskId, TaskStatus.PROCESSING);
 
-        // 将任务添加到处理中集合
-        await this.redisService.sadd(this.TASK_PROCESSING_KEY, taskId);
-
-        // 更新当前运行任务数
-        this.currentRunningTasks++;
-
-        // 通过RabbitMQ发送任务开始执行的通知
-        await this.rabbitmqService.sendMessage(this.RABBITMQ_QUEUE, {
-          taskId: task.id,
-          action: 'start',
-        });
-
         // 异步执行任务
-        this.executeTask(task).catch(error => {
+        this.executeTask(candidate.task).catch(error => {
           this.logger.error(`任务执行失败[${taskId}]`, error);
         });
-
-        if (this.currentRunningTasks >= this.taskConfig.maxConcurrentTasks) {
-          break; // 已达到最大并发，停止处理
-        }
       }
     } catch (error) {
       this.logger.error('处理下一批任务时出错', error);
     } finally {
       this.isProcessing = false;
 
-      // 如果还有剩余的执行槽，继续处理下一批任务
-      if (this.currentRunningTasks < this.taskConfig.maxConcurrentTasks) {
-        // 延迟100ms，避免过于频繁查询Redis
-        setTimeout(() => this.processNextTasks(), 100);
+      if (this.dispatchRequested) {
+        setImmediate(() => this.processNextTasks());
       }
     }
   }
 
+  /**
+   * 记录执行器采样到的任务进程常驻内存
+   */
+  reportMemory(taskId: string, rssMb: number) {
+    const memory = this.runningMemory.get(taskId);
+    if (memory) {
+      memory.rssMb = rssMb;
+    }
+  }
+
+  /**
+   * 渲染进程结束后只剩降噪和编码时，提前让出执行槽、资源和 CPU 核心，
+   * 任务仍保持处理中并续约，结束时不再重复释放
+   */
+  releaseRenderSlot(taskId: string) {
+    if (!this.releaseLocalSlot(taskId)) {
+      return;
+    }
+    this.cpuAllocator.release(taskId);
+    this.processNextTasks();
+  }
+
+  /**
+   * 释放本节点为任务占用的执行槽、资源和内存，返回是否释放
+   * 只有执行任务的节点持有这些资源，重复调用或在其它节点调用时不做任何事
+   */
+  private releaseLocalSlot(taskId: string): boolean {
+    if (!this.runningWeights.has(taskId)) {
+      return false;
+    }
+    this.currentRunningTasks = Math.max(0, this.currentRunningTasks - 1);
+    this.runningWeights.delete(taskId);
+    this.runningMemory.delete(taskId);
+    return true;
+  }
+
+  /**
+   * 原子地把任务从队列移到处理中集合并写入租约，返回领取成功的任务ID
+   */
+  private async claimTasks(taskIds: string[]): Promise<string[]> {
+    const claimed = (await this.redisService.eval(
+      CLAIM_TASKS_SCRIPT,
+      3,
+      this.TASK_QUEUE_KEY,
+      this.TASK_PROCESSING_KEY,
+      this.TASK_LEASE_KEY,
+      Date.now() + this.taskConfig.lease.ttl,
+      ...taskIds
+    )) as string[];
+    for (const taskId of claimed) {
+      this.leasedTaskIds.add(taskId);
+    }
+    return claimed;
+  }
+
+  /**
+   * 任务结束或让出执行槽时移出处理中集合并删除租约
+   */
+  private async releaseProcessing(taskId: string): Promise<void> {
+    this.leasedTaskIds.delete(taskId);
+    await this.redisService
+      .multi()
+      .srem(this.TASK_PROCESSING_KEY, taskId)
+      .zrem(this.TASK_LEASE_KEY, taskId)
+      .exec();
+  }
+
+  /**
+   * 为本节点正在执行的任务续约，已结束或被回收的任务不会重新写入
+   */
+  private async renewLeases(): Promise<void> {
+    if (this.leasedTaskIds.size === 0) {
+      return;
+    }
+    const expiresAt = Date.now() + this.taskConfig.lease.ttl;
+    const members: (string | number)[] = [];
+    for (const taskId of this.leasedTaskIds) {
+      members.push(expiresAt, taskId);
+    }
+    await this.redisService.zadd(this.TASK_LEASE_KEY, 'XX', ...members);
+  }
+
+  private getRunningWeight(): number {
+    let weight = 0;
+    for (const value of this.runningWeights.values()) {
+      weight += value;
+    }
+    return weight;
+  }
+
+  /**
+   * 运行中任务的内存，实际占用超过预留时按实际占用计算
+   */
+  private getRunningMemoryMb(): number {
+    let memoryMb = 0;
+    for (const { reservedMb, rssMb } of this.runningMemory.values()) {
+      memoryMb += Math.max(reservedMb, rssMb);
+    }
+    return memoryMb;
+  }
+
+  private getMemoryBudgetMb(): number {
+    return (
+      this.taskConfig.dispatch.memoryBudgetMb ||
+      Math.floor((os.totalmem() / 1024 / 1024) * 0.8)
+    );
+  }
+
   /**
    * 执行任务
    */
@@ -403,6 +932,14 @@ export class TaskSchedulerService {
         throw new Error(`找不到处理函数: ${taskConfig.handler}`);
       }
 
+      // CPU 渲染时为任务分配一组独占核心，执行器据此绑定 Blender 进程
+      const cpuAssignment = this.cpuAllocator.acquire(task.id);
+      if (cpuAssignment) {
+        this.logger.info(
+          `任务[${task.id}]分配CPU核心: ${cpuAssignment.cores.join(',')}`
+        );
+      }
+
       // 设置任务超时
       const timeout = taskConfig.timeout || this.taskConfig.taskTimeout;
 
@@ -417,6 +954,11 @@ export class TaskSchedulerService {
         }),
       ])) as TaskResult;
 
+      // 已拆分为子任务，父任务的状态由子任务汇总更新
+      if (result.success && result.data?.fannedOut) {
+        return;
+      }
+
       // 更新任务状态
       if (result.success) {
         await this.updateTaskStatus(task.id, TaskStatus.COMPLETED, {
@@ -450,6 +992,13 @@ export class TaskSchedulerService {
         action: 'error',
         error: error.message || '任务执行出错',
       });
+    } finally {
+      this.cpuAllocator.release(task.id);
+      // 任务在本节点的执行已经结束，不再续约，由执行任务的节点让出执行槽
+      this.leasedTaskIds.delete(task.id);
+      if (this.releaseLocalSlot(task.id)) {
+        this.processNextTasks();
+      }
     }
   }
 
@@ -457,7 +1006,7 @@ export class TaskSchedulerService {
    * 任务处理循环
    */
   private startTaskProcessing(): void {
-    // 每秒检查一次是否有新任务需要处理
+    // 任务由创建和结束事件触发调度，定时检查只处理遗漏的任务
     setInterval(() => {
       if (
         !this.isProcessing &&
@@ -467,48 +1016,52 @@ export class TaskSchedulerService {
           this.logger.error('处理任务时出错', error);
         });
       }
-    }, 1000);
+    }, this.taskConfig.dispatch.pollInterval);
+
+    setInterval(() => {
+      this.renewLeases().catch(error => {
+        this.logger.error('任务续约失败', error);
+      });
+    }, this.taskConfig.lease.renewInterval);
+
+    // 所有节点都检查过期租约，停止续约的节点上的任务由其它节点接手
+    setInterval(async () => {
+      if ((await this.recoverProcessingTasks()) > 0) {
+        this.processNextTasks();
+      }
+    }, this.taskConfig.lease.checkInterval);
   }
 
   /**
-   * 恢复之前中断的任务
+   * 把租约已过期的处理中任务放回队列，返回放回的任务数
+   * 正常运行的节点会持续续约，只有已停止或失去响应的节点上的任务会被放回
    */
-  private async recoverProcessingTasks(): Promise<void> {
+  private async recoverProcessingTasks(): Promise<number> {
     try {
-      // 获取所有处理中的任务
-      const processingTaskIds = await this.redisService.smembers(
-        this.TASK_PROCESSING_KEY
-      );
+      const recoveredTaskIds = (await this.redisService.eval(
+        RECOVER_TASKS_SCRIPT,
+        3,
+        this.TASK_QUEUE_KEY,
+        this.TASK_PROCESSING_KEY,
+        this.TASK_LEASE_KEY,
+        Date.now()
+      )) as string[];
 
-      if (!processingTaskIds || processingTaskIds.length === 0) {
-        return;
+      if (!recoveredTaskIds || recoveredTaskIds.length === 0) {
+        return 0;
       }
 
-      this.logger.info(`恢复 ${processingTaskIds.length} 个中断的任务`);
+      this.logger.info(`恢复 ${recoveredTaskIds.length} 个租约过期的任务`);
 
-      // 将处理中的任务重新加入队列，优先处理
-      for (const taskId of processingTaskIds) {
-        const taskJson = await this.redisService.get(
-          `${this.TASK_INFO_PREFIX}${taskId}`
-        );
-
-        if (!taskJson) {
-          // 任务信息不存在，从处理中集合移除
-          await this.redisService.srem(this.TASK_PROCESSING_KEY, taskId);
-          continue;
-        }
-
-        const task: TaskMessage = JSON.parse(taskJson);
-
-        // 将任务状态改为等待中，并添加到队列最前面（优先级为0）
+      // 任务已放回队列最前面（优先级为0），将任务状态改为等待中
+      for (const taskId of recoveredTaskIds) {
         await this.updateTaskStatus(taskId, TaskStatus.PENDING);
-        await this.redisService.zadd(this.TASK_QUEUE_KEY, 0, taskId);
-        await this.redisService.srem(this.TASK_PROCESSING_KEY, taskId);
-
-        this.logger.info(`恢复任务[${taskId}] 类型: ${task.type}`);
+        this.logger.info(`恢复任务[${taskId}]`);
       }
+      return recoveredTaskIds.length;
     } catch (error) {
       this.logger.error('恢复中断任务时出错', error);
+      return 0;
     }
   }
 
@@ -551,7 +1104,12 @@ export class TaskSchedulerService {
 
           // 处理状态更新
           switch (action) {
+            case 'create':
+              // 其它节点创建的任务，本节点有空闲资源时立即调度
+              this.processNextTasks();
+              break;
             case 'statusUpdate': {
+              let finished = false;
               // 更新任务状态
               const updatedTask: TaskMessage = {
                 ...task,
@@ -569,18 +1127,14 @@ export class TaskSchedulerService {
                 !updatedTask.completedAt
               ) {
                 updatedTask.completedAt = timestamp;
-
-                // 从处理中集合移除
-                await this.redisService.srem(this.TASK_PROCESSING_KEY, taskId);
-
-                // 更新当前运行任务数
-                this.currentRunningTasks = Math.max(
-                  0,
-                  this.currentRunningTasks - 1
-                );
-
-                // 处理下一个任务
-                this.processNextTasks();
+                finished = true;
+
+                // 拆分后的父任务在拆分时已经移出处理中集合
+                // 消息可能由任意节点消费，这里只清理共享的处理中状态，
+                // 执行槽和资源由执行任务的节点在任务结束时释放
+                if (!updatedTask.data?.fannedOut) {
+                  await this.releaseProcessing(taskId);
+                }
               }
 
               // 更新Redis
@@ -589,6 +1143,11 @@ export class TaskSchedulerService {
               // 更新数据库
               await this.taskPersistence.saveTask(updatedTask);
 
+              // 子任务结束时汇总到父任务
+              if (finished && updatedTask.data?.parentTaskId) {
+                await this.aggregateSubtask(updatedTask);
+              }
+
               this.logger.info(
                 `任务状态已更新 [${taskId}]: ${task.status} -> ${status}`
               );
@@ -0,0 +1,80 @@
+import { Provide, Inject, Config, Scope, ScopeEnum } from '@midwayjs/core';
+import { ILogger } from '@midwayjs/logger';
+import { spawn } from 'child_process';
+import * as path from 'path';
+import * as readline from 'readline';
+import {
+  getBlenderEnv,
+  parseRenderEvent,
+  RENDER_SCRIPT_PATH,
+} from '@/utils/helper';
+import { TileGrid } from '@/types';
+
+/**
+ * 单帧分块渲染的拼接
+ * 分块保存在父任务的输出目录，多节点部署时各节点需要共享 render.outputDir
+ */
+@Provide()
+@Scope(ScopeEnum.Singleton)
+export class TileStitchService {
+  @Inject()
+  logger: ILogger;
+
+  @Config('render')
+  renderConfig: {
+    blenderRunPath: string;
+    encode: {
+      enabled: boolean;
+    };
+  };
+
+  /**
+   * 把一个相机的所有分块拼接为 <cameraTaskId>.jpg，成功后删除分块
+   * 启用编码阶段时输出无损的 <cameraTaskId>.png，由编码阶段生成最终图片
+   */
+  async stitch(
+    outputDir: string,
+    cameraTaskId: string,
+    quality: string,
+    grid: TileGrid
+  ): Promise<string> {
+    const extension = this.renderConfig.encode?.enabled ? 'png' : 'jpg';
+    const output = path.join(outputDir, `${cameraTaskId}.${extension}`);
+    const tiles = Array.from({ length: grid.rows * grid.cols }, (_, index) =>
+      path.join(outputDir, `${cameraTaskId}_tile${index}.png`)
+    );
+
+    await new Promise<void>((resolve, reject) => {
+      const child = spawn(
+        this.renderConfig.blenderRunPath || 'blender',
+        ['--background', '--python', RENDER_SCRIPT_PATH, '--', '--stitch'],
+        { env: getBlenderEnv() }
+      );
+      let stitched = false;
+      let stderr = '';
+      readline
+        .createInterface({ input: child.stdout, crlfDelay: Infinity })
+        .on('line', line => {
+          if (parseRenderEvent(line)?.phase === 'stitch') {
+            stitched = true;
+          }
+        });
+      child.stderr.on('data', data => {
+        // 只保留最后一段错误输出用于定位问题
+        stderr = `${stderr}${data}`.slice(-2000);
+      });
+      child.on('error', reject);
+      child.on('close', code => {
+        if (stitched) {
+          resolve();
+        } else {
+          reject(new Error(`分块拼接失败，退出码: ${code}, ${stderr.trim()}`));
+        }
+      });
+      child.stdin.end(JSON.stringify({ quality, ...grid, tiles, output }));
+    });
+
+    this.logger.info(`分块拼接完成: ${output}, ${tiles.length}块`);
+    return output;
+  }
+}
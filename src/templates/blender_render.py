@@ -2,9 +2,31 @@ import bpy # type: ignore
 import os
 import math
 from mathutils import Vector # type: ignore
+from bpy_extras.object_utils import world_to_camera_view # type: ignore
+import numpy as np
 import sys
+import json
+import re
+import time
+import hashlib
+import queue
+import shutil
+import argparse
+import threading
+import traceback
 import requests
 
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# 静态渲染模块，任务参数通过JSON任务清单传入:
+#   blender --background --python blender_render.py -- --manifest job.json
+#   blender --background --python blender_render.py -- --stdin
+# 清单可以是单个任务对象，也可以是任务列表（批量模式，在同一个进程中按顺序执行）
+# 常驻 worker (blender_worker.py) 直接 import 本模块并调用 run_manifests
+
 # 设置GPU环境变量
 os.environ['CUDA_VISIBLE_DEVICES'] = '0'
 os.environ['CYCLES_DEVICE'] = 'GPU'  # 改为GPU而不是CUDA
@@ -14,20 +36,11 @@ os.environ['CYCLES_CUDA_USE_OPTIX'] = '1'  # 启用OptiX
 os.environ['CYCLES_OPENIMAGEDENOISE_ROOT'] = ''  # 清空CPU降噪路径
 os.environ['CYCLES_DENOISING_TYPE'] = 'OPTIX'  # 强制指定降噪类型
 
-# 获取渲染文件路径参数
-taskId = "${taskId}"
-outputDir = "${outputDir}"
-blend_file_path = "${blendFilePath}"
-clientId = "${clientId}"
-clientJwt = "${clientJwt}"
-fileDataId = "${fileDataId}"
+# 结构化事件标记，ScriptExecutorService 按该前缀解析进度和阶段耗时
+EVENT_MARKER = "@@RENDER_EVENT@@"
 
-# 其他渲染参数
-try:
-    replacement_items = eval("${replacementItems}")
-except:
-    replacement_items = []
-quality = "${quality}"
+# 渲染完成通知发送到本服务
+CALLBACK_BASE_URL = "http://localhost:7001"
 
 # 设置渲染分辨率
 resolution_map = {
@@ -36,352 +49,1698 @@ resolution_map = {
     '4k': (3840, 2160)    # 4K
 }
 
+# 场景索引格式版本，字段变化时递增使旧索引失效
+SCENE_INDEX_VERSION = 1
+
+# 基准采样参数，所有质量档位默认使用；需要更高画质的档位由服务端配置，通过任务清单的 sampling 覆盖
+BASE_RENDER_PROFILE = {'samples': 32, 'adaptive_threshold': 0.2, 'adaptive_min_samples': 16}
+
+# 各质量档位的场景简化参数，4k 保持完整场景:
+#   texture_limit    Cycles 加载贴图的最大边长
+#   max_subdivision  细分修改器的最大级别
+#   child_particles  子粒子保留的比例
+#   decimate_ratio   导入的替换模型减面后保留的面数比例，减面结果单独缓存
+scene_profiles = {
+    '1k': {'texture_limit': '1024', 'max_subdivision': 1, 'child_particles': 0.25, 'decimate_ratio': 0.3},
+    '2k': {'texture_limit': '2048', 'max_subdivision': 2, 'child_particles': 0.5, 'decimate_ratio': 0.6}
+}
+# 面数少于该值的网格不做减面
+DECIMATE_MIN_POLYGONS = 5000
+
+# 缓存目录中超过该时间（秒）的临时文件视为写入中断遗留，淘汰时删除
+CACHE_TMP_MAX_AGE = 3600
+
+# 预览渲染: 先以低分辨率和少量采样渲染所有相机，尽快给客户端返回第一张图
+PREVIEW_WIDTH = 960
+PREVIEW_SAMPLES = 8
+PREVIEW_JPEG_QUALITY = 85
+
+# 增量渲染: 只重新渲染变化对象在画面中的区域，再合成到缓存的基础图上
+INCREMENTAL_PADDING = 0.05  # 区域向外扩展的比例，覆盖反射和阴影
+INCREMENTAL_MAX_AREA = 0.4  # 区域超过画面的该比例时改为整帧渲染
+INCREMENTAL_FEATHER = 0.02  # 渲染时再向外扩展的过渡带，合成时与基础图线性混合，消除接缝
+
+# 场景快照的格式版本，快照内容变化时递增使旧快照失效
+SNAPSHOT_VERSION = 1
+# 快照场景上记录各替换目标对应对象名的自定义属性
+SNAPSHOT_OBJECTS_PROP = "render_snapshot_objects"
+
+# 相机完成记录的格式版本，字段变化时递增使旧记录失效
+CHECKPOINT_VERSION = 1
+
+# 渲染统计中的采样进度，例如 "Sample 12/32"
+SAMPLE_REGEX = re.compile(r'Sample (\d+)/(\d+)')
+
+# 进程内状态，在批量模式和常驻 worker 的连续任务之间共享
+process_state = {
+    'devices': None,  # 检测到的渲染设备，按类型分组，只检测一次
+    'blend_path': None,  # 当前已加载的 .blend
+    'blend_mtime': None,
+    'scene_dirty': True,  # 场景被替换等操作修改过，下个任务需要重新加载
+}
+
+
+def get_memory_mb():
+    """返回当前进程的常驻内存和峰值内存（MB），峰值从上次 reset_peak_memory() 开始计算"""
+    rss_mb = None
+    peak_mb = None
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    rss_mb = int(line.split()[1]) / 1024
+                elif line.startswith('VmHWM:'):
+                    peak_mb = int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    if peak_mb is None and resource:
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return rss_mb, peak_mb
+
+
+def reset_peak_memory():
+    """重置进程的峰值内存，常驻 worker 中每个任务单独统计峰值（Linux 4.0+）"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def purge_orphans():
+    """删除替换后不再被引用的网格、材质、贴图等数据，释放内存"""
+    started_at = time.time()
+    if hasattr(bpy.data, "orphans_purge"):
+        removed = bpy.data.orphans_purge(do_local_ids=True, do_linked_ids=True, do_recursive=True)
+    else:
+        before = len(bpy.data.meshes) + len(bpy.data.materials) + len(bpy.data.images)
+        bpy.ops.outliner.orphans_purge(do_local_ids=True, do_linked_ids=True, do_recursive=True)
+        removed = before - len(bpy.data.meshes) - len(bpy.data.materials) - len(bpy.data.images)
+    print(f"已清理 {removed} 个无引用的数据块")
+    emit_event("purge", started_at, removed=removed)
+
+
+def emit_event(phase, started_at=None, **fields):
+    """输出一行JSON事件，started_at 用于计算阶段耗时"""
+    rss_mb, peak_mb = get_memory_mb()
+    event = {"phase": phase, **fields}
+    if started_at is not None:
+        event["durationMs"] = round((time.time() - started_at) * 1000)
+    event["rssMb"] = round(rss_mb, 1) if rss_mb is not None else None
+    event["peakRssMb"] = round(peak_mb, 1) if peak_mb is not None else None
+    print(f"{EVENT_MARKER} {json.dumps(event, ensure_ascii=False)}", flush=True)
+
+
 # --- 1. 加载blend文件 ---
-if not os.path.exists(blend_file_path):
-    error_msg = f"Blend文件未找到: {blend_file_path}"
-    print(error_msg)  # 使用新函数报告错误
+def load_blend(blend_file_path):
+    """加载blend文件，连续任务使用同一个未被修改的场景时直接复用"""
+    if not os.path.exists(blend_file_path):
+        error_msg = f"Blend文件未找到: {blend_file_path}"
+        print(error_msg)  # 使用新函数报告错误
+        mtime = None
+    else:
+        mtime = os.stat(blend_file_path).st_mtime_ns
 
-try:
-    bpy.ops.wm.open_mainfile(filepath=blend_file_path)
-except Exception as e:
-    print(f"加载Blend文件失败: {str(e)}")
-
-# 获取所有相机信息
-all_cameras = [obj for obj in bpy.data.objects if obj.type == 'CAMERA']
-camera_info = []
-
-for i, cam in enumerate(all_cameras):
-    camera_info.append({
-        'name': cam.name,
-        'index': i,
-        'location': list(cam.location),
-        'rotation': [math.degrees(angle) for angle in cam.rotation_euler],
-        'lens': cam.data.lens
-    })
+    if (not process_state['scene_dirty']
+            and process_state['blend_path'] == blend_file_path
+            and process_state['blend_mtime'] == mtime):
+        print(f"复用已加载的Blend文件: {blend_file_path}")
+        return
 
-print(f"找到 {len(camera_info)} 个相机")
-for cam in camera_info:
-    print(f"Camera {cam['index']}: {cam['name']}")
-    print(f"  位置: {cam['location']}")
-    print(f"  旋转: {cam['rotation']}")
-    print(f"  焦距: {cam['lens']} mm")
+    phase_started_at = time.time()
+    try:
+        bpy.ops.wm.open_mainfile(filepath=blend_file_path)
+    except Exception as e:
+        print(f"加载Blend文件失败: {str(e)}")
+    process_state['blend_path'] = blend_file_path
+    process_state['blend_mtime'] = mtime
+    process_state['scene_dirty'] = False
+    emit_event("load_blend", phase_started_at, file=blend_file_path)
+
+
+def get_scene_index_path(blend_file_path):
+    """场景索引保存在 .blend 旁边"""
+    return f"{blend_file_path}.index.json"
+
+
+def build_scene_index(blend_file_path):
+    """在未修改的场景上收集相机、对象包围盒和多边形/贴图统计，每个模型只需要一次"""
+    blend_stat = os.stat(blend_file_path)
+    cameras = []
+    objects = {}
+    polygons = 0
+    for obj in bpy.data.objects:
+        entry = {"type": obj.type}
+        if obj.type == 'CAMERA':
+            cameras.append({
+                'name': obj.name,
+                'index': len(cameras),
+                'location': list(obj.location),
+                'rotation': [math.degrees(angle) for angle in obj.rotation_euler],
+                'lens': obj.data.lens,
+                'sensorWidth': obj.data.sensor_width,
+                'matrixWorld': [list(row) for row in obj.matrix_world],
+            })
+        if obj.type == 'MESH':
+            corners = [obj.matrix_world @ Vector(corner) for corner in obj.bound_box]
+            entry["bbox"] = [
+                [min(corner[axis] for corner in corners) for axis in range(3)],
+                [max(corner[axis] for corner in corners) for axis in range(3)],
+            ]
+            entry["polygons"] = len(obj.data.polygons)
+            polygons += entry["polygons"]
+        objects[obj.name] = entry
+
+    textures = [
+        {"name": image.name, "size": list(image.size)}
+        for image in bpy.data.images
+        if image.source in {'FILE', 'TILED', 'GENERATED'} and image.size[0] > 0
+    ]
+    return {
+        "version": SCENE_INDEX_VERSION,
+        # 纳秒时间戳超出 JSON 数字的安全整数范围，以字符串保存；毫秒值供服务端校验
+        "blendMtimeNs": str(blend_stat.st_mtime_ns),
+        "blendMtimeMs": blend_stat.st_mtime_ns / 1e6,
+        "blendSize": blend_stat.st_size,
+        "cameras": cameras,
+        "objects": objects,
+        "stats": {
+            "objects": len(objects),
+            "meshes": sum(1 for entry in objects.values() if entry["type"] == 'MESH'),
+            "polygons": polygons,
+            "textures": len(textures),
+            "texturePixels": sum(texture["size"][0] * texture["size"][1] for texture in textures),
+        },
+        "textures": textures,
+    }
+
+
+def load_scene_index(blend_file_path):
+    """读取场景索引，.blend 修改后索引失效返回 None"""
+    try:
+        with open(get_scene_index_path(blend_file_path), encoding="utf-8") as f:
+            index = json.load(f)
+        blend_stat = os.stat(blend_file_path)
+    except (OSError, ValueError):
+        return None
+    if (index.get("version") != SCENE_INDEX_VERSION
+            or index.get("blendMtimeNs") != str(blend_stat.st_mtime_ns)
+            or index.get("blendSize") != blend_stat.st_size):
+        return None
+    return index
 
-if replacement_items and len(replacement_items) > 0:
-    def get_world_bbox_center(obj):
-        """计算对象的世界坐标几何中心"""
+
+def write_scene_index(blend_file_path):
+    """为已加载且未修改的场景生成索引，写入失败时只返回内存中的索引"""
+    started_at = time.time()
+    index = build_scene_index(blend_file_path)
+    index_path = get_scene_index_path(blend_file_path)
+    try:
+        tmp_path = f"{index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(tmp_path, index_path)
+    except OSError as e:
+        print(f"警告: 写入场景索引失败: {str(e)}")
+    emit_event("index", started_at, file=index_path, cameras=len(index["cameras"]), objects=len(index["objects"]))
+    return index
+
+
+def get_world_bbox_center(obj):
+    """计算对象的世界坐标几何中心"""
+    if obj.type != 'MESH' or not obj.data.vertices:
+        return obj.matrix_world.translation.copy()
+    # bound_box 第0个和第6个角点分别是局部包围盒的最小/最大角点，
+    # 仿射变换下8个角点的平均值等于中点的变换，只需做一次矩阵乘法
+    bbox = obj.bound_box
+    return obj.matrix_world @ ((Vector(bbox[0]) + Vector(bbox[6])) * 0.5)
+
+
+def get_world_bbox_centers(objects):
+    """批量计算一组对象的世界坐标几何中心
+
+    用 foreach_get 一次读出所有对象的包围盒和世界矩阵，在 numpy 中统一计算，
+    结果与 get_world_bbox_center 一致
+    """
+    if not objects:
+        return []
+    all_objects = bpy.data.objects
+    count = len(all_objects)
+    bounds = np.empty(count * 24, dtype=np.float32)
+    matrices = np.empty(count * 16, dtype=np.float32)
+    all_objects.foreach_get("bound_box", bounds)
+    all_objects.foreach_get("matrix_world", matrices)
+
+    positions = {obj.as_pointer(): i for i, obj in enumerate(all_objects)}
+    indices = np.array([positions[obj.as_pointer()] for obj in objects])
+    bounds = bounds.reshape(count, 8, 3)[indices]
+    # 矩阵按列存储，转置为按行
+    matrices = matrices.reshape(count, 4, 4)[indices].transpose(0, 2, 1)
+
+    local_centers = np.ones((len(objects), 4), dtype=np.float32)
+    local_centers[:, :3] = (bounds[:, 0] + bounds[:, 6]) * 0.5
+    # 非网格或空网格对象使用原点位置
+    for i, obj in enumerate(objects):
         if obj.type != 'MESH' or not obj.data.vertices:
-            return obj.matrix_world.translation
-        bbox_corners = [obj.matrix_world @ Vector(corner) for corner in obj.bound_box]
-        return sum(bbox_corners, Vector()) / 8
-
-    def replace_object(target_name, fbx_path, new_collection_name):
-        """替换单个对象的函数"""
-        # 获取目标对象
-        target_obj = bpy.data.objects.get(target_name)
-        if not target_obj:
-            print(f"警告: 未找到目标对象 {target_name}，跳过此替换")
-            return False
-
-        print(f"\n开始替换对象: {target_name}")
-        
-        # 记录原对象的世界坐标几何中心
-        original_center = get_world_bbox_center(target_obj)
-        print(f"原对象几何中心: {original_center}")
-
-        # 删除原对象
-        bpy.data.objects.remove(target_obj, do_unlink=True)
-
-        # 导入FBX
+            local_centers[i, :3] = 0.0
+    world_centers = np.einsum('nij,nj->ni', matrices, local_centers)
+    return [Vector(center[:3]) for center in world_centers]
+
+
+def get_asset_cache_path(fbx_path, asset_cache_dir, decimate_ratio=1.0):
+    """按FBX文件路径、修改时间和减面比例计算缓存库路径"""
+    mtime = os.stat(fbx_path).st_mtime_ns
+    key_source = f"{os.path.abspath(fbx_path)}:{mtime}"
+    if decimate_ratio < 1.0:
+        key_source += f":decimate={decimate_ratio}"
+    key = hashlib.sha1(key_source.encode('utf-8')).hexdigest()
+    return os.path.join(asset_cache_dir, f"{key}.blend")
+
+
+def evict_blend_cache(cache_dir, cache_max_bytes, label="FBX缓存"):
+    """按最近使用时间淘汰缓存目录中的 .blend，直到总大小低于上限
+
+    缓存库以不压缩的 .blend 保存，文件大小与加载后占用的内存基本成正比，用作内存占用的近似。
+    同时删除进程中断后遗留的过期临时文件。
+    """
+    entries = []
+    now = time.time()
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if name.endswith('.tmp'):
+            if now - stat.st_mtime > CACHE_TMP_MAX_AGE:
+                try:
+                    os.remove(path)
+                    print(f"删除过期的{label}临时文件: {path}")
+                except OSError:
+                    pass
+            continue
+        if not name.endswith('.blend'):
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= cache_max_bytes:
+            break
+        try:
+            os.remove(path)
+            total_size -= size
+            print(f"淘汰{label}: {path}")
+        except OSError:
+            pass
+
+
+def decimate_objects(objects, ratio):
+    """对网格对象减面，直接替换网格数据，返回减面前后的总面数"""
+    targets = [
+        obj for obj in objects
+        if obj.type == 'MESH' and not obj.modifiers and len(obj.data.polygons) >= DECIMATE_MIN_POLYGONS
+    ]
+    before = sum(len(obj.data.polygons) for obj in targets)
+    for obj in targets:
+        modifier = obj.modifiers.new("lod_decimate", 'DECIMATE')
+        modifier.decimate_type = 'COLLAPSE'
+        modifier.ratio = ratio
+    # 所有修改器添加完后统一求值一次
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    for obj in targets:
+        # 原网格不再被引用，在替换完成后统一清理
+        obj.data = bpy.data.meshes.new_from_object(obj.evaluated_get(depsgraph))
+        obj.modifiers.remove(obj.modifiers["lod_decimate"])
+    after = sum(len(obj.data.polygons) for obj in targets)
+    return before, after
+
+
+def import_fbx_objects(fbx_path, asset_cache_dir, asset_cache_max_bytes, decimate_ratio=1.0):
+    """导入FBX中的对象，命中缓存时直接从 .blend 缓存库追加，避免重复解析FBX
+
+    decimate_ratio 小于 1 时导入减面后的模型，减面结果与完整模型分别缓存
+    """
+    cache_path = get_asset_cache_path(fbx_path, asset_cache_dir, decimate_ratio)
+    if os.path.exists(cache_path):
+        try:
+            with bpy.data.libraries.load(cache_path, link=False) as (data_from, data_to):
+                data_to.objects = list(data_from.objects)
+            objects = [obj for obj in data_to.objects if obj is not None]
+            for obj in objects:
+                bpy.context.scene.collection.objects.link(obj)
+            # 更新修改时间，作为LRU的最近使用时间
+            os.utime(cache_path)
+            print(f"命中FBX缓存: {fbx_path}")
+            return objects
+        except Exception as e:
+            print(f"读取FBX缓存失败，重新导入: {str(e)}")
+
+    if decimate_ratio < 1.0:
+        # 从完整模型（及其缓存）减面，完整模型的缓存同时供 4k 任务使用
+        started_at = time.time()
+        objects = import_fbx_objects(fbx_path, asset_cache_dir, asset_cache_max_bytes)
+        before, after = decimate_objects(objects, decimate_ratio)
+        print(f"减面: {fbx_path} {before} -> {after} 面")
+        emit_event("decimate", started_at, fbx=fbx_path, ratio=decimate_ratio, polygons=before, decimatedPolygons=after)
+    else:
         bpy.ops.import_scene.fbx(filepath=fbx_path)
-        imported_objects = [obj for obj in bpy.context.selected_objects if obj.type == 'MESH']
-        if not imported_objects:
-            print(f"警告: FBX {fbx_path} 未导入任何网格对象")
-            return False
+        objects = list(bpy.context.selected_objects)
 
-        # 创建新集合并组织FBX对象
-        new_collection = bpy.data.collections.new(new_collection_name)
-        bpy.context.scene.collection.children.link(new_collection)
-        for obj in imported_objects:
-            new_collection.objects.link(obj)
+    # 写入缓存库，先写临时文件再原子替换，避免并发任务读到半个文件
+    try:
+        os.makedirs(asset_cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        bpy.data.libraries.write(tmp_path, set(objects), path_remap='ABSOLUTE', fake_user=True)
+        os.replace(tmp_path, cache_path)
+        evict_blend_cache(asset_cache_dir, asset_cache_max_bytes)
+    except Exception as e:
+        print(f"写入FBX缓存失败: {str(e)}")
+    return objects
 
-        # 计算偏移并移动FBX
-        imported_center = sum((get_world_bbox_center(obj) for obj in imported_objects), Vector()) / len(imported_objects)
-        offset = original_center - imported_center
 
-        for obj in imported_objects:
-            obj.location += offset
-            print(f"已移动 {obj.name} 到 {obj.location}")
+def move_to_collection(objects, collection_name):
+    """创建新集合，并把对象从原集合移动到新集合"""
+    new_collection = bpy.data.collections.new(collection_name)
+    bpy.context.scene.collection.children.link(new_collection)
+    for obj in objects:
+        for collection in list(obj.users_collection):
+            collection.objects.unlink(obj)
+        new_collection.objects.link(obj)
 
-        print(f"完成替换: {target_name}")
-        return True
 
-    # 执行批量替换
-    for item in replacement_items:
+def replace_objects_batched(items, asset_cache_dir, asset_cache_max_bytes, decimate_ratio=1.0):
+    """批量替换: 按FBX分组，每个FBX只导入一次，其余目标使用共享网格数据的关联副本
+
+    返回每个替换目标对应的新对象，用于计算增量渲染区域
+    """
+    replaced_objects = {}
+    # 按FBX分组，保持请求中的顺序
+    groups = {}
+    for item in items:
         if not os.path.exists(item["fbx"]):
             print(f"警告: FBX文件不存在: {item['fbx']}")
             continue
-            
-        success = replace_object(
-            item["target"],
-            item["fbx"],
-            item["collection_name"]
-        )
-        if success:
+        groups.setdefault(item["fbx"], []).append(item)
+
+    # 一次性记录所有目标对象的几何中心，然后批量删除
+    targets = []
+    seen_targets = set()
+    for fbx_items in groups.values():
+        for item in fbx_items:
+            if item["target"] in seen_targets:
+                print(f"警告: 重复的替换目标 {item['target']}，只执行第一次替换")
+                continue
+            target_obj = bpy.data.objects.get(item["target"])
+            if not target_obj:
+                print(f"警告: 未找到目标对象 {item['target']}，跳过此替换")
+                print(f"替换失败: {item['target']}")
+                continue
+            seen_targets.add(item["target"])
+            targets.append((item, target_obj))
+
+    target_centers = get_world_bbox_centers([obj for _, obj in targets])
+    original_centers = {}
+    for (item, target_obj), center in zip(targets, target_centers):
+        print(f"原对象几何中心: {item['target']} -> {center}")
+        original_centers[id(item)] = center
+    bpy.data.batch_remove([obj for _, obj in targets])
+
+    for fbx_path, fbx_items in groups.items():
+        fbx_items = [item for item in fbx_items if id(item) in original_centers]
+        if not fbx_items:
+            continue
+
+        print(f"\n导入FBX: {fbx_path}，替换 {len(fbx_items)} 个对象")
+        group_started_at = time.time()
+        imported_objects = [
+            obj for obj in import_fbx_objects(fbx_path, asset_cache_dir, asset_cache_max_bytes, decimate_ratio)
+            if obj.type == 'MESH'
+        ]
+        if not imported_objects:
+            print(f"警告: FBX {fbx_path} 未导入任何网格对象")
+            for item in fbx_items:
+                print(f"替换失败: {item['target']}")
+            continue
+
+        # 导入对象的中心和初始位置只计算一次，所有副本共用
+        imported_center = sum(get_world_bbox_centers(imported_objects), Vector()) / len(imported_objects)
+        base_locations = [obj.location.copy() for obj in imported_objects]
+
+        for index, item in enumerate(fbx_items):
+            # 第一个目标直接使用导入的对象，其余目标创建共享网格数据的关联副本
+            objects = imported_objects if index == 0 else [obj.copy() for obj in imported_objects]
+            move_to_collection(objects, item["collection_name"])
+
+            offset = original_centers[id(item)] - imported_center
+            for obj, base_location in zip(objects, base_locations):
+                obj.location = base_location + offset
+                print(f"已移动 {obj.name} 到 {obj.location}")
+
+            replaced_objects[item["target"]] = objects
             print(f"成功替换: {item['target']}")
-        else:
-            print(f"替换失败: {item['target']}")
-else:
-    print("没有需要替换的项目，跳过替换步骤")
-
-# 选择和设置相机
-if len(camera_info) > 0:
-    selected_camera = camera_info[0]
-    print(f"使用第一个相机: {selected_camera['name']}")
-    camera_object = bpy.data.objects[selected_camera['name']]
-else:
-    # 如果没有相机，创建一个新相机
-    print("场景中没有相机，创建默认相机")
-    new_camera = bpy.data.cameras.new(name='DefaultCamera')
-    camera_object = bpy.data.objects.new('DefaultCamera', new_camera)
-    bpy.context.scene.collection.objects.link(camera_object)
-    camera_object.location = (0, 0, 0)
-    camera_object.rotation_euler = (0, 0, 0)
-    camera_object.data.lens = 50
-
-# 确保相机是活动的并设置为场景相机
-bpy.context.view_layer.objects.active = camera_object
-bpy.context.scene.camera = camera_object  # 设置为场景相机
-
-# 设置渲染引擎为Cycles
-bpy.context.scene.render.engine = 'CYCLES'
-
-scene = bpy.context.scene
-cycles = scene.cycles
-
-
-# 🔧 强制启用 OptiX GPU 降噪
-# 注意：第一次使用时会编译内核，需要 2-5 分钟
-print("\n强制配置 OptiX GPU 降噪...")
-preferences = bpy.context.preferences
-cycles_prefs = preferences.addons['cycles'].preferences
-
-# 先刷新设备列表
-cycles_prefs.refresh_devices()
 
-try:
-    # 强制设置OptiX设备类型
-    cycles_prefs.compute_device_type = 'OPTIX'
-    
-    # 检查 OptiX 设备是否可用
-    optix_devices = [d for d in cycles_prefs.devices if d.type == 'OPTIX']
-    cuda_devices = [d for d in cycles_prefs.devices if d.type == 'CUDA']
-    
-    if optix_devices:
-        print(f"✓ 找到 {len(optix_devices)} 个 OptiX 设备")
-        # 启用所有 OptiX 设备
-        for device in optix_devices:
-            device.use = True
-            print(f"  ✓ 启用: {device.name}")
-        
-        # 同时启用CUDA设备作为计算设备，OptiX作为降噪设备
-        for device in cuda_devices:
-            device.use = True
-            print(f"  ✓ 启用计算设备: {device.name} (CUDA)")
-            
-        print("\n⚠️  重要提示：")
-        print("   第一次使用 OptiX 需要编译渲染内核")
-        print("   如果看到 'Loading render kernels' 消息，这是正常的")
-        print("   请耐心等待 2-5 分钟，编译完成后会自动继续")
-        print("   之后的渲染将直接使用缓存，无需再等待\n")
-        
-        # 强制设置GPU渲染和OptiX降噪
-        cycles.device = 'GPU'
-        
+        emit_event("replacement", group_started_at, fbx=fbx_path, targets=[item["target"] for item in fbx_items])
+
+    return replaced_objects
+
+
+def get_snapshot_path(manifest, replacement_items, decimate_ratio):
+    """按模型、替换列表和减面比例计算场景快照路径，模型或FBX修改后快照自动失效
+
+    快照中不包含渲染设置，不同质量档位的任务只要替换后的几何体相同就共用一个快照
+    """
+    blend_path = manifest["blendFilePath"]
+    if not os.path.exists(blend_path):
+        return None
+    items = [
+        [
+            item["target"],
+            os.path.abspath(item["fbx"]),
+            os.stat(item["fbx"]).st_mtime_ns if os.path.exists(item["fbx"]) else None,
+            item["collection_name"],
+        ]
+        for item in replacement_items
+    ]
+    key_source = json.dumps({
+        "version": SNAPSHOT_VERSION,
+        "blend": os.path.abspath(blend_path),
+        "mtime": os.stat(blend_path).st_mtime_ns,
+        "items": items,
+        "decimate": decimate_ratio,
+    }, sort_keys=True)
+    key = hashlib.sha1(key_source.encode('utf-8')).hexdigest()
+    return os.path.join(manifest["snapshotCacheDir"], f"{key}.blend")
+
+
+def load_scene_snapshot(snapshot_path):
+    """加载场景快照，返回各替换目标对应的对象，快照无法使用时返回 None"""
+    started_at = time.time()
+    load_blend(snapshot_path)
+    object_names = bpy.context.scene.get(SNAPSHOT_OBJECTS_PROP)
+    if object_names is None:
+        print(f"场景快照不可用，重新执行替换: {snapshot_path}")
+        process_state['scene_dirty'] = True
+        return None
+    # 更新修改时间作为LRU的最近使用时间，同时更新记录，常驻 worker 的下个任务仍可复用已加载的快照
+    try:
+        os.utime(snapshot_path)
+        process_state['blend_mtime'] = os.stat(snapshot_path).st_mtime_ns
+    except OSError:
+        pass
+    replaced_objects = {
+        target: [bpy.data.objects[name] for name in names if name in bpy.data.objects]
+        for target, names in json.loads(object_names).items()
+    }
+    print(f"命中场景快照，跳过替换: {snapshot_path}")
+    emit_event("snapshot", started_at, file=snapshot_path, hit=True, targets=len(replaced_objects))
+    return replaced_objects
+
+
+def save_scene_snapshot(snapshot_path, replaced_objects, snapshot_cache_max_bytes):
+    """保存完成替换和清理的场景快照，先写临时文件再原子替换，避免并发任务读到半个文件
+
+    以副本方式保存，当前场景仍指向原模型，相对路径按快照位置重新映射
+    """
+    started_at = time.time()
+    scene = bpy.context.scene
+    scene[SNAPSHOT_OBJECTS_PROP] = json.dumps({
+        target: [obj.name for obj in objects] for target, objects in replaced_objects.items()
+    })
+    snapshot_dir = os.path.dirname(snapshot_path)
+    # 与FBX缓存一样以 .tmp 结尾，淘汰时不计入缓存大小，中断遗留的按时间删除
+    tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(snapshot_dir, exist_ok=True)
+        bpy.ops.wm.save_as_mainfile(filepath=tmp_path, copy=True, compress=False, relative_remap=True)
+        os.replace(tmp_path, snapshot_path)
+        # 当前场景与快照一致，常驻 worker 的下个相同任务直接复用
+        process_state['blend_path'] = snapshot_path
+        process_state['blend_mtime'] = os.stat(snapshot_path).st_mtime_ns
+        process_state['scene_dirty'] = False
+        print(f"已保存场景快照: {snapshot_path}")
+        emit_event("snapshot", started_at, file=snapshot_path, hit=False, size=os.path.getsize(snapshot_path))
+        evict_blend_cache(snapshot_dir, snapshot_cache_max_bytes, "场景快照")
+    except Exception as e:
+        print(f"保存场景快照失败: {str(e)}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def setup_camera(camera_info):
+    """选择和设置相机"""
+    if len(camera_info) > 0:
+        selected_camera = camera_info[0]
+        print(f"使用第一个相机: {selected_camera['name']}")
+        camera_object = bpy.data.objects[selected_camera['name']]
     else:
-        print("⚠ OptiX 设备未找到，尝试混合配置")
-        # 使用CUDA计算 + 强制OptiX降噪
+        # 如果没有相机，创建一个新相机
+        print("场景中没有相机，创建默认相机")
+        new_camera = bpy.data.cameras.new(name='DefaultCamera')
+        camera_object = bpy.data.objects.new('DefaultCamera', new_camera)
+        bpy.context.scene.collection.objects.link(camera_object)
+        camera_object.location = (0, 0, 0)
+        camera_object.rotation_euler = (0, 0, 0)
+        camera_object.data.lens = 50
+        process_state['scene_dirty'] = True
+
+    # 确保相机是活动的并设置为场景相机
+    bpy.context.view_layer.objects.active = camera_object
+    bpy.context.scene.camera = camera_object  # 设置为场景相机
+
+
+def detect_devices(cycles_prefs):
+    """检测可用的渲染设备，结果在进程内缓存，只调用一次 refresh_devices()"""
+    if process_state['devices'] is None:
+        cycles_prefs.refresh_devices()
+        devices = {}
+        for device in cycles_prefs.devices:
+            devices.setdefault(device.type, []).append(device.name)
+        process_state['devices'] = devices
+        print(f"检测到渲染设备: {devices}")
+    return process_state['devices']
+
+
+def setup_gpu_devices(cycles, cycles_prefs):
+    """配置 GPU 渲染设备，优先使用 OptiX"""
+    # 🔧 强制启用 OptiX GPU 降噪
+    # 注意：第一次使用时会编译内核，需要 2-5 分钟
+    print("\n强制配置 OptiX GPU 降噪...")
+
+    # 先检测设备列表（同一进程内只需检测一次，设备列表在进程内保持有效）
+    detect_devices(cycles_prefs)
+
+    try:
+        # 强制设置OptiX设备类型
+        cycles_prefs.compute_device_type = 'OPTIX'
+
+        # 检查 OptiX 设备是否可用
+        optix_devices = [d for d in cycles_prefs.devices if d.type == 'OPTIX']
+        cuda_devices = [d for d in cycles_prefs.devices if d.type == 'CUDA']
+
+        if optix_devices:
+            print(f"✓ 找到 {len(optix_devices)} 个 OptiX 设备")
+            # 启用所有 OptiX 设备
+            for device in optix_devices:
+                device.use = True
+                print(f"  ✓ 启用: {device.name}")
+
+            # 同时启用CUDA设备作为计算设备，OptiX作为降噪设备
+            for device in cuda_devices:
+                device.use = True
+                print(f"  ✓ 启用计算设备: {device.name} (CUDA)")
+
+            print("\n⚠️  重要提示：")
+            print("   第一次使用 OptiX 需要编译渲染内核")
+            print("   如果看到 'Loading render kernels' 消息，这是正常的")
+            print("   请耐心等待 2-5 分钟，编译完成后会自动继续")
+            print("   之后的渲染将直接使用缓存，无需再等待\n")
+
+            # 强制设置GPU渲染和OptiX降噪
+            cycles.device = 'GPU'
+
+        else:
+            print("⚠ OptiX 设备未找到，尝试混合配置")
+            # 使用CUDA计算 + 强制OptiX降噪
+            cycles_prefs.compute_device_type = 'CUDA'
+            cycles.device = 'GPU'
+
+            for device in cuda_devices:
+                device.use = True
+                print(f"✓ 启用设备: {device.name} (CUDA)")
+
+            print("  将尝试强制使用OptiX降噪器...")
+
+    except Exception as e:
+        print(f"⚠ 设备配置失败: {str(e)}")
+        print("使用基础CUDA配置")
         cycles_prefs.compute_device_type = 'CUDA'
         cycles.device = 'GPU'
-        
-        for device in cuda_devices:
-            device.use = True
-            print(f"✓ 启用设备: {device.name} (CUDA)")
-            
-        print("  将尝试强制使用OptiX降噪器...")
-        
-except Exception as e:
-    print(f"⚠ 设备配置失败: {str(e)}")
-    print("使用基础CUDA配置")
-    cycles_prefs.compute_device_type = 'CUDA'
+
+        for device in cycles_prefs.devices:
+            if device.type == 'CUDA':
+                device.use = True
+                print(f"✓ 启用设备: {device.name} (CUDA)")
+
+    # 强制设置GPU渲染
     cycles.device = 'GPU'
-    
-    for device in cycles_prefs.devices:
-        if device.type == 'CUDA':
-            device.use = True
-            print(f"✓ 启用设备: {device.name} (CUDA)")
-
-# 强制设置GPU渲染
-cycles.device = 'GPU'
-print(f"\n当前渲染设备类型: {cycles_prefs.compute_device_type}")
-print(f"当前渲染模式: {cycles.device}")
-print("="*60 + "\n")
-
-# 设置GPU特定的渲染参数
-cycles.samples = 32  # 降低采样数，在保持质量的同时提高速度
-cycles.use_adaptive_sampling = True
-cycles.adaptive_threshold = 0.2  # 提高阈值，减少采样
-cycles.adaptive_min_samples = 16  # 降低最小采样数
-
-# 设置GPU特定的内存限制
-cycles.use_auto_tile = True
-cycles.tile_size = 512  # 增加tile size以提高GPU利用率
-
-USE_DENOISING = True  # 从命令行参数读取
-
-
-# 设置GPU特定的线程数
-# cycles.threads = 0  # 自动设置线程数
-
-# 其他渲染设置
-cycles.use_denoising = USE_DENOISING
-if USE_DENOISING:
-    # 🔧 强制使用 OptiX GPU 降噪，避免CPU降噪
-    print("\n配置降噪器...")
-    
-    # 检查是否有OptiX设备
-    optix_devices = [d for d in cycles_prefs.devices if d.type == 'OPTIX']
-    
-    try:
-        # 强制设置为OptiX降噪器
-        cycles.denoiser = 'OPTIX'
-        print("✓ 强制使用 OptiX GPU 降噪器")
-        print("  降噪速度: 3-5秒/张")
-        print("  第一次渲染时会看到 'Loading render kernels'")
-        print("  这是正常的，请等待 2-5 分钟完成编译")
-        
-        # 设置降噪输入通道
-        cycles.denoising_input_passes = 'RGB'
-        
-        # 验证配置
-        current_denoiser = cycles.denoiser
-        print(f"  当前降噪器设置: {current_denoiser}")
-        
-        if current_denoiser != 'OPTIX':
-            print("  ⚠ 警告: 降噪器未设置为OPTIX，可能仍会使用CPU")
-            # 再次尝试强制设置
-            cycles.denoiser = 'OPTIX'
-            print("  重新设置为OPTIX降噪器...")
-            
-    except Exception as e:
-        print(f"  ⚠ 设置OptiX降噪器失败: {e}")
-        # 如果OptiX失败，仍然尝试设置为OPTIX而不是回退到CPU降噪
+    print(f"\n当前渲染设备类型: {cycles_prefs.compute_device_type}")
+    print(f"当前渲染模式: {cycles.device}")
+    print("="*60 + "\n")
+
+    # 设置GPU特定的内存限制
+    cycles.use_auto_tile = True
+    cycles.tile_size = 512  # 增加tile size以提高GPU利用率
+
+
+def setup_cpu_devices(scene, cycles, cycles_prefs, threads):
+    """配置 CPU 渲染，线程数与调度器分配给该任务的核心数一致"""
+    print("\n配置 CPU 渲染...")
+    cycles_prefs.compute_device_type = 'NONE'
+    cycles.device = 'CPU'
+
+    # threads 为 0 时由 Blender 按可用核心数自动设置
+    if threads > 0:
+        scene.render.threads_mode = 'FIXED'
+        scene.render.threads = threads
+    else:
+        scene.render.threads_mode = 'AUTO'
+    print(f"当前渲染模式: CPU, 线程数: {scene.render.threads}")
+    print("="*60 + "\n")
+
+    # CPU 使用较小的tile，减少每个线程的内存占用
+    cycles.use_auto_tile = True
+    cycles.tile_size = 64
+
+
+def setup_devices(scene, device, threads, defer_denoise=False):
+    """配置渲染设备和降噪器
+
+    defer_denoise 时渲染进程不降噪，只输出含噪结果和降噪数据通道，由服务端的降噪进程池生成最终图片
+    """
+    device_setup_started_at = time.time()
+    cycles = scene.cycles
+    preferences = bpy.context.preferences
+    cycles_prefs = preferences.addons['cycles'].preferences
+
+    use_cpu = device == 'CPU'
+    if use_cpu:
+        setup_cpu_devices(scene, cycles, cycles_prefs, threads)
+    else:
+        setup_gpu_devices(cycles, cycles_prefs)
+
+    USE_DENOISING = True  # 从命令行参数读取
+
+    # 其他渲染设置
+    cycles.use_denoising = USE_DENOISING
+    if USE_DENOISING and use_cpu:
+        # CPU 渲染使用 OpenImageDenoise，本身就在 CPU 上运行
+        cycles.denoiser = 'OPENIMAGEDENOISE'
+        cycles.denoising_input_passes = 'RGB_ALBEDO_NORMAL'
+        print("✓ 使用 OpenImageDenoise CPU 降噪器")
+    elif USE_DENOISING:
+        # 🔧 强制使用 OptiX GPU 降噪，避免CPU降噪
+        print("\n配置降噪器...")
+
         try:
+            # 强制设置为OptiX降噪器
             cycles.denoiser = 'OPTIX'
-            print("  ✓ 强制设置OptiX降噪器成功")
-        except:
-            cycles.denoiser = 'OPENIMAGEDENOISE'
-            print("  ⚠ 回退到 OpenImageDenoise（可能较慢）")
-            print("  降噪速度: 30-40秒/张")
-    
-    # 额外配置确保GPU降噪
-    cycles.denoising_input_passes = 'RGB_ALBEDO_NORMAL'
-    print(f"  降噪输入通道: {cycles.denoising_input_passes}")
-    
-else:
-    print("✓ 降噪已禁用 - 快速预览模式")
-
-
-# # 2. 光线弹射设置
-# cycles.max_bounces = 4       # 总弹射次数
-# cycles.diffuse_bounces = 2   # 漫反射弹射
-# cycles.glossy_bounces = 2   # 光泽弹射
-# cycles.transmission_bounces = 4  # 透射弹射
-# cycles.volume_bounces = 0    # 体积弹射
-# cycles.transparent_max_bounces = 4  # 透明弹射
-
-# 3. 因果设置
-# cycles.caustics_reflective = True  # 反射因果
-# cycles.caustics_refractive = True  # 折射因果
-
-# 设置渲染输出路径
-output_dir = outputDir
-
-# 确保输出目录存在
-if not os.path.exists(output_dir):
-    os.makedirs(output_dir)
-
-# 使用 os.path.join 正确拼接路径，确保跨平台兼容性
-output_file = os.path.join(output_dir, f"{taskId}.jpg")
-bpy.context.scene.render.filepath = output_file
-
-# 获取分辨率设置，默认为1k
-resolution = resolution_map.get(quality.lower(), (1280, 720))
-print(f"设置渲染分辨率为: {quality} ({resolution[0]}x{resolution[1]})")
-
-bpy.context.scene.render.image_settings.file_format = 'JPEG'
-bpy.context.scene.render.image_settings.quality = 100  # JPEG质量
-bpy.context.scene.render.image_settings.color_mode = 'RGB'
-bpy.context.scene.render.image_settings.color_depth = '8'  # 可选: '8', '16', '32'
+            print("✓ 强制使用 OptiX GPU 降噪器")
+            print("  降噪速度: 3-5秒/张")
+            print("  第一次渲染时会看到 'Loading render kernels'")
+            print("  这是正常的，请等待 2-5 分钟完成编译")
 
-# 设置渲染分辨率
-bpy.context.scene.render.resolution_x = resolution[0]
-bpy.context.scene.render.resolution_y = resolution[1]
-bpy.context.scene.render.resolution_percentage = 100
-
-# 6. 色彩管理
-scene.view_settings.view_transform = 'Filmic'  # 更好的HDR处理
-scene.view_settings.look = 'None'
-scene.view_settings.exposure = 0
-scene.view_settings.gamma = 1.0
-
-# 渲染所有相机
-print(f"\n开始渲染所有相机，共 {len(camera_info)} 个")
-for i, camera_data in enumerate(camera_info):
-    # 更新任务ID
-    current_task_id = f"{taskId}_cam{i}" if i > 0 else taskId
-    
-    # 选择当前相机
-    print(f"使用索引为 {i} 的相机: {camera_data['name']}")
+            # 设置降噪输入通道
+            cycles.denoising_input_passes = 'RGB'
+
+            # 验证配置
+            current_denoiser = cycles.denoiser
+            print(f"  当前降噪器设置: {current_denoiser}")
+
+            if current_denoiser != 'OPTIX':
+                print("  ⚠ 警告: 降噪器未设置为OPTIX，可能仍会使用CPU")
+                # 再次尝试强制设置
+                cycles.denoiser = 'OPTIX'
+                print("  重新设置为OPTIX降噪器...")
+
+        except Exception as e:
+            print(f"  ⚠ 设置OptiX降噪器失败: {e}")
+            # 如果OptiX失败，仍然尝试设置为OPTIX而不是回退到CPU降噪
+            try:
+                cycles.denoiser = 'OPTIX'
+                print("  ✓ 强制设置OptiX降噪器成功")
+            except:
+                cycles.denoiser = 'OPENIMAGEDENOISE'
+                print("  ⚠ 回退到 OpenImageDenoise（可能较慢）")
+                print("  降噪速度: 30-40秒/张")
+
+        # 额外配置确保GPU降噪
+        cycles.denoising_input_passes = 'RGB_ALBEDO_NORMAL'
+        print(f"  降噪输入通道: {cycles.denoising_input_passes}")
+
+    else:
+        print("✓ 降噪已禁用 - 快速预览模式")
+
+    if USE_DENOISING and defer_denoise:
+        # 降噪器设置保留给预览图使用，正式渲染的降噪交给降噪进程池，采样结束后立即让出执行槽
+        cycles.use_denoising = False
+        print("✓ 降噪延后到降噪进程池，输出降噪数据通道")
+    bpy.context.view_layer.cycles.denoising_store_passes = USE_DENOISING and defer_denoise
+
+    emit_event("device_setup", device_setup_started_at, device=cycles.device, computeDeviceType=cycles_prefs.compute_device_type, threads=scene.render.threads)
+
+
+    # # 2. 光线弹射设置
+    # cycles.max_bounces = 4       # 总弹射次数
+    # cycles.diffuse_bounces = 2   # 漫反射弹射
+    # cycles.glossy_bounces = 2   # 光泽弹射
+    # cycles.transmission_bounces = 4  # 透射弹射
+    # cycles.volume_bounces = 0    # 体积弹射
+    # cycles.transparent_max_bounces = 4  # 透明弹射
+
+    # 3. 因果设置
+    # cycles.caustics_reflective = True  # 反射因果
+    # cycles.caustics_refractive = True  # 折射因果
+
+
+def setup_scene_profile(scene, profile):
+    """应用场景简化参数，profile 为空时关闭简化，使用完整场景"""
+    scene.render.use_simplify = profile is not None
+    if profile:
+        scene.render.simplify_subdivision_render = profile['max_subdivision']
+        scene.render.simplify_child_particles_render = profile['child_particles']
+        scene.cycles.texture_limit_render = profile['texture_limit']
+
+
+def setup_sampling(cycles, quality, sampling=None):
+    """设置采样参数，sampling 为任务清单中该质量档位配置的采样参数，返回使用的参数"""
+    profile = dict(BASE_RENDER_PROFILE)
+    if sampling:
+        profile['samples'] = int(sampling.get('samples') or profile['samples'])
+        profile['adaptive_threshold'] = float(sampling.get('adaptiveThreshold') or profile['adaptive_threshold'])
+        profile['adaptive_min_samples'] = int(sampling.get('adaptiveMinSamples') or profile['adaptive_min_samples'])
+    cycles.samples = profile['samples']
+    cycles.use_adaptive_sampling = True
+    cycles.adaptive_threshold = profile['adaptive_threshold']
+    cycles.adaptive_min_samples = profile['adaptive_min_samples']
+    cycles.time_limit = 0
+    print(f"采样设置: {quality} {profile}")
+    return profile
+
+
+def plan_camera_sampling(cycles, profile, deadline, cameras_left, last_camera):
+    """按剩余时间预算为下一个相机设置采样数和时间上限
+
+    每个相机分到剩余预算的平均份额，扣除上一个相机的同步和写盘开销作为采样时间上限；
+    根据上一个相机的采样速度预估能完成的采样数，预算不够时同时降低采样数和最小采样数，
+    让自适应采样在时间上限之前收敛。没有预算时使用档位的默认参数。
+    """
+    if not deadline:
+        return
+    share = max(0.0, deadline - time.time()) / cameras_left
+    overhead = last_camera.get('overhead', 0.0) if last_camera else 0.0
+    time_limit = max(1.0, share - overhead)
+
+    samples = profile['samples']
+    if last_camera and last_camera.get('samples') and last_camera.get('sample_seconds', 0) > 0:
+        samples_per_second = last_camera['samples'] / last_camera['sample_seconds']
+        samples = max(1, min(samples, int(samples_per_second * time_limit)))
+
+    cycles.samples = samples
+    cycles.adaptive_min_samples = min(profile['adaptive_min_samples'], samples)
+    # 采样数被压缩时放宽自适应阈值，优先保证在时限内完成整张图
+    cycles.adaptive_threshold = profile['adaptive_threshold'] * (
+        1.0 if samples >= profile['samples'] else 2.0
+    )
+    cycles.time_limit = time_limit
+    print(f"时间预算: 每个相机 {share:.1f} 秒, 采样上限 {samples}, 时间上限 {time_limit:.1f} 秒")
+
+
+def setup_color_management(scene):
+    """正式渲染的色彩管理，降噪进程保存最终图片时使用相同的设置"""
+    scene.view_settings.view_transform = 'Filmic'  # 更好的HDR处理
+    scene.view_settings.look = 'None'
+    scene.view_settings.exposure = 0
+    scene.view_settings.gamma = 1.0
+
+
+def setup_output(scene, quality, render_count, lossless=False, defer_denoise=False):
+    """设置输出格式、分辨率和色彩管理
+
+    lossless 时输出无损 PNG，由服务端的编码阶段生成各尺寸的 JPEG/WebP
+    defer_denoise 时输出多层 EXR，包含含噪结果和降噪数据通道，由服务端的降噪进程池降噪
+    """
+    # 获取分辨率设置，默认为1k
+    resolution = resolution_map.get(quality.lower(), (1280, 720))
+    print(f"设置渲染分辨率为: {quality} ({resolution[0]}x{resolution[1]})")
+
+    if defer_denoise:
+        scene.render.image_settings.file_format = 'OPEN_EXR_MULTILAYER'
+        # 半精度 + ZIP 无损压缩，保留降噪需要的线性数据
+        scene.render.image_settings.color_depth = '16'
+        scene.render.image_settings.exr_codec = 'ZIP'
+    elif lossless:
+        scene.render.image_settings.file_format = 'PNG'
+        # 低压缩级别，写入耗时远小于编码 JPEG，文件只在本地短暂保存
+        scene.render.image_settings.compression = 15
+        scene.render.image_settings.color_depth = '8'
+    else:
+        scene.render.image_settings.file_format = 'JPEG'
+        scene.render.image_settings.quality = 100  # JPEG质量
+        scene.render.image_settings.color_depth = '8'  # 可选: '8', '16', '32'
+    scene.render.image_settings.color_mode = 'RGB'
+
+    # 设置渲染分辨率
+    scene.render.resolution_x = resolution[0]
+    scene.render.resolution_y = resolution[1]
+    scene.render.resolution_percentage = 100
+
+    # 6. 色彩管理
+    setup_color_management(scene)
+
+    # 多次渲染时保留渲染数据: 只有第一次渲染需要同步场景和构建BVH，
+    # 后续渲染只更新相机参数，不再重复同步未变化的几何体
+    scene.render.use_persistent_data = render_count > 1
+    print(f"持久化渲染数据: {scene.render.use_persistent_data}")
+
+
+class CallbackSender:
+    """后台线程发送渲染完成通知，复用连接并在失败时有限次重试
+
+    服务端完成上传和回调前端后才返回，失败时返回非 200 状态码触发重试，
+    请求超时需要覆盖降噪、编码和上传的耗时
+    """
+
+    def __init__(self, base_url, callback_params, max_retries=3, timeout=120):
+        self.base_url = base_url
+        self.callback_params = callback_params
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, path, body):
+        self.jobs.put((path, body))
+
+    def close(self, timeout=600):
+        """等待已提交的通知发送完毕"""
+        self.jobs.put(None)
+        self.thread.join(timeout)
+        self.session.close()
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            self._send(*job)
+
+    def _send(self, path, body):
+        started_at = time.time()
+        payload = {**body, "callbackParams": self.callback_params}
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                print(f"正在发送渲染完成通知: {body}")
+                response = self.session.post(f"{self.base_url}{path}", json=payload, timeout=self.timeout)
+                if response.status_code == 200:
+                    print(f"通知发送成功: {response.status_code}")
+                    emit_event("callback", started_at, attempts=attempt, success=True, **body)
+                    return
+                print(f"通知发送失败: HTTP状态码 {response.status_code}")
+                print(f"响应内容: {response.text}")
+            except requests.exceptions.RequestException as e:
+                print(f"通知发送异常: {str(e)}")
+            except Exception as e:
+                print(f"发送通知时发生未知错误: {str(e)}")
+            if attempt < self.max_retries:
+                time.sleep(2 ** (attempt - 1))
+        print(f"通知重试 {self.max_retries} 次后仍失败: {body}")
+        emit_event("callback", started_at, attempts=self.max_retries, success=False, **body)
+
+
+def compute_footprint(scene, camera_object, objects):
+    """计算对象在相机画面中的归一化包围矩形 [min_x, min_y, max_x, max_y]，不在画面内返回 None"""
+    xs = []
+    ys = []
+    for obj in objects:
+        if obj.type != 'MESH':
+            continue
+        for corner in obj.bound_box:
+            co = world_to_camera_view(scene, camera_object, obj.matrix_world @ Vector(corner))
+            if co.z <= 0:
+                # 部分位于相机后方时投影不可靠，按整帧处理
+                return [0.0, 0.0, 1.0, 1.0]
+            xs.append(co.x)
+            ys.append(co.y)
+    if not xs:
+        return None
+    min_x, max_x = max(0.0, min(xs)), min(1.0, max(xs))
+    min_y, max_y = max(0.0, min(ys)), min(1.0, max(ys))
+    if min_x >= max_x or min_y >= max_y:
+        return None
+    return [min_x, min_y, max_x, max_y]
+
+
+def get_target_objects(target, replaced_objects):
+    """替换目标当前在场景中的对象: 替换后的新对象，未替换时为原对象"""
+    if target in replaced_objects:
+        return replaced_objects[target]
+    obj = bpy.data.objects.get(target)
+    return [obj] if obj else []
+
+
+def plan_incremental_region(incremental, camera_index, footprints):
+    """合并变化对象在基础图和当前场景中的区域，返回需要重新渲染的区域
+
+    返回 None 表示需要整帧渲染，返回空列表表示画面没有变化，直接使用基础图
+    """
+    base_cameras = incremental.get("footprints") or []
+    if camera_index >= len(base_cameras):
+        return None
+    base_image = os.path.join(incremental["baseDir"], f"cam{camera_index}.jpg")
+    if not os.path.exists(base_image):
+        return None
+
+    rects = []
+    for target in incremental["changedTargets"]:
+        for rect in (footprints.get(target), base_cameras[camera_index].get(target)):
+            if rect:
+                rects.append(rect)
+    if not rects:
+        return []
+
+    min_x = max(0.0, min(rect[0] for rect in rects) - INCREMENTAL_PADDING)
+    min_y = max(0.0, min(rect[1] for rect in rects) - INCREMENTAL_PADDING)
+    max_x = min(1.0, max(rect[2] for rect in rects) + INCREMENTAL_PADDING)
+    max_y = min(1.0, max(rect[3] for rect in rects) + INCREMENTAL_PADDING)
+    if (max_x - min_x) * (max_y - min_y) > INCREMENTAL_MAX_AREA:
+        return None
+    return [min_x, min_y, max_x, max_y]
+
+
+def read_image_pixels(image):
+    """读取图片像素为 (高, 宽, 4) 的数组"""
+    width, height = image.size
+    pixels = np.empty(width * height * 4, dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    return pixels.reshape(height, width, 4)
+
+
+def save_display_pixels(scene, pixels, output_file, colorspace='sRGB'):
+    """保存已经过色彩变换的像素，使用 Standard 视图变换避免再次变换"""
+    height, width = pixels.shape[:2]
+    view_settings = scene.view_settings
+    saved_view = (view_settings.view_transform, view_settings.look)
+    result = bpy.data.images.new("display_result", width, height, alpha=False)
+    try:
+        result.colorspace_settings.name = colorspace
+        result.pixels.foreach_set(pixels.ravel())
+        view_settings.view_transform = 'Standard'
+        view_settings.look = 'None'
+        result.save_render(filepath=output_file, scene=scene)
+    finally:
+        view_settings.view_transform, view_settings.look = saved_view
+        bpy.data.images.remove(result)
+
+
+def get_border_pixels(render):
+    """按 Blender 计算裁剪区域的方式（归一化边框乘以输出尺寸后取整）换算渲染边框的像素范围
+
+    返回 (x0, y0, x1, y1)，x1、y1 不包含在内，坐标原点在左下角
+    """
+    width = int(render.resolution_x * render.resolution_percentage / 100)
+    height = int(render.resolution_y * render.resolution_percentage / 100)
+    return (
+        int(render.border_min_x * width),
+        int(render.border_min_y * height),
+        int(render.border_max_x * width),
+        int(render.border_max_y * height)
+    )
+
+
+def composite_region(scene, base_path, region_path, bounds, output_file):
+    """把重新渲染的区域合成到基础图上
+
+    区域单独渲染和降噪，噪点和降噪结果与基础图不同，直接覆盖会留下矩形接缝；
+    区域边缘的过渡带（不在画面边缘的一侧）按线性权重与基础图混合
+    """
+    base = bpy.data.images.load(base_path)
+    crop = bpy.data.images.load(region_path)
+    try:
+        width, height = base.size
+        if (width, height) != (scene.render.resolution_x, scene.render.resolution_y):
+            raise ValueError(f"基础图尺寸 {width}x{height} 与当前分辨率不一致")
+        base_pixels = read_image_pixels(base)
+        crop_pixels = read_image_pixels(crop)
+        crop_height, crop_width = crop_pixels.shape[:2]
+        # 图片坐标原点在左下角，与渲染区域坐标一致
+        x0, y0, x1, y1 = bounds
+        if (crop_width, crop_height) != (x1 - x0, y1 - y0):
+            raise ValueError(f"区域尺寸 {crop_width}x{crop_height} 与渲染边框 {bounds} 不一致")
+        ramp_x = feather_ramp(crop_width, int(round(INCREMENTAL_FEATHER * width)), x0 > 0, x1 < width)
+        ramp_y = feather_ramp(crop_height, int(round(INCREMENTAL_FEATHER * height)), y0 > 0, y1 < height)
+        weight = (ramp_y[:, None] * ramp_x[None, :])[:, :, None]
+        target = base_pixels[y0:y1, x0:x1, :3]
+        base_pixels[y0:y1, x0:x1, :3] = target * (1.0 - weight) + crop_pixels[:, :, :3] * weight
+        # 两张图都已经过色彩变换
+        save_display_pixels(scene, base_pixels, output_file, base.colorspace_settings.name)
+    finally:
+        bpy.data.images.remove(base)
+        bpy.data.images.remove(crop)
+
+
+def get_tile_region(tile):
+    """分块在画面中的归一化区域，向四周扩展 overlap 作为拼接时的过渡区，第0行在画面底部"""
+    rows, cols, overlap = tile["rows"], tile["cols"], tile["overlap"]
+    row, col = divmod(tile["index"], cols)
+    return [
+        max(0.0, col / cols - overlap),
+        max(0.0, row / rows - overlap),
+        min(1.0, (col + 1) / cols + overlap),
+        min(1.0, (row + 1) / rows + overlap)
+    ]
+
+
+def render_tile(scene, tile, output_file):
+    """只渲染分块区域，保存为无损 PNG 等待拼接"""
+    render = scene.render
+    cycles = scene.cycles
+    saved_format = render.image_settings.file_format
+    # 常驻 worker 会复用场景，之后的任务不能沿用固定的随机种子
+    saved_seed = (cycles.seed, cycles.use_animated_seed)
+    try:
+        render.use_border = True
+        render.use_crop_to_border = True
+        render.border_min_x, render.border_min_y, render.border_max_x, render.border_max_y = get_tile_region(tile)
+        # 固定随机种子，相邻分块在重叠区域的采样完全一致
+        cycles.seed = 0
+        cycles.use_animated_seed = False
+        bpy.ops.render.render()
+        render.image_settings.file_format = 'PNG'
+        bpy.data.images['Render Result'].save_render(filepath=output_file)
+    finally:
+        render.image_settings.file_format = saved_format
+        render.use_border = False
+        render.use_crop_to_border = False
+        cycles.seed, cycles.use_animated_seed = saved_seed
+
+
+def feather_ramp(length, ramp, ramp_start, ramp_end):
+    """一维拼接权重，在与相邻分块重叠（或需要与基础图过渡）的一侧从 0 线性过渡到 1"""
+    weights = np.ones(length, dtype=np.float32)
+    ramp = max(1, min(ramp, length))
+    edge = (np.arange(ramp, dtype=np.float32) + 0.5) / ramp
+    if ramp_start:
+        weights[:ramp] = np.minimum(weights[:ramp], edge)
+    if ramp_end:
+        weights[-ramp:] = np.minimum(weights[-ramp:], edge[::-1])
+    return weights
+
+
+def setup_file_format(scene, output_file):
+    """按输出文件的扩展名设置保存格式，输出 PNG 时由服务端的编码阶段生成最终图片"""
+    if output_file.lower().endswith(".png"):
+        scene.render.image_settings.file_format = 'PNG'
+        scene.render.image_settings.compression = 15
+    else:
+        scene.render.image_settings.file_format = 'JPEG'
+        scene.render.image_settings.quality = 100
+    scene.render.image_settings.color_depth = '8'
+    scene.render.image_settings.color_mode = 'RGB'
+
+
+def stitch_tiles(spec):
+    """把分块拼接为完整画面
+
+    每个分块单独降噪，边缘缺少上下文的像素正好落在重叠区，
+    重叠区按线性权重混合，分块边缘的权重趋近于 0，拼接后没有可见的接缝
+    """
+    started_at = time.time()
+    width, height = resolution_map.get(spec["quality"].lower(), (1280, 720))
+    rows, cols, overlap = spec["rows"], spec["cols"], spec["overlap"]
+    accum = np.zeros((height, width, 3), dtype=np.float32)
+    weights = np.zeros((height, width, 1), dtype=np.float32)
+
+    for index, tile_path in enumerate(spec["tiles"]):
+        region = get_tile_region({"index": index, "rows": rows, "cols": cols, "overlap": overlap})
+        image = bpy.data.images.load(tile_path)
+        try:
+            pixels = read_image_pixels(image)[:, :, :3]
+        finally:
+            bpy.data.images.remove(image)
+        tile_height, tile_width = pixels.shape[:2]
+        x0 = min(int(round(region[0] * width)), width - tile_width)
+        y0 = min(int(round(region[1] * height)), height - tile_height)
+        row, col = divmod(index, cols)
+        ramp_x = feather_ramp(tile_width, int(round(2 * overlap * width)), col > 0, col < cols - 1)
+        ramp_y = feather_ramp(tile_height, int(round(2 * overlap * height)), row > 0, row < rows - 1)
+        weight = (ramp_y[:, None] * ramp_x[None, :])[:, :, None]
+        accum[y0:y0 + tile_height, x0:x0 + tile_width] += pixels * weight
+        weights[y0:y0 + tile_height, x0:x0 + tile_width] += weight
+
+    result = np.ones((height, width, 4), dtype=np.float32)
+    result[:, :, :3] = accum / np.maximum(weights, 1e-6)
+
+    scene = bpy.context.scene
+    setup_file_format(scene, spec["output"])
+    save_display_pixels(scene, result, spec["output"])
+
+    for tile_path in spec["tiles"]:
+        os.remove(tile_path)
+    print(f"分块拼接完成: {spec['output']}")
+    emit_event("stitch", started_at, output=spec["output"], tiles=len(spec["tiles"]))
+
+
+def denoise_image(scene, job):
+    """对渲染进程输出的含噪多层 EXR 降噪，按正式渲染的色彩管理保存为最终图片
+
+    Cycles 的独立降噪使用 EXR 中的反照率和法线通道，结果先写到临时 EXR，
+    保存时按场景的视图变换把线性数据转换为显示色彩，完成后删除中间文件
+    """
+    started_at = time.time()
+    source = job["source"]
+    denoised = f"{os.path.splitext(source)[0]}_denoised.exr"
+    bpy.ops.cycles.denoise_animation(input_filepath=source, output_filepath=denoised)
+    # 降噪失败时算子只报告错误，不抛出异常
+    if not os.path.exists(denoised):
+        raise RuntimeError(f"降噪失败，没有生成结果: {source}")
+
+    image = bpy.data.images.load(denoised)
+    try:
+        setup_file_format(scene, job["output"])
+        image.save_render(filepath=job["output"], scene=scene)
+    finally:
+        bpy.data.images.remove(image)
+    os.remove(source)
+    os.remove(denoised)
+    print(f"降噪完成: {job['output']}")
+    emit_event("denoise", started_at, id=job["id"], ok=True, output=job["output"])
+
+
+def run_denoise_worker():
+    """降噪 worker，由 DenoiseService 以进程池方式启动
+
+    从标准输入逐行读取 JSON 降噪任务，每个任务完成后输出一个 denoise 事件:
+        {"id": 1, "source": "...exr", "output": "...png"}
+        -> @@RENDER_EVENT@@ {"phase": "denoise", "id": 1, "ok": true, ...}
+    """
+    scene = bpy.context.scene
+    scene.render.engine = 'CYCLES'
+    # 与渲染进程的 CPU 降噪设置一致
+    scene.cycles.denoiser = 'OPENIMAGEDENOISE'
+    scene.cycles.denoising_input_passes = 'RGB_ALBEDO_NORMAL'
+    scene.cycles.denoising_prefilter = 'ACCURATE'
+    setup_color_management(scene)
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        job = json.loads(line)
+        try:
+            denoise_image(scene, job)
+        except Exception as e:
+            traceback.print_exc()
+            sys.stderr.flush()
+            emit_event("denoise", id=job["id"], ok=False, error=f"{type(e).__name__}: {e}")
+
+
+def render_incremental(scene, base_path, region, output_file):
+    """只渲染区域并合成到基础图上，失败时返回 False 由调用方整帧渲染"""
+    if not region:
+        if os.path.splitext(base_path)[1] == os.path.splitext(output_file)[1]:
+            shutil.copyfile(base_path, output_file)
+        else:
+            # 无损输出时按当前输出格式重新保存基础图
+            base = bpy.data.images.load(base_path)
+            try:
+                save_display_pixels(scene, read_image_pixels(base), output_file, base.colorspace_settings.name)
+            finally:
+                bpy.data.images.remove(base)
+        print("变化对象不在画面内，直接使用基础图")
+        return True
+
+    render = scene.render
+    region_path = f"{output_file}.region.png"
+    saved_format = render.image_settings.file_format
+    try:
+        render.use_border = True
+        render.use_crop_to_border = True
+        # 在区域外再渲染一圈过渡带，变化对象所在的区域完全使用新结果
+        render.border_min_x = max(0.0, region[0] - INCREMENTAL_FEATHER)
+        render.border_min_y = max(0.0, region[1] - INCREMENTAL_FEATHER)
+        render.border_max_x = min(1.0, region[2] + INCREMENTAL_FEATHER)
+        render.border_max_y = min(1.0, region[3] + INCREMENTAL_FEATHER)
+        bpy.ops.render.render()
+        render.image_settings.file_format = 'PNG'
+        bpy.data.images['Render Result'].save_render(filepath=region_path)
+        render.image_settings.file_format = saved_format
+        composite_region(scene, base_path, region_path, get_border_pixels(render), output_file)
+        print(f"增量渲染区域: {[round(v, 3) for v in region]}")
+        return True
+    except Exception as e:
+        print(f"增量渲染失败，改为整帧渲染: {str(e)}")
+        return False
+    finally:
+        render.image_settings.file_format = saved_format
+        render.use_border = False
+        render.use_crop_to_border = False
+        if os.path.exists(region_path):
+            os.remove(region_path)
+
+
+def activate_camera(camera_data):
+    """把相机设置为活动相机和场景相机"""
     camera_object = bpy.data.objects[camera_data['name']]
-    
-    # 设置当前相机为活动相机
     bpy.context.view_layer.objects.active = camera_object
     bpy.context.scene.camera = camera_object
-    
-    # 更新输出文件路径
-    output_file = os.path.join(output_dir, f"{current_task_id}.jpg")
-    bpy.context.scene.render.filepath = output_file
-    
-    # 执行渲染
-    print(f"开始渲染相机 {i}: {camera_data['name']}")
-    bpy.ops.render.render(write_still=True)
-    print(f"渲染完成，图像已保存到: {output_file}")
-    
-    # 发送回调通知
+
+
+def is_denoise_deferred(manifest):
+    """是否把降噪交给服务端的降噪进程池，分块和增量渲染需要在进程内得到最终像素，仍在渲染时降噪"""
+    return bool(manifest.get("deferDenoise")) and not manifest.get("tile") and not manifest.get("incrementalBase")
+
+
+def get_camera_task_id(task_id, camera_data):
+    """相机结果的任务ID，第一个相机使用任务ID本身"""
+    index = camera_data['index']
+    return f"{task_id}_cam{index}" if index > 0 else task_id
+
+
+def get_checkpoint_path(manifest):
+    return os.path.join(manifest["outputDir"], f"{manifest['taskId']}_checkpoint.json")
+
+
+def get_checkpoint_key(manifest):
+    """任务的渲染内容，内容不同的完成记录不能复用"""
+    content = {key: manifest.get(key) for key in ("blendFilePath", "replacementItems", "quality", "tile")}
+    return hashlib.sha1(json.dumps(content, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def load_checkpoint(manifest):
+    """读取相机完成记录，返回 {相机索引: 结果文件}，只保留结果文件仍然存在的相机
+
+    降噪和编码阶段会把 EXR/PNG 转换为最终的 JPEG 并删除原文件，按文件名主干查找
+    """
     try:
-        print(f"正在发送渲染完成通知，任务ID: {current_task_id}")
-        response = requests.post(
-            f"http://localhost:7001/api/render/client-callback",
-            json={
-                "taskId": current_task_id,
-                "callbackParams": {
-                    "clientId": clientId,
-                    "clientJwt": clientJwt,
-                    "fileDataId": fileDataId
-                }
-            },
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            print(f"通知发送成功: {response.status_code}")
+        with open(get_checkpoint_path(manifest), encoding="utf-8") as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if checkpoint.get("version") != CHECKPOINT_VERSION or checkpoint.get("key") != get_checkpoint_key(manifest):
+        return {}
+
+    finished = {}
+    for index, output in checkpoint.get("cameras", {}).items():
+        stem = os.path.splitext(output)[0]
+        for candidate in (output, f"{stem}.jpg", f"{stem}.png"):
+            if os.path.exists(candidate):
+                finished[int(index)] = candidate
+                break
+    return finished
+
+
+def write_checkpoint(manifest, finished):
+    """相机结果写入后更新完成记录，先写临时文件再重命名，进程中途退出不会留下不完整的记录"""
+    checkpoint_path = get_checkpoint_path(manifest)
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "version": CHECKPOINT_VERSION,
+            "key": get_checkpoint_key(manifest),
+            "cameras": {str(index): output for index, output in finished.items()},
+        }, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, checkpoint_path)
+
+
+def render_previews(task_id, camera_info, output_dir, callback_sender, coalesce_callback, simplify=False):
+    """以低分辨率和少量采样渲染所有相机的预览图，完成后恢复正式渲染的设置
+
+    simplify 时预览图使用最低档位的场景简化参数
+    """
+    scene = bpy.context.scene
+    cycles = scene.cycles
+    saved = {
+        'use_simplify': scene.render.use_simplify,
+        'simplify_subdivision_render': scene.render.simplify_subdivision_render,
+        'simplify_child_particles_render': scene.render.simplify_child_particles_render,
+        'texture_limit_render': cycles.texture_limit_render,
+        'resolution_percentage': scene.render.resolution_percentage,
+        'file_format': scene.render.image_settings.file_format,
+        'jpeg_quality': scene.render.image_settings.quality,
+        'color_depth': scene.render.image_settings.color_depth,
+        'samples': cycles.samples,
+        'adaptive_min_samples': cycles.adaptive_min_samples,
+        'time_limit': cycles.time_limit,
+        'use_denoising': cycles.use_denoising,
+    }
+
+    # 按预览宽度换算分辨率百分比，已经加载的场景直接复用
+    scene.render.resolution_percentage = max(1, min(100, round(PREVIEW_WIDTH * 100 / scene.render.resolution_x)))
+    # 预览图直接以 JPEG 回调，不经过编码阶段
+    scene.render.image_settings.file_format = 'JPEG'
+    scene.render.image_settings.quality = PREVIEW_JPEG_QUALITY
+    cycles.samples = PREVIEW_SAMPLES
+    cycles.adaptive_min_samples = min(cycles.adaptive_min_samples, PREVIEW_SAMPLES)
+    cycles.time_limit = 0
+    # 预览图直接回调，降噪延后时也在进程内降噪
+    cycles.use_denoising = True
+    if simplify:
+        setup_scene_profile(scene, scene_profiles['1k'])
+    print(f"\n开始渲染预览图，分辨率 {scene.render.resolution_percentage}%，采样数 {PREVIEW_SAMPLES}")
+
+    preview_task_ids = []
+    try:
+        for i, camera_data in enumerate(camera_info):
+            current_task_id = get_camera_task_id(task_id, camera_data)
+            preview_task_id = f"{current_task_id}_preview"
+            activate_camera(camera_data)
+
+            output_file = os.path.join(output_dir, f"{preview_task_id}.jpg")
+            scene.render.filepath = output_file
+            preview_start = time.time()
+            bpy.ops.render.render()
+            bpy.data.images['Render Result'].save_render(filepath=output_file)
+            print(f"预览图已保存到: {output_file}")
+            emit_event("preview", preview_start, index=i, total=len(camera_info), name=camera_data['name'])
+
+            if coalesce_callback:
+                preview_task_ids.append(preview_task_id)
+            else:
+                callback_sender.submit("/api/render/client-callback", {"taskId": preview_task_id, "preview": True})
+
+        if coalesce_callback and preview_task_ids:
+            callback_sender.submit("/api/render/client-callback-batch", {"taskIds": preview_task_ids, "preview": True})
+    finally:
+        scene.render.resolution_percentage = saved['resolution_percentage']
+        scene.render.image_settings.file_format = saved['file_format']
+        scene.render.image_settings.quality = saved['jpeg_quality']
+        scene.render.image_settings.color_depth = saved['color_depth']
+        cycles.samples = saved['samples']
+        cycles.adaptive_min_samples = saved['adaptive_min_samples']
+        cycles.time_limit = saved['time_limit']
+        cycles.use_denoising = saved['use_denoising']
+        scene.render.use_simplify = saved['use_simplify']
+        scene.render.simplify_subdivision_render = saved['simplify_subdivision_render']
+        scene.render.simplify_child_particles_render = saved['simplify_child_particles_render']
+        cycles.texture_limit_render = saved['texture_limit_render']
+
+
+def render_cameras(manifest, camera_info, output_dir, profile, deadline=None, replaced_objects=None):
+    """渲染所有相机，每个相机完成后交给后台线程发送通知
+
+    deadline 为任务的截止时间（时间戳），为空时不限制渲染时间
+    replaced_objects 为替换后的对象，用于记录各替换目标在画面中的区域和增量渲染
+    """
+    replaced_objects = replaced_objects or {}
+    incremental = manifest.get("incrementalBase")
+    # 记录所有替换目标的画面区域，写入结果目录，供之后的增量渲染使用
+    footprint_targets = set(replaced_objects)
+    if incremental:
+        footprint_targets.update(incremental["changedTargets"])
+    camera_footprints = []
+    # 拆分后的子任务按父任务ID命名输出文件，结果与整体渲染时一致
+    task_id = manifest.get("outputTaskId") or manifest["taskId"]
+    coalesce_callback = bool(manifest.get("coalesceCallback"))
+    # 合并回调由父任务在所有子任务完成后统一发送
+    defer_callback = bool(manifest.get("deferCallback"))
+    # 分块子任务只渲染画面的一部分，由父任务拼接后回调
+    tile = manifest.get("tile")
+    # 降噪延后时输出含噪的多层 EXR，回调上传前由服务端降噪
+    if is_denoise_deferred(manifest):
+        output_ext = "exr"
+    else:
+        output_ext = "png" if manifest.get("lossless") else "jpg"
+    callback_sender = CallbackSender(CALLBACK_BASE_URL, {
+        "clientId": manifest.get("clientId", ""),
+        "clientJwt": manifest.get("clientJwt", ""),
+        "fileDataId": manifest.get("fileDataId", "")
+    })
+    completed_task_ids = []
+    # 重试或租约过期恢复的任务跳过上次已完成的相机
+    finished = load_checkpoint(manifest)
+    if finished:
+        print(f"从完成记录恢复，跳过已完成的 {len(finished)} 个相机: {sorted(finished)}")
+
+    def on_camera_finished(current_task_id):
+        # 交给后台线程发送回调通知，不阻塞下一个相机的渲染
+        if tile:
+            return
+        if coalesce_callback:
+            completed_task_ids.append(current_task_id)
         else:
-            print(f"通知发送失败: HTTP状态码 {response.status_code}")
-            print(f"响应内容: {response.text}")
-            
-    except requests.exceptions.RequestException as e:
-        print(f"通知发送异常: {str(e)}")
-    except Exception as e:
-        print(f"发送通知时发生未知错误: {str(e)}")
+            callback_sender.submit("/api/render/client-callback", {"taskId": current_task_id})
+
+    # 通过渲染统计回调记录第一个采样开始的时间，用于区分场景同步和采样阶段
+    render_marks = {}
+
+    def on_render_stats(stats, *args):
+        match = SAMPLE_REGEX.search(str(stats))
+        if not match:
+            return
+        if 'first_sample' not in render_marks:
+            render_marks['first_sample'] = time.time()
+        # 记录最后一次报告的采样数，即该相机实际使用的采样数
+        render_marks['samples'] = int(match.group(1))
+
+    bpy.app.handlers.render_stats.append(on_render_stats)
+
+    camera_timings = []
+    cycles = bpy.context.scene.cycles
+    last_camera = None
+    try:
+        # 可选的预览阶段，预览图通过同一个回调接口发送，带 preview 标记，恢复的任务已经发送过预览图
+        if manifest.get("preview") and not tile and not finished:
+            render_previews(task_id, camera_info, output_dir, callback_sender, coalesce_callback, bool(manifest.get("simplify")))
+
+        # 渲染所有相机
+        print(f"\n开始渲染所有相机，共 {len(camera_info)} 个")
+        for i, camera_data in enumerate(camera_info):
+            # 更新任务ID
+            current_task_id = get_camera_task_id(task_id, camera_data)
+
+            # 选择当前相机，设置为活动相机
+            print(f"使用索引为 {i} 的相机: {camera_data['name']}")
+            activate_camera(camera_data)
+
+            # 更新输出文件路径
+            output_file = os.path.join(output_dir, f"{current_task_id}.{output_ext}")
+            bpy.context.scene.render.filepath = output_file
+
+            scene = bpy.context.scene
+            footprints = {
+                target: compute_footprint(scene, scene.camera, get_target_objects(target, replaced_objects))
+                for target in footprint_targets
+            }
+            camera_footprints.append(footprints)
+
+            if camera_data['index'] in finished:
+                output_file = finished[camera_data['index']]
+                print(f"相机 {camera_data['name']} 已完成，跳过: {output_file}")
+                # 结果可能还没有降噪或编码，服务端按输出文件继续后处理；上次的进程可能在发送回调前退出，重新发送回调
+                emit_event("camera", index=i, total=len(camera_info), name=camera_data['name'], output=output_file, resumed=True)
+                on_camera_finished(current_task_id)
+                continue
+
+            cameras_left = sum(1 for camera in camera_info[i:] if camera['index'] not in finished)
+            plan_camera_sampling(cycles, profile, deadline, cameras_left, last_camera)
+            region = plan_incremental_region(incremental, camera_data['index'], footprints) if incremental else None
+
+            # 执行渲染
+            print(f"开始渲染相机 {i}: {camera_data['name']}")
+            render_marks.clear()
+            render_start = time.time()
+            base_path = os.path.join(incremental["baseDir"], f"cam{camera_data['index']}.jpg") if region is not None else None
+            if tile:
+                output_file = os.path.join(output_dir, f"{current_task_id}_tile{tile['index']}.png")
+                render_tile(scene, tile, output_file)
+                render_end = write_end = time.time()
+            elif region is not None and render_incremental(scene, base_path, region, output_file):
+                render_end = write_end = time.time()
+            else:
+                bpy.ops.render.render()
+                render_end = time.time()
+                bpy.data.images['Render Result'].save_render(filepath=output_file)
+                write_end = time.time()
+            finished[camera_data['index']] = output_file
+            write_checkpoint(manifest, finished)
+
+            render_seconds = write_end - render_start
+            camera_timings.append((camera_data['name'], render_seconds))
+            print(f"渲染完成，图像已保存到: {output_file}，耗时 {render_seconds:.2f} 秒")
+
+            first_sample = render_marks.get('first_sample', render_start)
+            effective_samples = render_marks.get('samples')
+            last_camera = {
+                'samples': effective_samples,
+                'sample_seconds': render_end - first_sample,
+                'overhead': (first_sample - render_start) + (write_end - render_end),
+            }
+            print(f"实际采样数: {effective_samples}/{cycles.samples}")
+            emit_event(
+                "camera",
+                render_start,
+                index=i,
+                total=len(camera_info),
+                name=camera_data['name'],
+                output=output_file,
+                syncMs=round((first_sample - render_start) * 1000),
+                renderMs=round((render_end - first_sample) * 1000),
+                writeMs=round((write_end - render_end) * 1000),
+                samples=effective_samples,
+                maxSamples=cycles.samples,
+                timeLimit=round(cycles.time_limit, 1)
+            )
+
+            on_camera_finished(current_task_id)
+
+        if coalesce_callback and completed_task_ids and not defer_callback:
+            callback_sender.submit("/api/render/client-callback-batch", {"taskIds": completed_task_ids})
+
+        with open(os.path.join(output_dir, f"{manifest['taskId']}_footprints.json"), "w", encoding="utf-8") as f:
+            json.dump({"cameras": camera_footprints}, f)
+    finally:
+        callback_sender.close()
+        bpy.app.handlers.render_stats.remove(on_render_stats)
+
+    print("各相机渲染耗时:")
+    for camera_name, render_seconds in camera_timings:
+        print(f"  {camera_name}: {render_seconds:.2f} 秒")
+
+
+def run_job(manifest):
+    """按任务清单执行一个渲染任务"""
+    job_started_at = time.time()
+    reset_peak_memory()
+    replacement_items = manifest.get("replacementItems") or []
+    quality = manifest.get("quality") or "1k"
+
+    blend_file_path = manifest["blendFilePath"]
+    # 有效的场景索引中已经记录了相机和对象，不再遍历场景；没有时在未修改的场景上生成
+    scene_index = load_scene_index(blend_file_path)
+    if scene_index is None:
+        load_blend(blend_file_path)
+        scene_index = write_scene_index(blend_file_path)
+    camera_info = scene_index["cameras"]
+    print(f"找到 {len(camera_info)} 个相机: {[cam['name'] for cam in camera_info]}")
+    # 拆分后的子任务只渲染分配给它的相机
+    camera_indices = manifest.get("cameraIndices")
+    if camera_indices is not None:
+        camera_info = [cam for cam in camera_info if cam['index'] in camera_indices]
+        print(f"只渲染相机: {[cam['name'] for cam in camera_info]}")
+
+    # 替换目标不在场景中时尽早报告，不等到替换阶段
+    missing_targets = [item["target"] for item in replacement_items if item["target"] not in scene_index["objects"]]
+    for target in missing_targets:
+        print(f"警告: 未找到目标对象 {target}，跳过此替换")
+        print(f"替换失败: {target}")
+    replacement_items = [item for item in replacement_items if item["target"] in scene_index["objects"]]
+
+    # 按质量档位简化场景，4k 或未启用时使用完整场景
+    scene_profile = scene_profiles.get(quality.lower()) if manifest.get("simplify") else None
+    print(f"场景简化: {quality} {scene_profile}")
+
+    # 相同模型和替换列表已经准备过的场景直接加载快照，跳过替换
+    decimate_ratio = scene_profile['decimate_ratio'] if scene_profile else 1.0
+    snapshot_path = None
+    if manifest.get("snapshotCacheDir") and replacement_items:
+        snapshot_path = get_snapshot_path(manifest, replacement_items, decimate_ratio)
+    replaced_objects = None
+    if snapshot_path and os.path.exists(snapshot_path):
+        replaced_objects = load_scene_snapshot(snapshot_path)
+
+    if replaced_objects is None and replacement_items:
+        load_blend(blend_file_path)
+        # 执行批量替换
+        process_state['scene_dirty'] = True
+        phase_started_at = time.time()
+        replaced_objects = replace_objects_batched(
+            replacement_items,
+            manifest["assetCacheDir"],
+            int(manifest["assetCacheMaxBytes"]),
+            decimate_ratio
+        )
+        emit_event("replacements", phase_started_at, count=len(replacement_items))
+        # 被替换对象的网格、材质和贴图在渲染前释放，避免与导入的资源同时占用内存
+        purge_orphans()
+        if snapshot_path and replaced_objects:
+            save_scene_snapshot(snapshot_path, replaced_objects, int(manifest["snapshotCacheMaxBytes"]))
+    elif replaced_objects is None:
+        load_blend(blend_file_path)
+        replaced_objects = {}
+        print("没有需要替换的项目，跳过替换步骤")
+
+    setup_camera(camera_info)
+
+    # 设置渲染引擎为Cycles
+    scene = bpy.context.scene
+    scene.render.engine = 'CYCLES'
+    defer_denoise = is_denoise_deferred(manifest)
+    setup_devices(scene, manifest.get("device") or "GPU", int(manifest.get("threads") or 0), defer_denoise)
+
+    # 设置渲染输出路径，确保输出目录存在
+    output_dir = manifest["outputDir"]
+    os.makedirs(output_dir, exist_ok=True)
+    preview = bool(manifest.get("preview")) and not manifest.get("tile")
+    setup_output(scene, quality, len(camera_info) * (2 if preview else 1), bool(manifest.get("lossless")), defer_denoise)
+    setup_scene_profile(scene, scene_profile)
+    profile = setup_sampling(scene.cycles, quality, manifest.get("sampling"))
+
+    # 时间预算从任务开始计算，加载和替换消耗的时间也计入预算
+    time_budget = float(manifest.get("timeBudget") or 0)
+    deadline = job_started_at + time_budget if time_budget > 0 else None
+    render_cameras(manifest, camera_info, output_dir, profile, deadline, replaced_objects)
+
+    print(f"所有 {len(camera_info)} 个相机渲染完成！")
+    emit_event("done", job_started_at, cameras=len(camera_info))
+
+
+def run_manifests(manifests):
+    """按顺序执行一组任务清单，返回失败的任务数"""
+    failures = 0
+    for manifest in manifests:
+        try:
+            run_job(manifest)
+        except Exception:
+            failures += 1
+            # 失败任务可能留下不完整的场景，下个任务重新加载
+            process_state['scene_dirty'] = True
+            print(f"任务执行失败: {manifest.get('taskId')}", file=sys.stderr)
+            traceback.print_exc()
+            sys.stderr.flush()
+    return failures
+
+
+def index_scene(blend_file_path):
+    """生成场景索引，已有有效索引时不加载场景"""
+    if load_scene_index(blend_file_path) is not None:
+        emit_event("index", file=get_scene_index_path(blend_file_path))
+        return
+    load_blend(blend_file_path)
+    write_scene_index(blend_file_path)
+
+
+def load_manifests(raw):
+    """解析任务清单，单个任务对象或任务列表"""
+    data = json.loads(raw)
+    return data if isinstance(data, list) else [data]
+
+
+def main(argv):
+    args = argv[argv.index("--") + 1:] if "--" in argv else []
+    parser = argparse.ArgumentParser(prog="blender_render")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--manifest", help="任务清单JSON文件路径")
+    source.add_argument("--stdin", action="store_true", help="从标准输入读取任务清单")
+    source.add_argument("--index", help="为 .blend 文件生成场景索引")
+    source.add_argument("--stitch", action="store_true", help="从标准输入读取分块拼接参数")
+    source.add_argument("--denoise", action="store_true", help="作为降噪 worker 从标准输入逐行读取降噪任务")
+    options = parser.parse_args(args)
+
+    if options.index:
+        index_scene(options.index)
+        return
+    if options.stitch:
+        stitch_tiles(json.loads(sys.stdin.read()))
+        return
+    if options.denoise:
+        run_denoise_worker()
+        return
+
+    if options.stdin:
+        raw = sys.stdin.read()
+    else:
+        with open(options.manifest, encoding="utf-8") as f:
+            raw = f.read()
+
+    failures = run_manifests(load_manifests(raw))
+    if failures:
+        sys.exit(1)
+
 
-print(f"所有 {len(camera_info)} 个相机渲染完成！")
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,81 @@
+import bpy # type: ignore
+import os
+import sys
+import json
+import traceback
+
+# 渲染逻辑位于同目录的 blender_render.py，作为模块导入后在进程内复用
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import blender_render  # noqa: E402
+
+# 常驻 Blender 工作进程
+# 由 BlenderWorkerPoolService 启动: blender --background --python blender_worker.py
+# 通过 stdin 按行接收 JSON 任务，通过 stdout 输出渲染日志和协议标记行
+# 进程内保留已加载的 Cycles 内核和设备列表，避免每个任务重复启动 Blender
+# 连续任务使用同一个 .blend 且场景未被修改时，直接复用已加载的场景
+
+READY_MARKER = "__RENDER_WORKER_READY__"
+PONG_MARKER = "__RENDER_WORKER_PONG__"
+JOB_DONE_MARKER = "__RENDER_JOB_DONE__"
+
+# stdout 被管道接管时默认是块缓冲，改为行缓冲以便实时转发日志
+sys.stdout.reconfigure(line_buffering=True)
+sys.stderr.reconfigure(line_buffering=True)
+
+
+def emit(marker, payload=None):
+    """输出协议标记行"""
+    line = marker if payload is None else f"{marker} {json.dumps(payload)}"
+    sys.stdout.write(line + "\n")
+    sys.stdout.flush()
+
+
+def reset_scene():
+    """任务之间恢复干净的空场景，释放上一个任务加载的数据"""
+    try:
+        bpy.ops.wm.read_homefile(use_empty=True)
+        bpy.data.orphans_purge(do_local_ids=True, do_linked_ids=True, do_recursive=True)
+    except Exception as e:
+        print(f"重置场景失败: {str(e)}")
+
+
+def run_manifest(manifest):
+    """执行一个任务清单，返回退出码"""
+    try:
+        failures = blender_render.run_manifests([manifest])
+        return 1 if failures else 0
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except Exception:
+        traceback.print_exc()
+        sys.stderr.flush()
+        return 1
+
+
+def main():
+    emit(READY_MARKER)
+    for raw in sys.stdin:
+        raw = raw.strip()
+        if not raw:
+            continue
+        try:
+            job = json.loads(raw)
+        except ValueError:
+            print(f"无法解析任务: {raw}")
+            continue
+
+        job_type = job.get("type")
+        if job_type == "ping":
+            emit(PONG_MARKER)
+        elif job_type == "render":
+            exit_code = run_manifest(job["manifest"])
+            sys.stdout.flush()
+            # 失败任务可能留下不完整的场景，恢复空场景；成功任务的场景留给下个任务复用
+            if exit_code != 0:
+                reset_scene()
+            emit(JOB_DONE_MARKER, {"taskId": job.get("taskId"), "exitCode": exit_code})
+        elif job_type == "shutdown":
+            break
+
+
+main()
@@ -0,0 +1,66 @@
+"""
+图片编码 worker，由 EncodeService 以进程池方式启动，需要 Pillow
+
+从标准输入逐行读取 JSON 编码任务，把无损渲染结果编码为配置的各个尺寸和格式，
+每个任务完成后向标准输出写一行 JSON 结果:
+    {"id": 1, "source": "...png", "removeSource": true,
+     "renditions": [{"name": "web", "format": "WEBP", "quality": 80, "maxWidth": 1920, "output": "..."}]}
+    -> {"id": 1, "ok": true, "outputs": [...]}
+"""
+import os
+import sys
+import json
+
+from PIL import Image
+
+
+def get_save_options(rendition):
+    """各格式的编码参数"""
+    image_format = rendition["format"]
+    quality = int(rendition.get("quality") or 90)
+    if image_format == "JPEG":
+        # 高质量时关闭色度抽样，避免细线和文字边缘发虚
+        return {"quality": quality, "optimize": True, "progressive": True, "subsampling": 0 if quality >= 90 else 2}
+    if image_format == "WEBP":
+        return {"quality": quality, "method": 4}
+    return {}
+
+
+def encode(job):
+    """按配置生成各个尺寸，先写临时文件再重命名，上传时不会读到未写完的文件"""
+    with Image.open(job["source"]) as source:
+        image = source.convert("RGB")
+
+    outputs = []
+    for rendition in job["renditions"]:
+        result = image
+        max_width = int(rendition.get("maxWidth") or 0)
+        if max_width and image.width > max_width:
+            height = max(1, round(image.height * max_width / image.width))
+            result = image.resize((max_width, height), Image.LANCZOS, reducing_gap=3.0)
+        tmp_path = f"{rendition['output']}.tmp"
+        result.save(tmp_path, format=rendition["format"], **get_save_options(rendition))
+        os.replace(tmp_path, rendition["output"])
+        outputs.append({"name": rendition["name"], "output": rendition["output"], "width": result.width, "height": result.height})
+
+    if job.get("removeSource"):
+        os.remove(job["source"])
+    return outputs
+
+
+def main():
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        job = json.loads(line)
+        try:
+            reply = {"id": job["id"], "ok": True, "outputs": encode(job)}
+        except Exception as e:
+            reply = {"id": job["id"], "ok": False, "error": f"{type(e).__name__}: {e}"}
+        sys.stdout.write(json.dumps(reply, ensure_ascii=False) + "\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -12,17 +12,74 @@ interface ReplacementItem {
   collection_name: string;
 }
 
+// 质量档位的采样参数，覆盖渲染模板的基准采样
+export interface SamplingProfile {
+  samples: number;
+  adaptiveThreshold: number;
+  adaptiveMinSamples: number;
+}
+
+// 渲染任务清单，JSON 序列化后交给 src/templates/blender_render.py
 export interface RenderParams {
   taskId: string;
   outputDir: string;
   blendFilePath: string;
   replacementItems: ReplacementItem[]; // 新增的替换项数组
   quality: string;
-  blenderRunPath: string;
-  // 透传前端参数，写到py脚本，由python脚本内部完成一个子任务的时候自己去回调api接口，主要是这样花销小一点
+  // 透传前端参数，写到任务清单，由python脚本内部完成一个子任务的时候自己去回调api接口，主要是这样花销小一点
   clientId: string;
   clientJwt: string;
   fileDataId: string;
+  // FBX资源缓存，同一个FBX只解析一次，之后从 .blend 缓存库追加
+  assetCacheDir: string;
+  assetCacheMaxBytes: number;
+  // 完成替换后的场景快照，为空时不使用
+  snapshotCacheDir?: string;
+  snapshotCacheMaxBytes?: number;
+  coalesceCallback: boolean;
+  // 渲染设备和 CPU 渲染线程数，线程数与分配给任务的核心数一致
+  device: 'GPU' | 'CPU';
+  threads: number;
+  // 渲染时间预算（秒），0 表示不限制
+  timeBudget: number;
+  // 配置了该质量档位的采样参数时覆盖基准采样
+  sampling?: SamplingProfile;
+  // 正式渲染前先渲染并回调所有相机的预览图
+  preview: boolean;
+  // 输出无损 PNG，由编码阶段生成各尺寸的图片
+  lossless: boolean;
+  // 按质量档位简化场景（贴图尺寸、细分级别、子粒子、替换模型减面），4k 不简化
+  simplify: boolean;
+  // 增量渲染，启用结果缓存时在同一场景最近的结果上只重新渲染变化的区域
+  incremental: boolean;
+  incrementalBase?: IncrementalBase;
+  // 子任务只渲染指定的相机，输出文件按父任务ID命名，合并回调由父任务发送
+  cameraIndices?: number[];
+  outputTaskId?: string;
+  deferCallback?: boolean;
+  // 降噪交给服务端的降噪进程池，相机结果输出为含噪的多层 EXR
+  deferDenoise?: boolean;
+  // 分块子任务只渲染画面的一个区域，由父任务拼接
+  tile?: RenderTile;
+}
+
+// 单帧分块网格，overlap 为相邻分块向外扩展的重叠比例
+export interface TileGrid {
+  rows: number;
+  cols: number;
+  overlap: number;
+}
+
+export interface RenderTile extends TileGrid {
+  index: number;
+}
+
+// 增量渲染的基础图，来自渲染结果缓存
+export interface IncrementalBase {
+  baseDir: string;
+  changedTargets: string[];
+  // 基础图中各相机的替换目标画面区域 [min_x, min_y, max_x, max_y]
+  footprints: Record<string, number[] | null>[];
 }
 
 export interface CallbackParams {
@@ -30,3 +87,47 @@ export interface CallbackParams {
   clientJwt: string;
   fileDataId: string;
 }
+
+// 模型场景索引，由渲染模板生成并保存为 <blend>.index.json
+export interface SceneIndex {
+  version: number;
+  blendMtimeNs: string;
+  blendMtimeMs: number;
+  blendSize: number;
+  cameras: SceneCamera[];
+  objects: Record<string, SceneObject>;
+  stats: {
+    objects: number;
+    meshes: number;
+    polygons: number;
+    textures: number;
+    texturePixels: number;
+  };
+  textures: { name: string; size: number[] }[];
+}
+
+export interface SceneCamera {
+  name: string;
+  index: number;
+  location: number[];
+  rotation: number[];
+  lens: number;
+  sensorWidth: number;
+  matrixWorld: number[][];
+}
+
+export interface SceneObject {
+  type: string;
+  // 世界坐标包围盒 [[min_x, min_y, min_z], [max_x, max_y, max_z]]，只有网格对象有
+  bbox?: number[][];
+  polygons?: number;
+}
+
+// 按场景索引估算的渲染成本
+export interface RenderCostEstimate {
+  cameras: number;
+  polygons: number;
+  texturePixels: number;
+  // 所有相机的像素数乘以最大采样数（百万），与渲染耗时近似成正比
+  megaSamples: number;
+}
@@ -1,19 +1,114 @@
 // 方案2：使用类型联合
 
-import { RenderParams } from '@/types';
-
-export function renderTemplate(
-  template: string,
-  variables: RenderParams
-): string {
-  return Object.entries(variables).reduce((result, [key, value]) => {
-    let finalValue: string;
-    if (key === 'replacementItems') {
-      // 处理数组对象，转换为 Python 列表格式
-      finalValue = JSON.stringify(value).replace(/"/g, "'"); // 只将所有双引号换成单引号
-    } else {
-      finalValue = String(value);
-    }
-    return result.replace(new RegExp(`\\$\\{${key}\\}`, 'g'), finalValue);
-  }, template);
+import * as fs from 'fs';
+import * as path from 'path';
+import { RenderEvent } from '@/interface/task';
+
+// 渲染模板输出结构化事件时使用的行前缀
+export const RENDER_EVENT_MARKER = '@@RENDER_EVENT@@';
+
+// 静态渲染模块，任务参数通过 stdin 以 JSON 清单传入
+export const RENDER_SCRIPT_PATH = path.join(
+  process.cwd(),
+  'src',
+  'templates',
+  'blender_render.py'
+);
+
+/**
+ * 启动 Blender 子进程时使用的环境变量
+ */
+export function getBlenderEnv(): NodeJS.ProcessEnv {
+  return {
+    ...process.env,
+    CUDA_VISIBLE_DEVICES: '0',
+    CYCLES_DEVICE: 'CUDA',
+    CYCLES_CUDA_USE_OPTIX: '0',
+    BLENDER_USER_SCRIPTS: process.env.BLENDER_USER_SCRIPTS || '',
+    BLENDER_SYSTEM_SCRIPTS: process.env.BLENDER_SYSTEM_SCRIPTS || '',
+  };
+}
+
+/**
+ * 把 0..totalCores-1 划分成 slots 组互不重叠的核心，余下的核心分给前面的组
+ */
+export function partitionCores(totalCores: number, slots: number): number[][] {
+  const count = Math.max(1, Math.min(slots, totalCores));
+  const base = Math.floor(totalCores / count);
+  const extra = totalCores % count;
+  const groups: number[][] = [];
+  let next = 0;
+  for (let i = 0; i < count; i++) {
+    const size = base + (i < extra ? 1 : 0);
+    groups.push(Array.from({ length: size }, (_, j) => next + j));
+    next += size;
+  }
+  return groups;
+}
+
+/**
+ * 通过 taskset 把进程绑定到指定核心，未指定核心时原样返回
+ */
+export function withCpuAffinity(
+  command: string,
+  args: string[],
+  cores?: number[]
+): [string, string[]] {
+  if (!cores || cores.length === 0) {
+    return [command, args];
+  }
+  return ['taskset', ['-c', cores.join(','), command, ...args]];
+}
+
+/**
+ * 解析渲染模板输出的一行结构化事件，非事件行返回 null
+ */
+export function parseRenderEvent(line: string): RenderEvent | null {
+  const index = line.indexOf(RENDER_EVENT_MARKER);
+  if (index === -1) {
+    return null;
+  }
+  try {
+    return JSON.parse(line.slice(index + RENDER_EVENT_MARKER.length));
+  } catch (error) {
+    return null;
+  }
+}
+
+/**
+ * 读取进程当前的常驻内存（MB），进程已退出或不在 Linux 上时返回 null
+ */
+export async function readProcessRssMb(pid?: number): Promise<number | null> {
+  if (!pid) {
+    return null;
+  }
+  try {
+    const status = await fs.promises.readFile(`/proc/${pid}/status`, 'utf-8');
+    const match = status.match(/^VmRSS:\s+(\d+) kB/m);
+    return match ? Math.round(Number(match[1]) / 1024) : null;
+  } catch (error) {
+    return null;
+  }
+}
+
+/**
+ * 读取渲染模板写入的相机完成记录 <taskId>_checkpoint.json，返回已完成的相机索引，没有记录时返回空数组
+ */
+export async function readCompletedCameras(
+  outputDir: string,
+  taskId: string
+): Promise<number[]> {
+  try {
+    const checkpoint = JSON.parse(
+      await fs.promises.readFile(
+        path.join(outputDir, `${taskId}_checkpoint.json`),
+        'utf-8'
+      )
+    );
+    return Object.keys(checkpoint.cameras || {})
+      .map(Number)
+      .sort((a, b) => a - b);
+  } catch (error) {
+    return [];
+  }
 }
@@ -0,0 +1,88 @@
+import { RenderController } from '../../src/controller/render.controller';
+
+describe('test/controller/render.test.ts', () => {
+  let controller: RenderController;
+  let clientCallbackService: {
+    callbackTaskToClient: jest.Mock;
+    callbackTasksToClient: jest.Mock;
+  };
+  const callbackParams = {
+    clientId: 'client',
+    clientJwt: 'jwt',
+    fileDataId: 'file',
+  };
+
+  beforeEach(() => {
+    clientCallbackService = {
+      callbackTaskToClient: jest.fn(),
+      callbackTasksToClient: jest.fn(),
+    };
+    controller = new RenderController();
+    controller.clientCallbackService = clientCallbackService as any;
+    controller.logger = { error: jest.fn() } as any;
+    controller.ctx = { status: 200 } as any;
+  });
+
+  describe('POST /api/render/client-callback', () => {
+    it('should return the delivered result', async () => {
+      clientCallbackService.callbackTaskToClient.mockResolvedValue(true);
+
+      const result = await controller.callbackTaskToClient({
+        taskId: 'task-1',
+        callbackParams,
+        preview: true,
+      });
+
+      expect(result).toEqual({ success: true });
+      expect(controller.ctx.status).toBe(200);
+      expect(clientCallbackService.callbackTaskToClient).toHaveBeenCalledWith(
+        'task-1',
+        callbackParams,
+        true
+      );
+    });
+
+    it('should return 502 when the client rejects the callback', async () => {
+      clientCallbackService.callbackTaskToClient.mockResolvedValue(false);
+
+      const result = await controller.callbackTaskToClient({
+        taskId: 'task-1',
+        callbackParams,
+      });
+
+      expect(controller.ctx.status).toBe(502);
+      expect(result).toEqual({
+        success: false,
+        error: 'client rejected callback',
+      });
+    });
+
+    it('should return 502 when the upload fails', async () => {
+      clientCallbackService.callbackTaskToClient.mockRejectedValue(
+        new Error('upload failed')
+      );
+
+      const result = await controller.callbackTaskToClient({
+        taskId: 'task-1',
+        callbackParams,
+      });
+
+      expect(controller.ctx.status).toBe(502);
+      expect(result).toEqual({ success: false, error: 'upload failed' });
+    });
+  });
+
+  describe('POST /api/render/client-callback-batch', () => {
+    it('should return 502 when the client rejects the callback', async () => {
+      clientCallbackService.callbackTasksToClient.mockResolvedValue(false);
+
+      const result = await controller.callbackTasksToClient({
+        taskIds: ['task-1', 'task-1_cam1'],
+        callbackParams,
+      });
+
+      expect(controller.ctx.status).toBe(502);
+      expect(result.success).toBe(false);
+    });
+  });
+});
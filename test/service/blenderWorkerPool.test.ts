@@ -0,0 +1,145 @@
+import { EventEmitter } from 'events';
+import { PassThrough } from 'stream';
+import { spawn } from 'child_process';
+import {
+  BlenderWorkerPoolService,
+} from '../../src/service/blenderWorkerPoolService';
+import { RenderParams } from '../../src/types';
+
+jest.mock('child_process', () => ({ spawn: jest.fn() }));
+
+// 模拟的 Blender worker 进程，按 src/templates/blender_worker.py 的协议输出标记行
+class FakeChild extends EventEmitter {
+  stdout = new PassThrough();
+  stderr = new EventEmitter();
+  stdin = { write: jest.fn(), end: jest.fn() };
+  pid = Math.floor(Math.random() * 100000);
+  kill = jest.fn(() => true);
+
+  send(line: string) {
+    this.stdout.write(`${line}\n`);
+  }
+}
+
+const flush = () => new Promise(resolve => setImmediate(resolve));
+
+describe('test/service/blenderWorkerPool.test.ts', () => {
+  let children: FakeChild[];
+  let pool: BlenderWorkerPoolService;
+  const manifest = { blendFilePath: '/models/a.blend' } as RenderParams;
+
+  beforeEach(() => {
+    jest.useFakeTimers({ doNotFake: ['setImmediate', 'nextTick'] });
+    children = [];
+    (spawn as jest.Mock).mockImplementation(() => {
+      const child = new FakeChild();
+      children.push(child);
+      return child;
+    });
+    pool = new BlenderWorkerPoolService();
+    pool.logger = {
+      info: jest.fn(),
+      warn: jest.fn(),
+      error: jest.fn(),
+    } as any;
+    pool.renderConfig = {
+      blenderRunPath: 'blender',
+      device: 'GPU',
+      cpuCores: 4,
+      workerPool: {
+        enabled: true,
+        size: 2,
+        maxJobsPerWorker: 50,
+        healthCheckInterval: 30 * 1000,
+        healthCheckTimeout: 10 * 1000,
+        respawnBackoff: 1000,
+        respawnBackoffMax: 60 * 1000,
+        maxStartFailures: 3,
+      },
+    };
+  });
+
+  afterEach(async () => {
+    await pool.destroy();
+    jest.useRealTimers();
+    jest.clearAllMocks();
+  });
+
+  it('should start the pool and run jobs on ready workers', async () => {
+    const job = pool.runJob('task-1', manifest);
+    expect(children).toHaveLength(2);
+    expect(children[0].stdin.write).not.toHaveBeenCalled();
+
+    children[0].send('__RENDER_WORKER_READY__');
+    await flush();
+    const message = JSON.parse(children[0].stdin.write.mock.calls[0][0]);
+    expect(message).toMatchObject({ type: 'render', taskId: 'task-1' });
+
+    const closed = new Promise(resolve => job.on('close', resolve));
+    children[0].send('render output');
+    children[0].send('__RENDER_JOB_DONE__{"exitCode":0}');
+    expect(await closed).toBe(0);
+  });
+
+  it('should back off when workers exit before ready', async () => {
+    pool.runJob('task-1', manifest);
+    children[0].emit('exit', 1);
+    expect(children).toHaveLength(2);
+
+    jest.advanceTimersByTime(999);
+    expect(children).toHaveLength(2);
+    jest.advanceTimersByTime(1);
+    expect(children).toHaveLength(3);
+
+    // 第二次失败后等待时间翻倍
+    children[2].emit('exit', 1);
+    jest.advanceTimersByTime(1999);
+    expect(children).toHaveLength(3);
+    jest.advanceTimersByTime(1);
+    expect(children).toHaveLength(4);
+
+    // 就绪后清零失败次数
+    children[3].send('__RENDER_WORKER_READY__');
+    await flush();
+    children[3].emit('exit', 1);
+    expect(children).toHaveLength(5);
+  });
+
+  it('should disable the pool after repeated start failures', async () => {
+    const job = pool.runJob('task-1', manifest);
+    const errors: Error[] = [];
+    job.on('error', error => errors.push(error));
+
+    for (let attempt = 0; attempt < 3; attempt++) {
+      for (const child of children.slice(-2)) {
+        child.emit('exit', 1);
+      }
+      jest.runOnlyPendingTimers();
+    }
+
+    expect(pool.enabled).toBe(false);
+    expect(errors).toHaveLength(1);
+    // 放弃后不再启动新的 worker
+    const spawned = children.length;
+    jest.advanceTimersByTime(10 * 60 * 1000);
+    expect(children).toHaveLength(spawned);
+  });
+
+  it('should give up a slot when the process cannot be spawned', () => {
+    const job = pool.runJob('task-1', manifest);
+    const errors: Error[] = [];
+    job.on('error', error => errors.push(error));
+
+    const spawnError = Object.assign(new Error('spawn blender ENOENT'), {
+      code: 'ENOENT',
+    });
+    children[0].emit('error', spawnError);
+    expect(pool.enabled).toBe(true);
+    children[1].emit('error', spawnError);
+
+    expect(pool.enabled).toBe(false);
+    expect(errors).toHaveLength(1);
+    jest.advanceTimersByTime(10 * 60 * 1000);
+    expect(children).toHaveLength(2);
+  });
+});
@@ -0,0 +1,34 @@
+import { CpuAllocatorService } from '../../src/service/cpuAllocatorService';
+
+describe('test/service/cpuAllocator.test.ts', () => {
+  let allocator: CpuAllocatorService;
+
+  beforeEach(() => {
+    allocator = new CpuAllocatorService();
+    allocator.renderConfig = { device: 'CPU', cpuCores: 8 };
+    allocator.taskConfig = { maxConcurrentTasks: 2 };
+  });
+
+  it('should not assign cores in GPU mode', () => {
+    allocator.renderConfig.device = 'GPU';
+    expect(allocator.acquire('task-1')).toBeUndefined();
+  });
+
+  it('should assign disjoint cores to running tasks', () => {
+    const first = allocator.acquire('task-1');
+    const second = allocator.acquire('task-2');
+
+    expect(first).toEqual({ slot: 0, cores: [0, 1, 2, 3], threads: 4 });
+    expect(second).toEqual({ slot: 1, cores: [4, 5, 6, 7], threads: 4 });
+    expect(allocator.acquire('task-1')).toBe(first);
+  });
+
+  it('should reuse released cores', () => {
+    allocator.acquire('task-1');
+    allocator.acquire('task-2');
+    allocator.release('task-1');
+
+    expect(allocator.get('task-1')).toBeUndefined();
+    expect(allocator.acquire('task-3').slot).toBe(0);
+  });
+});
@@ -0,0 +1,93 @@
+import { LogBufferService } from '../../src/service/logBufferService';
+import { LOG_STAGE } from '../../src/constant';
+
+describe('test/service/logBuffer.test.ts', () => {
+  let service: LogBufferService;
+  let pipeline: { xadd: jest.Mock; exec: jest.Mock };
+
+  // 按写入顺序返回每条记录的 message 字段
+  const messages = () => pipeline.xadd.mock.calls.map(args => args[8]);
+
+  beforeEach(() => {
+    pipeline = {
+      xadd: jest.fn().mockReturnThis(),
+      exec: jest.fn().mockResolvedValue([]),
+    };
+    service = new LogBufferService();
+    service.redisService = { pipeline: () => pipeline } as any;
+    service.logger = { error: jest.fn() } as any;
+    service.loggerConfig = {
+      buffer: {
+        flushInterval: 250,
+        batchLines: 200,
+        maxPendingLines: 5,
+        maxLen: 1000,
+      },
+    };
+  });
+
+  it('should write one stream entry per line', async () => {
+    service.append('task-1', LOG_STAGE.start, 'line 1\nline 2');
+    service.append('task-1', LOG_STAGE.processing, 'line 3');
+    service.append('task-2', LOG_STAGE.processing, 'line 4');
+    expect(pipeline.xadd).not.toHaveBeenCalled();
+
+    await service.flush();
+
+    expect(pipeline.exec).toHaveBeenCalledTimes(1);
+    expect(pipeline.xadd).toHaveBeenCalledTimes(4);
+    expect(pipeline.xadd.mock.calls[0]).toEqual([
+      'task:logs:task-1',
+      'MAXLEN',
+      '~',
+      1000,
+      '*',
+      'stage',
+      LOG_STAGE.start,
+      'message',
+      'line 1',
+      'timestamp',
+      expect.any(Number),
+    ]);
+    expect(messages()).toEqual(['line 1', 'line 2', 'line 3', 'line 4']);
+    expect(pipeline.xadd.mock.calls[3][0]).toBe('task:logs:task-2');
+  });
+
+  it('should keep only the latest progress line', async () => {
+    service.append('task-1', LOG_STAGE.processing, 'Sample 1/128');
+    service.append('task-1', LOG_STAGE.processing, 'Sample 2/128');
+    service.append('task-1', LOG_STAGE.processing, 'Sample 3/128');
+
+    await service.flush();
+
+    expect(messages()).toEqual([
+      'Sample 3/128',
+      '[日志] 合并 2 行渲染进度, 丢弃 0 行',
+    ]);
+  });
+
+  it('should flush critical lines immediately', async () => {
+    service.append('task-1', LOG_STAGE.processing, 'line 1');
+    await service.append('task-1', LOG_STAGE.processing, 'Error: boom');
+
+    expect(pipeline.exec).toHaveBeenCalledTimes(1);
+    expect(messages()).toEqual(['line 1', 'Error: boom']);
+  });
+
+  it('should drop lines past maxPendingLines', async () => {
+    for (let i = 0; i < 7; i++) {
+      service.append('task-1', LOG_STAGE.processing, `line ${i}`);
+    }
+    await service.append('task-1', LOG_STAGE.processing, '渲染失败', true);
+
+    expect(messages()).toEqual([
+      'line 0',
+      'line 1',
+      'line 2',
+      'line 3',
+      'line 4',
+      '渲染失败',
+      '[日志] 合并 0 行渲染进度, 丢弃 2 行',
+    ]);
+  });
+});
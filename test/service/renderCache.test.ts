@@ -0,0 +1,157 @@
+import * as fs from 'fs';
+import * as os from 'os';
+import * as path from 'path';
+import { RenderCacheService } from '../../src/service/renderCacheService';
+import { RenderParams } from '../../src/types';
+
+describe('test/service/renderCache.test.ts', () => {
+  let root: string;
+  let cache: RenderCacheService;
+  let manifest: RenderParams;
+
+  const writeFile = (file: string, content: string) => {
+    fs.mkdirSync(path.dirname(file), { recursive: true });
+    fs.writeFileSync(file, content);
+  };
+
+  beforeEach(() => {
+    root = fs.mkdtempSync(path.join(os.tmpdir(), 'render-cache-'));
+    writeFile(path.join(root, 'models/a.blend'), 'blend');
+    writeFile(path.join(root, 'assets/chair.fbx'), 'chair');
+    writeFile(path.join(root, 'assets/table.fbx'), 'table');
+    cache = new RenderCacheService();
+    cache.logger = { info: jest.fn(), error: jest.fn() } as any;
+    cache.renderConfig = {
+      resultCache: {
+        enabled: true,
+        dir: path.join(root, 'cache'),
+        maxBytes: 1024 * 1024,
+      },
+    };
+    manifest = {
+      blendFilePath: path.join(root, 'models/a.blend'),
+      quality: '1k',
+      device: 'GPU',
+      timeBudget: 0,
+      simplify: true,
+      replacementItems: [
+        {
+          target: 'Chair',
+          fbx: path.join(root, 'assets/chair.fbx'),
+          collection_name: 'Chair',
+        },
+      ],
+    } as RenderParams;
+  });
+
+  afterEach(() => {
+    fs.rmSync(root, { recursive: true, force: true });
+  });
+
+  describe('computeKey', () => {
+    it('should ignore fields that do not affect the image', async () => {
+      const { key } = await cache.computeKey(manifest);
+      const other = await cache.computeKey({
+        ...manifest,
+        taskId: 'other',
+        outputDir: '/tmp/other',
+        clientJwt: 'jwt',
+      });
+      expect(other.key).toBe(key);
+    });
+
+    it('should not depend on the order of replacements', async () => {
+      const table = {
+        target: 'Table',
+        fbx: path.join(root, 'assets/table.fbx'),
+        collection_name: 'Table',
+      };
+      const first = await cache.computeKey({
+        ...manifest,
+        replacementItems: [...manifest.replacementItems, table],
+      });
+      const second = await cache.computeKey({
+        ...manifest,
+        replacementItems: [table, ...manifest.replacementItems],
+      });
+      expect(second.key).toBe(first.key);
+    });
+
+    it('should keep the scene key when only replacements change', async () => {
+      const first = await cache.computeKey(manifest);
+      const second = await cache.computeKey({
+        ...manifest,
+        replacementItems: [
+          {
+            ...manifest.replacementItems[0],
+            fbx: path.join(root, 'assets/table.fbx'),
+          },
+        ],
+      });
+      expect(second.sceneKey).toBe(first.sceneKey);
+      expect(second.key).not.toBe(first.key);
+    });
+
+    it('should change when the render settings change', async () => {
+      const first = await cache.computeKey(manifest);
+      const second = await cache.computeKey({ ...manifest, quality: '4k' });
+      expect(second.sceneKey).not.toBe(first.sceneKey);
+    });
+  });
+
+  describe('store and restore', () => {
+    it('should restore every camera of a stored result', async () => {
+      const cacheKey = await cache.computeKey(manifest);
+      const outputDir = path.join(root, 'output');
+      writeFile(path.join(outputDir, 'task-1.jpg'), 'cam0');
+      writeFile(path.join(outputDir, 'task-1_cam1.jpg'), 'cam1');
+      writeFile(path.join(outputDir, 'task-2.jpg'), 'other task');
+
+      await cache.store(cacheKey, 'task-1', outputDir);
+      const restoreDir = path.join(root, 'restore');
+      const taskIds = await cache.restore(cacheKey.key, 'task-3', restoreDir);
+
+      expect(taskIds).toEqual(['task-3', 'task-3_cam1']);
+      expect(fs.readdirSync(restoreDir).sort()).toEqual([
+        'task-3.jpg',
+        'task-3_cam1.jpg',
+      ]);
+      expect(
+        fs.readFileSync(path.join(restoreDir, 'task-3_cam1.jpg'), 'utf-8')
+      ).toBe('cam1');
+    });
+
+    it('should return null on a miss', async () => {
+      const { key } = await cache.computeKey(manifest);
+      const restoreDir = path.join(root, 'restore');
+      expect(await cache.restore(key, 'task-1', restoreDir)).toBeNull();
+    });
+
+    it('should not store a task without results', async () => {
+      const cacheKey = await cache.computeKey(manifest);
+      fs.mkdirSync(path.join(root, 'output'));
+
+      await cache.store(cacheKey, 'task-1', path.join(root, 'output'));
+
+      const entryDir = path.join(root, 'cache', cacheKey.key);
+      expect(fs.existsSync(entryDir)).toBe(false);
+    });
+
+    it('should evict the least recently used entries', async () => {
+      cache.renderConfig.resultCache.maxBytes = 6;
+      const outputDir = path.join(root, 'output');
+      writeFile(path.join(outputDir, 'task-1.jpg'), 'first');
+      writeFile(path.join(outputDir, 'task-2.jpg'), 'second');
+      const first = await cache.computeKey(manifest);
+      const second = await cache.computeKey({ ...manifest, quality: '4k' });
+
+      await cache.store(first, 'task-1', outputDir);
+      const past = new Date(Date.now() - 60 * 1000);
+      fs.utimesSync(path.join(root, 'cache', first.key), past, past);
+      await cache.store(second, 'task-2', outputDir);
+
+      expect(fs.existsSync(path.join(root, 'cache', first.key))).toBe(false);
+      expect(fs.existsSync(path.join(root, 'cache', second.key))).toBe(true);
+    });
+  });
+});
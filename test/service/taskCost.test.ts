@@ -0,0 +1,138 @@
+import { TaskCostService } from '../../src/service/taskCostService';
+import { SceneIndexService } from '../../src/service/sceneIndexService';
+import { PrismaService } from '../../src/providers/prisma';
+import { TaskMessage } from '../../src/interface/task';
+import { TaskStatus } from '../../src/constant/taskStatus';
+
+jest.mock('../../src/providers/prisma', () => ({
+  PrismaService: { task: { findMany: jest.fn() } },
+}));
+
+const createTask = (modelName: string, data: any = {}): TaskMessage => ({
+  id: `${modelName}-task`,
+  type: 'render',
+  status: TaskStatus.PENDING,
+  createdAt: Date.now(),
+  data: {
+    payload: JSON.stringify({ modelName, renderParams: { quality: '1k' } }),
+    ...data,
+  },
+});
+
+// 子任务只渲染一个相机，参与校准
+const createHistory = (modelName: string, durationMs: number) => ({
+  data: { ...createTask(modelName).data, parentTaskId: 'parent' },
+  startedAt: new Date(0),
+  completedAt: new Date(durationMs),
+});
+
+describe('test/service/taskCost.test.ts', () => {
+  let service: TaskCostService;
+  let redis: { hset: jest.Mock; hgetall: jest.Mock };
+
+  beforeEach(() => {
+    redis = {
+      hset: jest.fn().mockResolvedValue(1),
+      hgetall: jest.fn().mockResolvedValue({}),
+    };
+    const sceneIndex = new SceneIndexService();
+    sceneIndex.renderConfig = {} as any;
+    service = new TaskCostService();
+    service.logger = { info: jest.fn(), error: jest.fn() } as any;
+    service.redisService = redis as any;
+    service.sceneIndex = sceneIndex;
+    service.taskConfig = {
+      cost: {
+        baseMs: 15000,
+        replacementMs: 5000,
+        defaultMsPerMegaSample: 500,
+        historySize: 500,
+        minHistorySamples: 3,
+        historyRefreshInterval: 10 * 60 * 1000,
+        baseMemoryMb: 1024,
+        replacementMemoryMb: 200,
+        bytesPerPolygon: 300,
+        bytesPerTexturePixel: 4,
+        bytesPerFramePixel: 160,
+        memoryMargin: 1.2,
+      },
+    };
+  });
+
+  it('should estimate with the default rate without history', () => {
+    // 1920 x 1080 x 32 采样 = 66.3552 百万采样
+    expect(service.estimate(createTask('a'))).toEqual({
+      expectedMs: 48178,
+      weight: 1,
+      memoryMb: 1340,
+    });
+  });
+
+  it('should add the cost of replacements and scene size', () => {
+    const task = createTask('a', { costEstimate: { polygons: 1024 * 1024 } });
+    task.data.payload = JSON.stringify({
+      modelName: 'a',
+      renderParams: { quality: '1k' },
+      materialList: [{}, {}],
+    });
+
+    const cost = service.estimate(task);
+    expect(cost.expectedMs).toBe(48178 + 2 * 5000);
+    expect(cost.memoryMb).toBe(1340 + 2 * 200 + 300);
+  });
+
+  it('should calibrate the rate from completed tasks', async () => {
+    (PrismaService.task.findMany as jest.Mock).mockResolvedValue([
+      createHistory('a', 75000),
+      createHistory('a', 95000),
+      createHistory('a', 135000),
+      createHistory('b', 35000),
+      // 多相机父任务的耗时包含子任务排队，不参与校准
+      {
+        ...createHistory('b', 10 * 60 * 1000),
+        data: { ...createTask('b').data, costEstimate: { cameras: 4 } },
+      },
+    ]);
+
+    await service.refreshHistory();
+
+    // a 取中位数 80000 毫秒，b 的历史不足时使用全部任务的中位数
+    expect(service.estimate(createTask('a')).expectedMs).toBe(95000);
+    expect(service.estimate(createTask('b')).expectedMs).toBe(85000);
+    expect(service.estimate(createTask('c')).expectedMs).toBe(85000);
+  });
+
+  it('should keep the default rate when the database fails', async () => {
+    (PrismaService.task.findMany as jest.Mock).mockRejectedValue(
+      new Error('connection refused')
+    );
+
+    await service.refreshHistory();
+
+    expect(service.estimate(createTask('a')).expectedMs).toBe(48178);
+    expect(service.logger.error).toHaveBeenCalled();
+  });
+
+  it('should estimate memory from the recorded peak', async () => {
+    await service.recordPeakMemory(createTask('a'), 2000);
+    expect(redis.hset).toHaveBeenCalledWith(
+      'render_task:model_memory',
+      'a:1k:1',
+      '2000'
+    );
+    expect(service.estimate(createTask('a')).memoryMb).toBe(2400);
+
+    // 较低的峰值只逐渐降低记录
+    await service.recordPeakMemory(createTask('a'), 1000);
+    expect(service.estimate(createTask('a')).memoryMb).toBe(2040);
+  });
+
+  it('should load peaks recorded by other nodes', async () => {
+    (PrismaService.task.findMany as jest.Mock).mockResolvedValue([]);
+    redis.hgetall.mockResolvedValue({ 'b:1k:1': '3000' });
+
+    await service.refreshHistory();
+
+    expect(service.estimate(createTask('b')).memoryMb).toBe(3600);
+  });
+});
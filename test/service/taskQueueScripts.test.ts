@@ -0,0 +1,104 @@
+import { Redis } from 'ioredis';
+import {
+  CLAIM_TASKS_SCRIPT,
+  RECOVER_TASKS_SCRIPT,
+} from '../../src/service/taskQueueScripts';
+
+// 两个节点共用同一个 Redis，按调度器的用法直接执行领取和回收脚本
+// 需要 Redis，没有设置 REDIS_HOST 时整组测试标记为跳过
+const describeWithRedis = process.env.REDIS_HOST ? describe : describe.skip;
+
+describeWithRedis('test/service/taskQueueScripts.test.ts', () => {
+  const prefix = `test:render_task:${process.pid}:${Date.now()}`;
+  const keys = [`${prefix}:queue`, `${prefix}:processing`, `${prefix}:leases`];
+  const ttl = 60 * 1000;
+  let redis: Redis;
+
+  const claim = (expiresAt: number, taskIds: string[]) =>
+    redis.eval(
+      CLAIM_TASKS_SCRIPT,
+      3,
+      ...keys,
+      expiresAt,
+      ...taskIds
+    ) as Promise<string[]>;
+  const recover = (now: number) =>
+    redis.eval(RECOVER_TASKS_SCRIPT, 3, ...keys, now) as Promise<string[]>;
+
+  beforeAll(async () => {
+    redis = new Redis({
+      host: process.env.REDIS_HOST,
+      port: Number(process.env.REDIS_PORT) || 6379,
+      lazyConnect: true,
+      maxRetriesPerRequest: 0,
+    });
+    await redis.connect();
+  });
+
+  beforeEach(async () => {
+    await redis.del(...keys);
+    await redis.zadd(keys[0], 10, 'task1', 10, 'task2', 10, 'task3');
+  });
+
+  afterAll(async () => {
+    await redis.del(...keys);
+    redis.disconnect();
+  });
+
+  it('should claim each task on only one node', async () => {
+    const now = Date.now();
+    // 两个节点同时选中 task2
+    const [claimedByA, claimedByB] = await Promise.all([
+      claim(now + ttl, ['task1', 'task2']),
+      claim(now + ttl, ['task2', 'task3']),
+    ]);
+
+    const all = claimedByA.concat(claimedByB).sort();
+    expect(all).toEqual(['task1', 'task2', 'task3']);
+    expect(claimedByA).toContain('task1');
+    expect(claimedByB).toContain('task3');
+    expect(await redis.zcard(keys[0])).toBe(0);
+    expect((await redis.smembers(keys[1])).sort()).toEqual(all);
+    expect(await redis.zcard(keys[2])).toBe(3);
+  });
+
+  it('should recover tasks of a node that stopped renewing', async () => {
+    const now = Date.now();
+    // 节点 A 领取 task1、task2 后停止续约，节点 B 领取 task3 并持续续约
+    expect(await claim(now + ttl, ['task1', 'task2'])).toEqual([
+      'task1',
+      'task2',
+    ]);
+    expect(await claim(now + ttl, ['task3'])).toEqual(['task3']);
+
+    // 租约都没有过期时不回收
+    expect(await recover(now)).toEqual([]);
+
+    const later = now + ttl + 1000;
+    await redis.zadd(keys[2], 'XX', later + ttl, 'task3');
+    expect((await recover(later)).sort()).toEqual(['task1', 'task2']);
+
+    // 放回队列最前面，节点 B 可以重新领取，task3 仍由节点 B 持有
+    expect(await redis.zrange(keys[0], 0, -1, 'WITHSCORES')).toEqual([
+      'task1',
+      '0',
+      'task2',
+      '0',
+    ]);
+    expect(await redis.smembers(keys[1])).toEqual(['task3']);
+    expect(await redis.zrange(keys[2], 0, -1)).toEqual(['task3']);
+    expect((await claim(later + ttl, ['task1', 'task2'])).sort()).toEqual([
+      'task1',
+      'task2',
+    ]);
+  });
+
+  it('should recover processing tasks without a lease', async () => {
+    await redis.zrem(keys[0], 'task1');
+    await redis.sadd(keys[1], 'task1');
+
+    expect(await recover(Date.now())).toEqual(['task1']);
+    expect(await redis.zscore(keys[0], 'task1')).toBe('0');
+    expect(await redis.scard(keys[1])).toBe(0);
+  });
+});
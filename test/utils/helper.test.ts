@@ -0,0 +1,67 @@
+import {
+  RENDER_EVENT_MARKER,
+  parseRenderEvent,
+  partitionCores,
+  withCpuAffinity,
+} from '../../src/utils/helper';
+
+describe('test/utils/helper.test.ts', () => {
+  describe('parseRenderEvent', () => {
+    it('should parse the event after the marker', () => {
+      const event = { phase: 'camera', durationMs: 1200, rssMb: 512 };
+      const line = `${RENDER_EVENT_MARKER}${JSON.stringify(event)}`;
+      expect(parseRenderEvent(line)).toEqual({
+        phase: 'camera',
+        durationMs: 1200,
+        rssMb: 512,
+      });
+    });
+
+    it('should ignore output before the marker', () => {
+      const line = `Blender 4.2: ${RENDER_EVENT_MARKER}{"phase":"done"}`;
+      expect(parseRenderEvent(line)).toEqual({ phase: 'done' });
+    });
+
+    it('should return null for ordinary lines', () => {
+      expect(parseRenderEvent('Fra:1 Mem:12.00M | Sample 1/128')).toBeNull();
+    });
+
+    it('should return null for malformed events', () => {
+      expect(parseRenderEvent(`${RENDER_EVENT_MARKER}{"phase":`)).toBeNull();
+    });
+  });
+
+  describe('partitionCores', () => {
+    it('should split cores into disjoint groups', () => {
+      expect(partitionCores(8, 2)).toEqual([
+        [0, 1, 2, 3],
+        [4, 5, 6, 7],
+      ]);
+    });
+
+    it('should give the remaining cores to the first groups', () => {
+      expect(partitionCores(7, 3)).toEqual([
+        [0, 1, 2],
+        [3, 4],
+        [5, 6],
+      ]);
+    });
+
+    it('should not create more groups than cores', () => {
+      expect(partitionCores(2, 4)).toEqual([[0], [1]]);
+    });
+  });
+
+  describe('withCpuAffinity', () => {
+    it('should wrap the command with taskset', () => {
+      expect(withCpuAffinity('blender', ['-b'], [2, 3])).toEqual([
+        'taskset',
+        ['-c', '2,3', 'blender', '-b'],
+      ]);
+    });
+
+    it('should keep the command without cores', () => {
+      expect(withCpuAffinity('blender', ['-b'])).toEqual(['blender', ['-b']]);
+    });
+  });
+});